@@ -0,0 +1,142 @@
+"""
+Alta de usuarios: registro individual y aprovisionamiento masivo.
+
+Los duplicados los detectan las restricciones únicas (username y
+``LOWER(email)``, migración 0015) al insertar, no consultas previas: no hay
+carrera entre comprobar e insertar. El hash de la contraseña (PBKDF2, cientos de
+ms a propósito) se calcula antes de abrir la transacción; en bloque se reparte
+entre hilos, porque ``hashlib.pbkdf2_hmac`` suelta el GIL.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from controller import leaderboards
+from habits.models import GroupMembership, UserProfile
+
+User = get_user_model()
+EMAIL_INDEX = "user_email_lower_uniq"
+
+
+class RegistrationConflict(Exception):
+    """El username o el email ya están en uso (``field`` indica cuál)."""
+
+    def __init__(self, field: str):
+        super().__init__(field)
+        self.field = field
+
+
+@dataclass
+class ProvisionResult:
+    created: List[int] = field(default_factory=list)
+    # (fila, motivo) de las filas que no se crearon
+    skipped: List[tuple] = field(default_factory=list)
+
+
+def _conflict_field(exc: IntegrityError) -> str:
+    """Campo en conflicto según la restricción violada, nunca por el texto del valor.
+
+    Postgres la da en ``diag.constraint_name``; SQLite solo en el mensaje
+    (``UNIQUE constraint failed: index 'user_email_lower_uniq'``).
+    """
+    diag = getattr(exc.__cause__, "diag", None)
+    constraint = getattr(diag, "constraint_name", None)
+    if constraint is not None:
+        return "email" if constraint == EMAIL_INDEX else "username"
+    return "email" if f"'{EMAIL_INDEX}'" in str(exc) else "username"
+
+
+def register_user(username: str, email: str, password: str):
+    """Crea usuario y perfil en una transacción; el perfil lo escribe la señal (un INSERT)."""
+    user = User(
+        username=User.normalize_username(username),
+        email=BaseUserManager.normalize_email(email),
+        password=make_password(password),
+    )
+    try:
+        with transaction.atomic():
+            user.save()
+    except IntegrityError as exc:
+        raise RegistrationConflict(_conflict_field(exc)) from exc
+    return user
+
+
+def hash_passwords(passwords: Iterable[Optional[str]], workers: int = 4) -> List[str]:
+    """Hashes en paralelo; sin contraseña, hash inutilizable (el usuario la fija al recuperar acceso)."""
+    passwords = list(passwords)
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords))
+
+
+def provision_users(
+    rows: List[Dict], group=None, batch_size: int = 1000, hash_workers: int = 4
+) -> ProvisionResult:
+    """Alta en bloque: ``rows`` con username, email y password opcional.
+
+    Usuarios, perfiles y membresías van con ``bulk_create`` por lotes, cada lote
+    en su transacción (sin señales: el perfil se crea aquí, una vez). Las filas
+    repetidas o ya existentes se devuelven en ``skipped``.
+    """
+    result = ProvisionResult()
+    seen_usernames, seen_emails, pending = set(), set(), []
+    for row in rows:
+        # JSON admite números, listas...: solo se aceptan textos (o ausentes)
+        if not all(isinstance(row.get(field) or "", str) for field in ("username", "email", "password")):
+            result.skipped.append((row, "username, email y password deben ser texto"))
+            continue
+        username = User.normalize_username((row.get("username") or "").strip())
+        email = BaseUserManager.normalize_email((row.get("email") or "").strip())
+        if not username:
+            result.skipped.append((row, "username vacío"))
+        elif username in seen_usernames or (email and email.lower() in seen_emails):
+            result.skipped.append((row, "repetido en la entrada"))
+        else:
+            seen_usernames.add(username)
+            if email:
+                seen_emails.add(email.lower())
+            pending.append((row, username, email))
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        # Solo para informar; la restricción única sigue siendo la que decide
+        taken_usernames = set(
+            User.objects.filter(username__in=[username for _, username, _ in batch]).values_list("username", flat=True)
+        )
+        taken_emails = set(
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(email_lower__in=[email.lower() for _, _, email in batch if email])
+            .values_list("email_lower", flat=True)
+        )
+        fresh = []
+        for row, username, email in batch:
+            if username in taken_usernames or (email and email.lower() in taken_emails):
+                result.skipped.append((row, "ya existe"))
+            else:
+                fresh.append((row, username, email))
+        hashes = hash_passwords([row.get("password") or None for row, _, _ in fresh], hash_workers)
+        users = [
+            User(username=username, email=email, password=password)
+            for (_, username, email), password in zip(fresh, hashes)
+        ]
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+                if group is not None:
+                    GroupMembership.objects.bulk_create([GroupMembership(group=group, user=user) for user in users])
+        except IntegrityError as exc:
+            # Alta concurrente entre la consulta y el INSERT: se descarta el lote entero
+            result.skipped.extend((row, f"conflicto: {_conflict_field(exc)}") for row, _, _ in fresh)
+            continue
+        result.created.extend(user.pk for user in users)
+    if group is not None and result.created:
+        leaderboards.invalidate_group(group.pk)
+    return result
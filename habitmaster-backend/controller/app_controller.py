@@ -1,13 +1,65 @@
+import base64
+import json
 from dataclasses import asdict, dataclass
-from datetime import date
-from typing import Dict, List, Tuple
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from django.db import transaction
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
 from django.utils import timezone
 
-from habits.models import Achievement, Habit, HabitLog, UserProfile
+from habitmaster_backend.db_router import use_replica
+from habits import fulltext
+from habits.models import Achievement, Habit, HabitLog, PointsLedger, Tombstone, UserProfile
+from logic_rules import achievements as achievement_engine
 from logic_rules import rules
-from processor import functional
+from processor import functional, streaks
+from . import jobs, leaderboards, statistics
+from . import points as points_ledger
+
+
+# Margen para no perder filas de transacciones que confirmaron tras leer el cursor
+SYNC_OVERLAP = timedelta(seconds=2)
+
+
+def local_date(tz_name: str, now: datetime | None = None) -> date:
+    """Fecha de ``now`` en la zona del perfil; UTC si la zona no es válida."""
+    now = now or timezone.now()
+    try:
+        return now.astimezone(ZoneInfo(tz_name)).date()
+    except (ZoneInfoNotFoundError, ValueError):
+        return now.astimezone(ZoneInfo("UTC")).date()
+
+
+def encode_sync_cursor(moment: datetime) -> str:
+    payload = json.dumps({"t": moment.isoformat()}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_sync_cursor(cursor: str) -> datetime:
+    """Lanza ValueError si el cursor no es válido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        moment = datetime.fromisoformat(json.loads(base64.urlsafe_b64decode(padded))["t"])
+    except (TypeError, KeyError, ValueError) as exc:
+        raise ValueError("Cursor inválido") from exc
+    if timezone.is_naive(moment):
+        raise ValueError("Cursor inválido")
+    return moment
+
+
+def annotate_habit_status(queryset, today: date):
+    """Añade ``completed_today`` (Exists) y ``active_streak`` (racha mantenida, 0 si ya se rompió)."""
+    completed_today = HabitLog.objects.filter(habit=OuterRef("pk"), date=today, completed=True)
+    return queryset.annotate(
+        completed_today=Exists(completed_today),
+        active_streak=Case(
+            When(streak_expires__gte=today, then=F("current_streak")),
+            default=Value(0),
+        ),
+    )
 
 
 @dataclass
@@ -17,7 +69,21 @@ class HabitCompletionResult:
     points_awarded: int
     achievements: List[str]
     level: int
-    streak: int
+    # None si el trabajo derivado quedó en cola (``deferred``)
+    streak: Optional[int]
+    deferred: bool = False
+
+
+COMPLETION_JOB = "habit.completion"
+# Campos del perfil que escribe el trabajo derivado; total_points solo lo toca el libro
+DERIVED_PROFILE_FIELDS = [
+    "current_streak",
+    "longest_streak",
+    "last_completed",
+    "completion_counts",
+    "achievement_mask",
+    "level",
+]
 
 
 class HabitController:
@@ -29,12 +95,20 @@ class HabitController:
 
     @transaction.atomic
     def complete_habit(self, user, habit_id: int, completed_date: date | None = None) -> Dict:
+        """Registra el completado y sus puntos.
+
+        El trabajo derivado (rachas, rankings, logros, nivel) se hace en la misma
+        transacción o, con ``COMPLETION_DERIVED_WORK = "queue"``, en un trabajo que
+        procesa ``run_jobs`` tras confirmar: la respuesta solo espera al log y al libro.
+        """
         habit = Habit.objects.select_for_update().get(pk=habit_id, user=user)
-        profile = self._get_profile(user)
-        completed_date = completed_date or timezone.localdate()
+        if completed_date is None:
+            # "Hoy" del usuario, no el del servidor (igual que iter_streak_at_risk)
+            tz_name = UserProfile.objects.filter(user_id=user.pk).values_list("timezone", flat=True).first()
+            completed_date = local_date(tz_name or "UTC")
 
         points = functional.calculate_points(habit, completed_date)
-        log, _ = HabitLog.objects.update_or_create(
+        log, created = HabitLog.objects.update_or_create(
             habit=habit,
             date=completed_date,
             defaults={
@@ -42,43 +116,166 @@ class HabitController:
                 "points_awarded": points,
             },
         )
+        # El libro suma los puntos al perfil con un UPDATE
+        entry = points_ledger.record(user.id, completed_date, points, PointsLedger.Reason.COMPLETION, habit.id)
+
+        if settings.COMPLETION_DERIVED_WORK == "queue":
+            jobs.enqueue(COMPLETION_JOB, {
+                "user_id": user.id,
+                "habit_id": habit.id,
+                "date": completed_date.isoformat(),
+                "points": points,
+                "created": created,
+            })
+            result = HabitCompletionResult(
+                habit_id=habit.id,
+                completed_on=completed_date,
+                points_awarded=points,
+                achievements=[],
+                level=rules.determine_level(entry.balance),
+                streak=None,
+                deferred=True,
+            )
+        else:
+            result = self._apply_completion(user, habit, completed_date, points, created)
+        return asdict(result)
+
+    def _apply_completion(self, user, habit: Habit, completed_date: date, points: int, created: bool):
+        """Trabajo derivado de un completado (con el hábito y el perfil bloqueados).
 
-        profile.total_points += points
-        streak = functional.calculate_streak(self._get_user_log_dicts(user))
-        profile.current_streak = streak
-        profile.longest_streak = max(profile.longest_streak, streak)
+        El perfil se lee con FOR UPDATE: dos workers con completados del mismo
+        usuario en hábitos distintos se turnan en vez de pisarse contadores y bits
+        de logros. En línea el UPDATE de ``record`` ya tiene ese bloqueo.
+        """
+        profile = UserProfile.objects.select_for_update().get(user_id=user.pk)
+        if created:
+            self._count_completion(profile, habit)
+        self._advance_habit_streak(habit, completed_date)
+        leaderboards.add_points(user.id, completed_date, points)
+        # Tras confirmar, para que nadie vuelva a cachear el ranking anterior
+        transaction.on_commit(lambda: leaderboards.invalidate_groups_of(user.id))
+        self._refresh_backdated_rollup(habit, completed_date)
+
+        streak = self.get_streaks(user)
+        profile.current_streak = streak["current"]
+        profile.longest_streak = max(profile.longest_streak, streak["longest"])
         profile.last_completed = completed_date
 
-        achievements = rules.check_achievements(profile.current_streak)
-        special = rules.check_special_streak(profile.current_streak)
-        self._persist_achievements(user, achievements + special)
+        plan = achievement_engine.get_plan()
+        satisfied, unlocked = achievement_engine.evaluate(profile, habit, plan)
+        self._persist_achievements(user, profile, unlocked, plan)
         level = rules.determine_level(profile.total_points)
 
         profile.level = level
-        profile.save()
+        profile.save(update_fields=DERIVED_PROFILE_FIELDS)
 
-        result = HabitCompletionResult(
+        return HabitCompletionResult(
             habit_id=habit.id,
             completed_on=completed_date,
             points_awarded=points,
-            achievements=achievements + special,
+            achievements=plan.codes(satisfied),
             level=level,
-            streak=streak,
+            streak=streak["current"],
         )
-        return asdict(result)
 
-    def _persist_achievements(self, user, codes: List[str]) -> None:
-        existing = set(user.achievements.values_list("code", flat=True))
-        new_codes = [code for code in codes if code not in existing]
+    def process_completion_job(self, payload: Dict) -> None:
+        """Handler de COMPLETION_JOB: el mismo trabajo derivado, fuera de la petición."""
+        habit = Habit.objects.select_for_update().select_related("user").filter(pk=payload["habit_id"]).first()
+        if habit is None:
+            # Hábito borrado antes de procesar el trabajo: no queda nada que derivar
+            return
+        self._apply_completion(
+            habit.user, habit, date.fromisoformat(payload["date"]), payload["points"], payload["created"]
+        )
+
+    def _refresh_backdated_rollup(self, habit: Habit, completed_date: date) -> None:
+        """Un completado en un mes ya consolidado actualiza su rollup (solo meses pasados)."""
+        month = completed_date.replace(day=1)
+        if month >= timezone.localdate().replace(day=1):
+            return
+        covered_until = statistics.rollup_coverage(habit.user_id)
+        if covered_until is not None and month < covered_until:
+            statistics.refresh_rollup(habit.id, month)
+
+    def _count_completion(self, profile: UserProfile, habit: Habit) -> None:
+        """Actualiza los contadores que usan las reglas de logros (se guardan con el perfil)."""
+        counts = profile.completion_counts or {}
+        per_habit = counts.setdefault("habits", {})
+        per_habit[str(habit.id)] = per_habit.get(str(habit.id), 0) + 1
+        per_difficulty = counts.setdefault("difficulty", {})
+        per_difficulty[habit.difficulty] = per_difficulty.get(habit.difficulty, 0) + 1
+        profile.completion_counts = counts
+
+    def _advance_habit_streak(self, habit: Habit, completed_date: date) -> None:
+        """Avanza la racha del hábito por periodos en O(1); un completado atrasado la recalcula en SQL."""
+        if habit.last_completed == completed_date:
+            return
+        index = streaks.period_index(habit.periodicity, completed_date, habit.interval_days)
+        state = streaks.StreakState(
+            habit.current_streak,
+            habit.longest_streak,
+            streaks.period_index(habit.periodicity, habit.last_completed, habit.interval_days)
+            if habit.last_completed
+            else None,
+        )
+        if state.last_period is None or index >= state.last_period:
+            state = state.advance(index)
+            habit.last_completed = max(habit.last_completed or completed_date, completed_date)
+        else:
+            row = statistics.streaks("habit", [habit.user_id], using="default")[habit.id]
+            state = streaks.StreakState(row["current"], max(habit.longest_streak, row["longest"]), state.last_period)
+        self._store_habit_streak(habit, state)
+        habit.save(update_fields=["current_streak", "longest_streak", "last_completed", "streak_expires", "updated_at"])
+
+    def _store_habit_streak(self, habit: Habit, state: streaks.StreakState) -> None:
+        habit.current_streak, habit.longest_streak = state.current, state.longest
+        habit.streak_expires = (
+            streaks.expires_on(habit.periodicity, state.last_period, habit.interval_days)
+            if state.last_period is not None
+            else None
+        )
+
+    def refresh_habit_streak(self, habit: Habit) -> None:
+        """Recalcula la racha desde sus periodos (p. ej. tras cambiar la periodicidad)."""
+        periods = statistics.habit_periods([habit.user_id], using="default").get(habit.user_id, {})
+        _, _, indices = periods.get(habit.id, (habit.periodicity, habit.interval_days, []))
+        self._store_habit_streak(habit, streaks.from_periods(indices))
+        habit.save(update_fields=["current_streak", "longest_streak", "streak_expires", "updated_at"])
+
+    def _persist_achievements(self, user, profile: UserProfile, unlocked: int, plan) -> None:
+        """Crea solo los logros nuevos; sin desbloqueos no hay consultas."""
+        if not unlocked:
+            return
         Achievement.objects.bulk_create(
             [
-                Achievement(user=user, code=code, name=code.replace("_", " ").title())
-                for code in new_codes
-            ]
+                Achievement(user=user, code=plan.rules_by_bit[bit].code, name=plan.rules_by_bit[bit].name)
+                for bit in sorted(plan.rules_by_bit)
+                if unlocked & (1 << bit)
+            ],
+            ignore_conflicts=True,
         )
+        profile.achievement_mask |= unlocked
+
+    def get_streaks(self, user, today: date | None = None) -> Dict[str, int]:
+        """Racha del usuario en días sobre los periodos completados de cada hábito.
 
-    def _get_user_log_dicts(self, user) -> List[Dict]:
+        La base de datos agrupa los logs en periodos y fusiona los días que cubren
+        (statistics.coverage_streaks). Sin ``today`` la racha actual es el último
+        tramo cubierto, como se guarda en el perfil; con ``today`` vale 0 si ya se rompió.
+        """
+        until = today or timezone.localdate()
+        streak = statistics.coverage_streaks([user.pk], until).get(user.pk)
+        if streak is None:
+            return {"current": 0, "longest": 0}
+        if today is not None and streak["last_day"] < today - timedelta(days=1):
+            streak["current"] = 0
+        return {"current": streak["current"], "longest": streak["longest"]}
+
+    def _get_user_log_dicts(self, user, since: date | None = None) -> List[Dict]:
+        """Logs del usuario; con ``since`` solo desde esa fecha (en Postgres, solo sus particiones)."""
         logs = HabitLog.objects.filter(habit__user=user).order_by("date")
+        if since is not None:
+            logs = logs.filter(date__gte=since)
         return [
             {
                 "date": log.date,
@@ -89,22 +286,28 @@ class HabitController:
             for log in logs
         ]
 
+    def _week_start(self) -> date:
+        today = date.today()
+        return today - timedelta(days=today.weekday())
+
     def get_dashboard_data(self, user) -> Dict:
         """Obtiene el contexto completo para el dashboard."""
         try:
-            profile = self._get_profile(user)
-            logs = self._get_user_log_dicts(user)
-            week_logs = functional.filter_logs_by_week(logs)
-            streak = functional.calculate_streak(logs)
-            habits = Habit.objects.filter(user=user)
+            with use_replica(user):
+                profile = self._get_profile(user)
+                logs = self._get_user_log_dicts(user, since=self._week_start())
+                week_logs = functional.filter_logs_by_week(logs)
+                streak = self.get_streaks(user)["current"]
+                # Evaluadas aquí: fuera del bloque las lecturas volverían al primario
+                habits = list(Habit.objects.filter(user=user))
 
-            return {
-                "habits": habits,
-                "profile": profile,
-                "streak": streak,
-                "week_logs": week_logs,
-                "achievements": rules.check_achievements(streak),
-            }
+                return {
+                    "habits": habits,
+                    "profile": profile,
+                    "streak": streak,
+                    "week_logs": week_logs,
+                    "achievements": rules.check_achievements(streak),
+                }
         except Exception:
             # Retorna contexto mínimo si hay error
             profile = self._get_profile(user)
@@ -125,22 +328,39 @@ class HabitController:
         except Exception:
             return {"ranking": []}
 
+    def get_leaderboard(self, user, period: str, day: date | None = None, limit: int = 50) -> Dict:
+        """Top-N semanal, mensual o histórico de la ventana que contiene ``day``."""
+        today = timezone.localdate()
+        with use_replica(user):
+            return leaderboards.top(period, day or today, today, limit)
+
+    def get_group_leaderboard(self, user, group, period: str, limit: int = 50) -> Dict:
+        with use_replica(user):
+            return leaderboards.group_leaderboard(
+                group.pk, user.pk, period, timezone.localdate(), limit, version=group.ranking_version
+            )
+
+    def get_rank_history(self, user, period: str, limit: int = 52) -> List[Dict]:
+        with use_replica(user):
+            return leaderboards.rank_history(user.pk, period, limit)
+
     def get_profile_context(self, user) -> Dict:
         """Obtiene el contexto completo para la vista de perfil."""
         try:
-            profile = self._get_profile(user)
-            logs = self._get_user_log_dicts(user)
-            streak = functional.calculate_streak(logs)
-            habits = Habit.objects.filter(user=user)
-            achievements_list = Achievement.objects.filter(user=user).order_by("-earned_on")
-            
-            return {
-                "profile": profile,
-                "streak": streak,
-                "habits": habits,
-                "achievements": achievements_list,
-                "total_habits": habits.count(),
-            }
+            with use_replica(user):
+                profile = self._get_profile(user)
+                streak = self.get_streaks(user)["current"]
+                # Evaluadas aquí: fuera del bloque las lecturas volverían al primario
+                habits = list(Habit.objects.filter(user=user))
+                achievements_list = list(Achievement.objects.filter(user=user).order_by("-earned_on"))
+
+                return {
+                    "profile": profile,
+                    "streak": streak,
+                    "habits": habits,
+                    "achievements": achievements_list,
+                    "total_habits": len(habits),
+                }
         except Exception:
             # Retorna contexto mínimo si hay error
             profile = self._get_profile(user)
@@ -155,19 +375,21 @@ class HabitController:
     def get_progress_context(self, user) -> Dict:
         """Obtiene el contexto completo para la vista de progreso."""
         try:
-            profile = self._get_profile(user)
-            logs = self._get_user_log_dicts(user)
-            week_logs = functional.filter_logs_by_week(logs)
-            streak = functional.calculate_streak(logs)
-            habits = Habit.objects.filter(user=user)
-            
-            return {
-                "profile": profile,
-                "week_logs": week_logs,
-                "streak": streak,
-                "habits": habits,
-                "total_logs": len(logs),
-            }
+            with use_replica(user):
+                profile = self._get_profile(user)
+                week_logs = self._get_user_log_dicts(user, since=self._week_start())
+                week_logs = functional.filter_logs_by_week(week_logs)
+                streak = self.get_streaks(user)["current"]
+                # Evaluadas aquí: fuera del bloque las lecturas volverían al primario
+                habits = list(Habit.objects.filter(user=user))
+
+                return {
+                    "profile": profile,
+                    "week_logs": week_logs,
+                    "streak": streak,
+                    "habits": habits,
+                    "total_logs": HabitLog.objects.filter(habit__user=user).count(),
+                }
         except Exception:
             # Retorna contexto mínimo si hay error
             profile = self._get_profile(user)
@@ -179,3 +401,117 @@ class HabitController:
                 "total_logs": 0,
             }
 
+    def iter_streak_at_risk(self, now: datetime | None = None, chunk_size: int = 5000) -> Iterator[Dict]:
+        """Usuarios con racha activa que aún no completaron nada hoy (en su zona horaria).
+
+        Una sola consulta: por cada zona horaria distinta se compara ``last_completed``
+        con el "ayer" local y se descarta a quien ya tenga un log completado "hoy".
+        """
+        now = now or timezone.now()
+        condition = Q(pk__in=[])
+        for tz_name in UserProfile.objects.values_list("timezone", flat=True).distinct():
+            today = local_date(tz_name, now)
+            completed_today = HabitLog.objects.filter(habit__user=OuterRef("user_id"), date=today, completed=True)
+            condition |= Q(timezone=tz_name, last_completed=today - timedelta(days=1)) & ~Exists(completed_today)
+
+        return (
+            UserProfile.objects.filter(condition, current_streak__gt=0)
+            .order_by()
+            .values(
+                "user_id",
+                "current_streak",
+                "timezone",
+                "last_completed",
+                username=F("user__username"),
+                email=F("user__email"),
+            )
+            .iterator(chunk_size=chunk_size)
+        )
+
+    def get_changes_since(self, user, since: datetime | None = None) -> Dict:
+        """Hábitos, logs y logros creados/modificados/borrados desde ``since``.
+
+        Sin ``since`` devuelve el estado completo. Cada tabla se resuelve con una
+        consulta por rango sobre su índice (usuario/hábito, updated_at).
+        """
+        now = timezone.now()
+        habits = Habit.objects.filter(user=user)
+        logs = HabitLog.objects.filter(habit__user=user)
+        achievements = Achievement.objects.filter(user=user)
+        deleted = {kind: [] for kind in Tombstone.Kind.values}
+        if since is not None:
+            lower = since - SYNC_OVERLAP
+            habits = habits.filter(updated_at__gte=lower)
+            logs = logs.filter(updated_at__gte=lower)
+            achievements = achievements.filter(updated_at__gte=lower)
+            tombstones = Tombstone.objects.filter(user=user, deleted_at__gte=lower)
+            for kind, object_key in tombstones.values_list("kind", "object_key"):
+                deleted[kind].append(object_key)
+
+        return {
+            "full": since is None,
+            "habits": list(habits.order_by("updated_at")),
+            "logs": list(logs.order_by("updated_at")),
+            "achievements": list(achievements.order_by("updated_at")),
+            "deleted": deleted,
+            "cursor": encode_sync_cursor(now),
+        }
+
+    def get_bootstrap_data(self, user, today: date | None = None) -> Dict:
+        """Todo lo que necesita la SPA al cargar, en un número fijo de consultas.
+
+        Perfil, hábitos con su estado de hoy, logs de la semana, logros y posición
+        en el ranking. La racha sale del perfil (ya mantenida en ``complete_habit``)
+        en lugar de recorrer todo el historial de logs.
+        """
+        today = today or timezone.localdate()
+        week_start = today - timedelta(days=today.weekday())
+        week_end = week_start + timedelta(days=6)
+
+        profile = self._get_profile(user)
+        habits = list(annotate_habit_status(Habit.objects.filter(user=user), today).order_by("-created_at"))
+        week_logs = list(
+            HabitLog.objects.filter(habit__user=user, date__range=(week_start, week_end)).order_by("-date")
+        )
+        achievements_list = list(Achievement.objects.filter(user=user).order_by("-earned_on"))
+        rank = UserProfile.objects.filter(total_points__gt=profile.total_points).count() + 1
+
+        return {
+            "profile": profile,
+            "streak": profile.current_streak,
+            "habits": habits,
+            "week_logs": week_logs,
+            "achievements": achievements_list,
+            "rank": rank,
+        }
+
+    def get_habit_statistics(self, user, today: date | None = None, use_rollups: bool = True) -> Dict:
+        """Estadísticas por hábito (ver controller.statistics) desde la réplica si la hay."""
+        with use_replica(user):
+            return statistics.habit_statistics(user, today or timezone.localdate(), use_rollups)
+
+    def search_habits(
+        self, user, query: str, limit: int = 20, offset: int = 0, all_users: bool = False
+    ) -> Tuple[List[Habit], bool]:
+        """Hábitos por relevancia con el índice de texto completo; devuelve (página, hay_más).
+
+        ``all_users`` (solo staff) busca en los hábitos de todos los usuarios.
+        """
+        with use_replica(user):
+            alias = router.db_for_read(Habit)
+            scope = None if all_users else user.pk
+            ranked = fulltext.search(connections[alias], query, scope, limit=limit + 1, offset=offset)
+            page, has_more = ranked[:limit], len(ranked) > limit
+            habits = Habit.objects.using(alias).in_bulk([pk for pk, _ in page])
+        results = []
+        for pk, rank in page:
+            # Un hábito borrado entre ambas consultas simplemente no aparece
+            if pk in habits:
+                habits[pk].search_rank = rank
+                results.append(habits[pk])
+        return results, has_more
+
+
+@jobs.handler(COMPLETION_JOB)
+def _process_completion(payload: Dict) -> None:
+    HabitController().process_completion_job(payload)
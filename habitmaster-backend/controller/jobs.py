@@ -0,0 +1,109 @@
+"""
+Cola de trabajos en la base de datos (sin broker externo).
+
+``enqueue`` inserta el trabajo en la transacción en curso: solo se hace visible
+al confirmar, y si la transacción falla el trabajo desaparece con ella. Los
+workers (``run_jobs``) reclaman lotes con ``SELECT ... FOR UPDATE SKIP LOCKED``,
+de modo que varios procesos nunca toman el mismo trabajo ni se esperan entre sí
+(en SQLite no hay FOR UPDATE: la transacción IMMEDIATE ya serializa la reclamación).
+Cada trabajo se ejecuta y se marca como hecho en una misma transacción; si falla
+vuelve a la cola con espera exponencial hasta ``MAX_ATTEMPTS``.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from habits.models import Job
+
+MAX_ATTEMPTS = 5
+HANDLERS: Dict[str, Callable[[dict], None]] = {}
+
+
+def handler(kind: str):
+    """Registra la función que procesa los trabajos de tipo ``kind``."""
+
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+def enqueue(kind: str, payload: dict, delay: Optional[timedelta] = None) -> Job:
+    return Job.objects.create(kind=kind, payload=payload, run_after=timezone.now() + (delay or timedelta()))
+
+
+def claim(batch_size: int = 100, worker: str = "") -> List[Job]:
+    """Toma hasta ``batch_size`` trabajos pendientes; la transacción dura dos sentencias."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.Status.PENDING, run_after__lte=now)
+            .order_by("run_after", "id")[:batch_size]
+        )
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=Job.Status.RUNNING, locked_at=now, locked_by=worker, attempts=F("attempts") + 1
+            )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def run(job: Job) -> bool:
+    """Ejecuta un trabajo reclamado; devuelve False si falló (y queda reprogramado o fallido)."""
+    try:
+        with transaction.atomic():
+            HANDLERS[job.kind](job.payload)
+            Job.objects.filter(pk=job.pk).update(status=Job.Status.DONE, finished_at=timezone.now(), last_error="")
+        return True
+    except Exception as exc:
+        retry = job.attempts < MAX_ATTEMPTS
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.PENDING if retry else Job.Status.FAILED,
+            run_after=timezone.now() + timedelta(seconds=2 ** job.attempts),
+            finished_at=None if retry else timezone.now(),
+            locked_at=None,
+            last_error=f"{type(exc).__name__}: {exc}"[:2000],
+        )
+        return False
+
+
+def run_batch(batch_size: int = 100, worker: str = "") -> Tuple[int, int]:
+    """Reclama y procesa un lote; devuelve (hechos, fallidos)."""
+    done = failed = 0
+    for job in claim(batch_size, worker):
+        if run(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def requeue_stale(older_than: timedelta = timedelta(minutes=5)) -> int:
+    """Devuelve a la cola los trabajos de workers que murieron a mitad."""
+    return Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=timezone.now() - older_than).update(
+        status=Job.Status.PENDING, locked_at=None, locked_by=""
+    )
+
+
+def purge(before: datetime) -> int:
+    """Borra los trabajos hechos antes de ``before``."""
+    deleted, _ = Job.objects.filter(status=Job.Status.DONE, finished_at__lt=before).delete()
+    return deleted
+
+
+def drain(batch_size: int = 100, worker: str = "", timeout: float = 30.0) -> int:
+    """Procesa hasta vaciar la cola de trabajos listos (tests y mantenimiento)."""
+    processed, deadline = 0, time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        done, failed = run_batch(batch_size, worker)
+        if not done and not failed:
+            break
+        processed += done + failed
+    return processed
@@ -0,0 +1,218 @@
+"""
+Rankings por ventana (semana, mes, histórico) e historial de posiciones.
+
+Los puntos de cada ventana viven en PeriodPoints, que ``complete_habit`` incrementa;
+el top-N de la ventana en curso es un ORDER BY ... LIMIT sobre su índice
+(period, start, -points). ``snapshot`` congela una ventana: top-K en
+LeaderboardSnapshot y la posición de cada usuario en UserRankSnapshot, de modo
+que las consultas históricas nunca recalculan.
+
+Los rankings de grupo se limitan a los miembros con un JOIN sobre
+GroupMembership (group, user) y se cachean por grupo y ``Group.ranking_version``;
+``complete_habit`` sube la versión de los grupos del usuario al confirmar. La
+versión está en la base de datos, así que la invalidación llega a todos los
+workers aunque cada uno tenga su propia caché.
+
+Si los contadores se desvían, ``rebuild_window`` los rehace desde PointsLedger
+con una suma por rango de fechas.
+"""
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+
+from habits.models import (
+    Group,
+    GroupMembership,
+    LeaderboardSnapshot,
+    Period,
+    PeriodPoints,
+    UserProfile,
+    UserRankSnapshot,
+)
+from processor import functional
+from . import points
+
+WINDOWED = (Period.WEEK, Period.MONTH)
+
+
+def add_points(user_id: int, day: date, points: int) -> None:
+    """Suma ``points`` a la semana y al mes de ``day`` (un UPDATE por ventana en régimen normal)."""
+    for period in WINDOWED:
+        start = functional.period_start(period, day)
+        counters = PeriodPoints.objects.filter(user_id=user_id, period=period, start=start)
+        if counters.update(points=F("points") + points):
+            continue
+        try:
+            with transaction.atomic():
+                PeriodPoints.objects.create(user_id=user_id, period=period, start=start, points=points)
+        except IntegrityError:
+            # Otro proceso creó la fila entre el UPDATE y el INSERT
+            counters.update(points=F("points") + points)
+
+
+def _ranked(period: str, start: date):
+    """(user_id, username, puntos, posición) ordenado en la base de datos."""
+    if period == Period.ALL:
+        rows = UserProfile.objects.values_list("user_id", "user__username", "total_points")
+        points = F("total_points")
+    else:
+        rows = PeriodPoints.objects.filter(period=period, start=start).values_list("user_id", "user__username", "points")
+        points = F("points")
+    return rows.annotate(position=Window(Rank(), order_by=points.desc())).order_by(points.desc(), "user_id")
+
+
+def top(period: str, day: date, today: date, limit: int = 50) -> Dict:
+    """Top-N de la ventana que contiene ``day``.
+
+    Las ventanas cerradas se leen de su snapshot (si existe); la ventana en curso,
+    en vivo desde los contadores.
+    """
+    start = functional.period_start(period, day)
+    snapshot = None
+    if start < functional.period_start(period, today):
+        snapshot = LeaderboardSnapshot.objects.filter(period=period, start=start).first()
+    if snapshot is not None:
+        ranking = [tuple(row) for row in snapshot.top[:limit]]
+    elif period == Period.ALL:
+        ranking = list(UserProfile.objects.order_by("-total_points", "user_id").values_list("user__username", "total_points")[:limit])
+    else:
+        ranking = list(
+            PeriodPoints.objects.filter(period=period, start=start)
+            .order_by("-points", "user_id")
+            .values_list("user__username", "points")[:limit]
+        )
+    return {
+        "period": period,
+        "start": start,
+        "source": "snapshot" if snapshot is not None else "live",
+        "ranking": ranking,
+    }
+
+
+def rank_history(user_id: int, period: str, limit: int = 52) -> List[Dict]:
+    """Últimas ``limit`` posiciones del usuario (una lectura del índice user/period/start)."""
+    rows = (
+        UserRankSnapshot.objects.filter(user_id=user_id, period=period)
+        .order_by("-start")
+        .values("start", "rank", "points")[:limit]
+    )
+    return list(reversed(rows))
+
+
+def snapshot(period: str, day: date, top_k: int = 100, batch_size: int = 5000) -> Optional[LeaderboardSnapshot]:
+    """Congela la ventana de ``day``; repetirlo sobre la misma ventana la sobrescribe."""
+    start = functional.period_start(period, day)
+    leaders, batch, participants = [], [], 0
+    with transaction.atomic():
+        UserRankSnapshot.objects.filter(period=period, start=start).delete()
+        for user_id, username, points, position in _ranked(period, start).iterator(chunk_size=batch_size):
+            participants += 1
+            if len(leaders) < top_k:
+                leaders.append([username, points])
+            batch.append(UserRankSnapshot(user_id=user_id, period=period, start=start, rank=position, points=points))
+            if len(batch) >= batch_size:
+                UserRankSnapshot.objects.bulk_create(batch)
+                batch = []
+        UserRankSnapshot.objects.bulk_create(batch)
+        board, _ = LeaderboardSnapshot.objects.update_or_create(
+            period=period, start=start, defaults={"participants": participants, "top": leaders}
+        )
+    return board
+
+
+def rebuild_window(period: str, day: date) -> int:
+    """Rehace los contadores PeriodPoints de la ventana de ``day`` desde el libro de puntos."""
+    if period not in WINDOWED:
+        raise ValueError(f"Solo hay contadores por ventana para {', '.join(WINDOWED)}")
+    start = functional.period_start(period, day)
+    end = functional.period_end(period, start)
+    totals = points.window_totals(start, end)
+    with transaction.atomic():
+        PeriodPoints.objects.filter(period=period, start=start).delete()
+        PeriodPoints.objects.bulk_create(
+            [PeriodPoints(user_id=user_id, period=period, start=start, points=total) for user_id, total in totals.items()],
+            batch_size=5000,
+        )
+    return len(totals)
+
+
+GROUP_CACHE_TTL = 300
+
+
+def group_cache_key(group_id: int, version: int) -> str:
+    return f"group-ranking:{group_id}:v{version}"
+
+
+def invalidate_group(group_id: int) -> None:
+    """Sube la versión del ranking del grupo; las entradas anteriores caducan solas."""
+    Group.objects.filter(pk=group_id).update(ranking_version=F("ranking_version") + 1)
+
+
+def invalidate_groups_of(user_id: int) -> None:
+    """Sube la versión de todos los grupos del usuario (un solo UPDATE)."""
+    group_ids = GroupMembership.objects.filter(user_id=user_id).values("group_id")
+    Group.objects.filter(pk__in=group_ids).update(ranking_version=F("ranking_version") + 1)
+
+
+def _group_points(group_id: int, period: str, start: date):
+    """(queryset, campo de puntos) de los miembros del grupo para la ventana."""
+    if period == Period.ALL:
+        return UserProfile.objects.filter(user__group_memberships__group_id=group_id), "total_points"
+    return PeriodPoints.objects.filter(period=period, start=start, user__group_memberships__group_id=group_id), "points"
+
+
+def group_top(group_id: int, period: str, start: date, limit: int) -> List[tuple]:
+    """[(user_id, username, puntos)] ordenado y limitado en la base de datos."""
+    rows, points = _group_points(group_id, period, start)
+    return list(rows.order_by(f"-{points}", "user_id").values_list("user_id", "user__username", points)[:limit])
+
+
+def group_points_sorted(group_id: int, period: str, start: date) -> List[int]:
+    """Puntos de todos los miembros en orden ascendente (para posicionar con bisect)."""
+    rows, points = _group_points(group_id, period, start)
+    return list(rows.order_by(points).values_list(points, flat=True))
+
+
+def group_leaderboard(
+    group_id: int, user_id: int, period: str, today: date, limit: int = 50, version: Optional[int] = None
+) -> Dict:
+    """Top-N del grupo y la posición de quien consulta.
+
+    La caché del grupo guarda el top-N y los puntos ordenados de sus miembros, así
+    que con la caché caliente la posición propia es una lectura por clave primaria
+    y un bisect, sin recorrer el grupo. ``version`` es la ``ranking_version`` del
+    grupo si ya se cargó (si no, se lee del primario).
+    """
+    start = functional.period_start(period, today)
+    if version is None:
+        # Del primario: una réplica con retraso devolvería una versión ya invalidada
+        rows = Group.objects.using(DEFAULT_DB_ALIAS).filter(pk=group_id)
+        version = rows.values_list("ranking_version", flat=True).first() or 0
+    key = group_cache_key(group_id, version)
+    cached = cache.get(key) or {}
+    entry = f"{period}:{start}:{limit}"
+    if entry not in cached:
+        cached[entry] = {
+            "top": group_top(group_id, period, start, limit),
+            "points": group_points_sorted(group_id, period, start),
+        }
+        cache.set(key, cached, GROUP_CACHE_TTL)
+    rows, ordered = cached[entry]["top"], cached[entry]["points"]
+
+    my_points = next((points for member_id, _, points in rows if member_id == user_id), None)
+    if my_points is None:
+        members, points = _group_points(group_id, period, start)
+        my_points = members.filter(user_id=user_id).values_list(points, flat=True).first() or 0
+    return {
+        "group": group_id,
+        "period": period,
+        "start": start,
+        "ranking": [(username, points) for _, username, points in rows],
+        # Con empates, la posición es la del primero con esos puntos
+        "me": {"rank": len(ordered) - bisect_right(ordered, my_points) + 1, "points": my_points},
+    }
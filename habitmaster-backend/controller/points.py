@@ -0,0 +1,153 @@
+"""
+Libro de puntos: cada cambio de puntos es una fila nueva de PointsLedger.
+
+``record`` incrementa ``UserProfile.total_points`` con un UPDATE (que bloquea la
+fila del perfil hasta el commit y serializa los movimientos del usuario) y guarda
+el saldo resultante en el movimiento. El total vigente es O(1) (perfil o último
+``balance``) y las sumas por ventana son rangos sobre los índices (user, date) y
+(date), sin reconstruir nada desde HabitLog.
+"""
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum
+
+from habits.models import PointsLedger, UserProfile
+from logic_rules import rules
+
+
+@transaction.atomic
+def record(
+    user_id: int,
+    day: date,
+    delta: int,
+    reason: str,
+    habit_id: Optional[int] = None,
+    note: str = "",
+) -> PointsLedger:
+    """Añade un movimiento y actualiza el total del perfil en la misma transacción."""
+    profiles = UserProfile.objects.filter(user_id=user_id)
+    if not profiles.update(total_points=F("total_points") + delta):
+        UserProfile.objects.create(user_id=user_id, total_points=delta)
+    balance = profiles.values_list("total_points", flat=True).get()
+    return PointsLedger.objects.create(
+        user_id=user_id, habit_id=habit_id, date=day, delta=delta, balance=balance, reason=reason, note=note
+    )
+
+
+def balance(user_id: int) -> int:
+    """Total vigente según el libro: el saldo del último movimiento."""
+    return PointsLedger.objects.filter(user_id=user_id).order_by("-id").values_list("balance", flat=True).first() or 0
+
+
+def period_sum(user_id: int, start: date, end: date) -> int:
+    """Puntos del usuario entre ``start`` y ``end`` (incluidos)."""
+    rows = PointsLedger.objects.filter(user_id=user_id, date__range=(start, end))
+    return rows.aggregate(points=Sum("delta"))["points"] or 0
+
+
+def window_totals(start: date, end: date) -> Dict[int, int]:
+    """Puntos por usuario en la ventana (fuente para reconstruir rankings)."""
+    rows = (
+        PointsLedger.objects.filter(date__range=(start, end))
+        .order_by()
+        .values("user_id")
+        .annotate(points=Sum("delta"))
+        .values_list("user_id", "points")
+    )
+    return dict(rows)
+
+
+def history(user_id: int, limit: int = 50) -> List[PointsLedger]:
+    """Últimos movimientos del usuario (auditoría), del más reciente al más antiguo."""
+    return list(PointsLedger.objects.filter(user_id=user_id).order_by("-id")[:limit])
+
+
+def reconcile(user_ids: Iterable[int]) -> List[Dict]:
+    """Usuarios cuyo perfil o saldo no cuadran con la suma del libro (tres consultas)."""
+    user_ids = list(user_ids)
+    sums = {
+        row["user_id"]: row
+        for row in PointsLedger.objects.filter(user_id__in=user_ids)
+        .order_by()
+        .values("user_id")
+        .annotate(total=Sum("delta"), last_id=Max("id"))
+    }
+    balances = dict(
+        PointsLedger.objects.filter(id__in=[row["last_id"] for row in sums.values()]).values_list("user_id", "balance")
+    )
+    mismatches = []
+    for user_id, profile_total in UserProfile.objects.filter(user_id__in=user_ids).values_list("user_id", "total_points"):
+        ledger_total = sums[user_id]["total"] if user_id in sums else 0
+        last_balance = balances.get(user_id, 0)
+        if profile_total != ledger_total or last_balance != ledger_total:
+            mismatches.append({
+                "user_id": user_id,
+                "profile": profile_total,
+                "ledger": ledger_total,
+                "balance": last_balance,
+            })
+    return mismatches
+
+
+# Movimientos que corresponden a logs; los ajustes manuales no se recalculan
+LOG_REASONS = (PointsLedger.Reason.COMPLETION, PointsLedger.Reason.BACKFILL, PointsLedger.Reason.RECOMPUTE)
+
+
+def log_totals(user_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """``{user_id: (total del libro, parte que viene de logs)}`` en una consulta."""
+    rows = (
+        PointsLedger.objects.filter(user_id__in=list(user_ids))
+        .order_by()
+        .values("user_id")
+        .annotate(total=Sum("delta"), from_logs=Sum("delta", filter=Q(reason__in=LOG_REASONS)))
+        .values_list("user_id", "total", "from_logs")
+    )
+    return {user_id: (total, from_logs or 0) for user_id, total, from_logs in rows}
+
+
+def align_with_logs(user_id: int, day: date, log_points: int) -> int:
+    """Registra como RECOMPUTE lo que falta para que los movimientos de logs sumen ``log_points``.
+
+    Con el perfil bloqueado: el perfil pasa a la suma del libro (como ``repair``) y
+    la diferencia entra por ``record``. Solo toca ``total_points``: el nivel lo
+    escribe quien llama. Devuelve el total resultante.
+    """
+    with transaction.atomic():
+        list(UserProfile.objects.select_for_update().filter(user_id=user_id).values_list("pk"))
+        total, from_logs = log_totals([user_id]).get(user_id, (0, 0))
+        delta = log_points - from_logs
+        UserProfile.objects.filter(user_id=user_id).update(total_points=total)
+        if delta:
+            record(user_id, day, delta, PointsLedger.Reason.RECOMPUTE, note="recompute_profiles")
+    return total + delta
+
+
+def repair(user_ids: Iterable[int], day: date) -> int:
+    """Corrige los descuadres de ``reconcile`` para esos usuarios: el libro manda.
+
+    Cada usuario se vuelve a comprobar con su perfil bloqueado (``record`` también
+    lo bloquea), así que un completado concurrente no se pierde. El perfil pasa a
+    la suma del libro; si el último saldo estaba mal se añade un movimiento de
+    delta 0 con el saldo correcto (el libro nunca se reescribe).
+    """
+    repaired = 0
+    for user_id in user_ids:
+        with transaction.atomic():
+            list(UserProfile.objects.select_for_update().filter(user_id=user_id).values_list("pk"))
+            for row in reconcile([user_id]):
+                UserProfile.objects.filter(user_id=user_id).update(
+                    total_points=row["ledger"], level=rules.determine_level(row["ledger"])
+                )
+                if row["balance"] != row["ledger"]:
+                    PointsLedger.objects.create(
+                        user_id=user_id,
+                        date=day,
+                        delta=0,
+                        balance=row["ledger"],
+                        reason=PointsLedger.Reason.ADJUSTMENT,
+                        note=f"Conciliación: saldo {row['balance']} -> {row['ledger']}",
+                    )
+                repaired += 1
+    return repaired
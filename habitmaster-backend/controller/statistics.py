@@ -0,0 +1,353 @@
+"""
+Estadísticas por hábito calculadas en la base de datos.
+
+Conteos y sumas con ``annotate`` condicional sobre HabitLog (o sobre
+HabitMonthlyRollup para los meses ya consolidados) y rachas con ventanas
+(gaps-and-islands): dentro de un usuario o hábito, ``día - ROW_NUMBER()`` es
+constante en cada tramo de días consecutivos, así que agrupar por ese valor da
+las rachas sin traer los logs a Python. Por hábito, "día" es el índice de su
+periodo (ver processor.streaks), así que las semanales cuentan semanas seguidas.
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connections, router, transaction
+from django.db.models import Count, FilteredRelation, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from habits.models import Habit, HabitLog, HabitMonthlyRollup, LogArchive
+from processor.streaks import EPOCH, WEEK_OFFSET
+
+
+def day_number_sql(vendor: str, expression: str) -> str:
+    """Fecha -> días desde 1970-01-01 (portable entre Postgres y SQLite)."""
+    if vendor == "postgresql":
+        return f"(CAST({expression} AS date) - DATE '1970-01-01')"
+    return f"CAST(julianday({expression}) - 2440587.5 AS INTEGER)"
+
+
+def period_sql(vendor: str, expression: str, alias: str = "h") -> str:
+    """Fecha -> índice del periodo del hábito ``alias`` (igual que processor.streaks.period_index)."""
+    day = day_number_sql(vendor, expression)
+    return (
+        f"CASE {alias}.periodicity "
+        f"WHEN '{Habit.Periodicity.WEEKLY}' THEN ({day} + {WEEK_OFFSET}) / 7 "
+        f"WHEN '{Habit.Periodicity.CUSTOM}' THEN {day} / {alias}.interval_days "
+        f"ELSE {day} END"
+    )
+
+
+def streaks(
+    partition: str = "user",
+    user_ids: Optional[Iterable[int]] = None,
+    today: Optional[date] = None,
+    using: Optional[str] = None,
+) -> Dict[int, Dict[str, int]]:
+    """Racha actual y más larga por usuario o por hábito en una sola consulta.
+
+    ``partition``: "user" (días distintos con algo completado) o "habit" (periodos
+    seguidos según la periodicidad de cada hábito).
+    ``user_ids``: limita a esos usuarios; None calcula todos a la vez.
+    ``current`` es el tramo que termina en el último periodo completado; con ``today``
+    vale 0 si ese periodo es anterior al previo al de hoy (racha rota).
+    Devuelve ``{id: {"current": n, "longest": n}}``; sin completados no hay clave.
+    """
+    using = using or router.db_for_read(HabitLog)
+    connection = connections[using]
+    to_bucket = period_sql if partition == "habit" else day_number_sql
+    key = {"user": "h.user_id", "habit": "l.habit_id"}[partition]
+    bucket = to_bucket(connection.vendor, "l.date")
+    where, params = ["l.completed"], []
+    reference, current = "0", "CASE WHEN rn = 1 THEN length ELSE 0 END"
+    if today is not None:
+        # El periodo de hoy depende de la periodicidad de cada hábito: se calcula por
+        # fila sobre un literal de fecha (un date no puede inyectar nada)
+        reference = to_bucket(connection.vendor, f"'{today.isoformat()}'")
+        current = "CASE WHEN rn = 1 AND last_bucket >= today_bucket - 1 THEN length ELSE 0 END"
+        where.append("l.date <= %s")
+        params.append(today)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        where.append(f"h.user_id IN ({', '.join(['%s'] * len(user_ids))})")
+        params += user_ids
+
+    sql = f"""
+        WITH periods AS (
+            SELECT DISTINCT {key} AS owner, {bucket} AS bucket, {reference} AS today_bucket
+            FROM {HabitLog._meta.db_table} l
+            JOIN {Habit._meta.db_table} h ON h.id = l.habit_id
+            WHERE {" AND ".join(where)}
+        ), islands AS (
+            SELECT owner, bucket - ROW_NUMBER() OVER (PARTITION BY owner ORDER BY bucket) AS island,
+                   bucket, today_bucket
+            FROM periods
+        ), runs AS (
+            SELECT owner, COUNT(*) AS length, MAX(bucket) AS last_bucket, MAX(today_bucket) AS today_bucket
+            FROM islands GROUP BY owner, island
+        ), ranked AS (
+            SELECT owner, length, last_bucket, today_bucket,
+                   ROW_NUMBER() OVER (PARTITION BY owner ORDER BY last_bucket DESC) AS rn
+            FROM runs
+        )
+        SELECT owner, MAX({current}), MAX(length) FROM ranked GROUP BY owner
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {owner: {"current": current, "longest": longest} for owner, current, longest in cursor.fetchall()}
+
+
+def habit_periods(
+    user_ids: Iterable[int], until: Optional[date] = None, using: Optional[str] = None
+) -> Dict[int, Dict[int, Tuple[str, int, List[int]]]]:
+    """Periodos completados de cada hábito, agrupados en SQL (una fila por periodo, no por log).
+
+    Devuelve ``{user_id: {habit_id: (periodicidad, intervalo, [índices ordenados])}}``.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    using = using or router.db_for_read(HabitLog)
+    connection = connections[using]
+    bucket = period_sql(connection.vendor, "l.date")
+    where, params = [f"h.user_id IN ({', '.join(['%s'] * len(user_ids))})", "l.completed"], list(user_ids)
+    if until is not None:
+        where.append("l.date <= %s")
+        params.append(until)
+    sql = f"""
+        SELECT DISTINCT h.user_id, h.id, h.periodicity, h.interval_days, {bucket} AS bucket
+        FROM {HabitLog._meta.db_table} l
+        JOIN {Habit._meta.db_table} h ON h.id = l.habit_id
+        WHERE {" AND ".join(where)}
+        ORDER BY h.user_id, h.id, bucket
+    """
+    result: Dict[int, Dict[int, Tuple[str, int, List[int]]]] = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for user_id, habit_id, periodicity, interval_days, index in cursor.fetchall():
+            habits = result.setdefault(user_id, {})
+            habits.setdefault(habit_id, (periodicity, interval_days, []))[2].append(index)
+    return result
+
+
+def coverage_streaks(
+    user_ids: Iterable[int], until: date, using: Optional[str] = None
+) -> Dict[int, Dict]:
+    """Racha en días de cada usuario sobre los periodos completados de sus hábitos.
+
+    Mismo resultado que processor.streaks.user_streak, sin traer los periodos a
+    Python: cada periodo es un tramo de días y los tramos se fusionan con
+    gaps-and-islands (un tramo abre isla si empieza después del día siguiente al
+    final más lejano de los anteriores); las islas se recortan a ``until``.
+    Devuelve ``{user_id: {"current", "longest", "last_day"}}``; sin completados no hay clave.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    using = using or router.db_for_read(HabitLog)
+    connection = connections[using]
+    bucket = period_sql(connection.vendor, "l.date")
+    until_day = (until - EPOCH).days
+    sql = f"""
+        WITH periods AS (
+            SELECT DISTINCT h.user_id AS owner, h.periodicity, h.interval_days, {bucket} AS bucket
+            FROM {HabitLog._meta.db_table} l
+            JOIN {Habit._meta.db_table} h ON h.id = l.habit_id
+            WHERE h.user_id IN ({', '.join(['%s'] * len(user_ids))}) AND l.completed AND l.date <= %s
+        ), spans AS (
+            SELECT owner,
+                   CASE periodicity
+                       WHEN '{Habit.Periodicity.WEEKLY}' THEN bucket * 7 - {WEEK_OFFSET}
+                       WHEN '{Habit.Periodicity.CUSTOM}' THEN bucket * interval_days
+                       ELSE bucket END AS first_day,
+                   CASE periodicity
+                       WHEN '{Habit.Periodicity.WEEKLY}' THEN bucket * 7 - {WEEK_OFFSET} + 6
+                       WHEN '{Habit.Periodicity.CUSTOM}' THEN (bucket + 1) * interval_days - 1
+                       ELSE bucket END AS last_day
+            FROM periods
+        ), reach AS (
+            SELECT owner, first_day, last_day,
+                   MAX(last_day) OVER (
+                       PARTITION BY owner ORDER BY first_day, last_day
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) AS reach
+            FROM spans
+        ), islands AS (
+            SELECT owner, first_day, last_day,
+                   SUM(CASE WHEN reach IS NULL OR first_day > reach + 1 THEN 1 ELSE 0 END) OVER (
+                       PARTITION BY owner ORDER BY first_day, last_day ROWS UNBOUNDED PRECEDING
+                   ) AS island
+            FROM reach
+        ), runs AS (
+            SELECT owner, MIN(first_day) AS run_start,
+                   CASE WHEN MAX(last_day) > %s THEN %s ELSE MAX(last_day) END AS run_end
+            FROM islands GROUP BY owner, island
+        )
+        -- Las islas no se solapan: la última es la que empieza más tarde
+        SELECT owner, MAX(run_end) - MAX(run_start) + 1, MAX(run_end - run_start + 1), MAX(run_end)
+        FROM runs GROUP BY owner
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, user_ids + [until, until_day, until_day])
+        return {
+            owner: {"current": current, "longest": longest, "last_day": EPOCH + timedelta(days=last_day)}
+            for owner, current, longest, last_day in cursor.fetchall()
+        }
+
+
+def _rollup(aggregate, covered_until: date):
+    rows = HabitMonthlyRollup.objects.filter(habit=OuterRef("pk"), month__lt=covered_until).order_by().values("habit")
+    return Subquery(rows.annotate(value=aggregate).values("value"))
+
+
+def rollup_coverage(user_id: int) -> Optional[date]:
+    """Primer día no consolidado para el usuario, o None si no hay rollups."""
+    last_month = HabitMonthlyRollup.objects.filter(habit__user_id=user_id).aggregate(last=Max("month"))["last"]
+    if last_month is None:
+        return None
+    return (last_month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def habit_statistics(user, today: date, use_rollups: bool = True) -> Dict:
+    """Una fila por hábito más el resumen del usuario.
+
+    Con rollups, los meses consolidados se leen de HabitMonthlyRollup y el JOIN
+    con los logs se limita a las fechas posteriores (rango sobre el índice único
+    hábito/fecha). Las rachas salen siempre de los logs.
+    """
+    covered_until = rollup_coverage(user.pk) if use_rollups else None
+    window_start = today - timedelta(days=29)
+    condition = Q(logs__completed=True, logs__date__lte=today)
+    totals = Q()
+    if covered_until is not None:
+        # El JOIN solo baja hasta lo no consolidado o lo que piden las medias móviles
+        condition &= Q(logs__date__gte=min(covered_until, window_start))
+        totals = Q(live__date__gte=covered_until)
+
+    habits = (
+        Habit.objects.filter(user=user)
+        .order_by("-created_at")
+        .annotate(live=FilteredRelation("logs", condition=condition))
+        .annotate(
+            completions=Count("live", filter=totals),
+            points=Coalesce(Sum("live__points_awarded", filter=totals), 0),
+            first_day=Min("live__date"),
+            last_day=Max("live__date"),
+            last_7=Count("live", filter=Q(live__date__gte=today - timedelta(days=6))),
+            last_30=Count("live", filter=Q(live__date__gte=window_start)),
+        )
+    )
+    fields = ["id", "name", "created_at", "completions", "points", "first_day", "last_day", "last_7", "last_30"]
+    if covered_until is not None:
+        habits = habits.annotate(
+            rolled_completions=_rollup(Sum("completions"), covered_until),
+            rolled_points=_rollup(Sum("points"), covered_until),
+            rolled_first_day=_rollup(Min("first_day"), covered_until),
+            rolled_last_day=_rollup(Max("last_day"), covered_until),
+        )
+        fields += ["rolled_completions", "rolled_points", "rolled_first_day", "rolled_last_day"]
+
+    habit_streaks = streaks("habit", [user.pk], today)
+    rows: List[Dict] = []
+    for habit in habits.values(*fields):
+        completions = habit["completions"] + (habit.get("rolled_completions") or 0)
+        first_day = min(d for d in (habit["created_at"].date(), habit["first_day"], habit.get("rolled_first_day")) if d)
+        tracked_days = max(1, (today - first_day).days + 1)
+        streak = habit_streaks.get(habit["id"], {"current": 0, "longest": 0})
+        rows.append({
+            "habit_id": habit["id"],
+            "name": habit["name"],
+            "completions": completions,
+            "total_points": habit["points"] + (habit.get("rolled_points") or 0),
+            "completion_rate": round(completions / tracked_days, 3),
+            "current_streak": streak["current"],
+            "best_streak": streak["longest"],
+            "average_7d": round(habit["last_7"] / 7, 3),
+            "average_30d": round(habit["last_30"] / 30, 3),
+            "last_completed": habit["last_day"] or habit.get("rolled_last_day"),
+        })
+
+    summary = {
+        "habits": len(rows),
+        "completions": sum(row["completions"] for row in rows),
+        "total_points": sum(row["total_points"] for row in rows),
+        "best_streak": max((row["best_streak"] for row in rows), default=0),
+        "average_7d": round(sum(row["average_7d"] for row in rows), 3),
+        "average_30d": round(sum(row["average_30d"] for row in rows), 3),
+        "from_rollups": covered_until is not None,
+    }
+    return {"user": summary, "habits": rows}
+
+
+def refresh_rollup(habit_id: int, month: date) -> None:
+    """Recalcula el rollup de un hábito y mes ya consolidados (completado atrasado)."""
+    next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    totals = HabitLog.objects.filter(habit_id=habit_id, completed=True, date__gte=month, date__lt=next_month).aggregate(
+        completions=Count("id"),
+        points=Sum("points_awarded"),
+        first_day=Min("date"),
+        last_day=Max("date"),
+    )
+    if totals["completions"]:
+        HabitMonthlyRollup.objects.update_or_create(habit_id=habit_id, month=month, defaults=totals)
+    else:
+        HabitMonthlyRollup.objects.filter(habit_id=habit_id, month=month).delete()
+
+
+def archived_until() -> Optional[date]:
+    """Fin del último rango archivado: antes de esa fecha los rollups no se pueden rehacer."""
+    return LogArchive.objects.aggregate(end=Max("end"))["end"]
+
+
+def _aggregate_months(logs, batch_size: int):
+    return (
+        logs.filter(completed=True)
+        .annotate(month=TruncMonth("date"))
+        .order_by()
+        .values("habit_id", "month")
+        .annotate(
+            completions=Count("id"),
+            points=Sum("points_awarded"),
+            first_day=Min("date"),
+            last_day=Max("date"),
+        )
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def rollup_range(start: date, end: date, batch_size: int = 5000) -> int:
+    """Rehace los rollups de los meses en [start, end) (ambos primer día de mes)."""
+    with transaction.atomic():
+        HabitMonthlyRollup.objects.filter(month__gte=start, month__lt=end).delete()
+        rows = _aggregate_months(HabitLog.objects.filter(date__gte=start, date__lt=end), batch_size)
+        created = HabitMonthlyRollup.objects.bulk_create(
+            (HabitMonthlyRollup(**row) for row in rows), batch_size=batch_size
+        )
+    return len(created)
+
+
+def rebuild_monthly_rollups(until: date, batch_size: int = 5000) -> int:
+    """Reconstruye los rollups de todos los meses anteriores a ``until`` (primer día de mes).
+
+    Los meses archivados (sus logs ya no están en la tabla) se conservan tal cual.
+    """
+    since = archived_until()
+    logs = HabitLog.objects.filter(date__lt=until)
+    existing = HabitMonthlyRollup.objects.all()
+    if since is not None:
+        logs, existing = logs.filter(date__gte=since), existing.filter(month__gte=since)
+    aggregated = _aggregate_months(logs, batch_size)
+    created = 0
+    with transaction.atomic():
+        existing.delete()
+        batch = []
+        for row in aggregated:
+            batch.append(HabitMonthlyRollup(**row))
+            if len(batch) >= batch_size:
+                HabitMonthlyRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        HabitMonthlyRollup.objects.bulk_create(batch)
+        created += len(batch)
+    return created
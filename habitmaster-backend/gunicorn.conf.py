@@ -0,0 +1,24 @@
+"""
+Configuración de gunicorn: modo preload + fork.
+
+La aplicación Django se carga y precalienta una sola vez en el proceso maestro;
+los workers la heredan copy-on-write en lugar de importarla cada uno.
+"""
+import os
+
+preload_app = True
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+
+def when_ready(server):
+    from habitmaster_backend.warmup import warm_up
+
+    warm_up()
+
+
+def post_fork(server, worker):
+    # Por si algo abrió conexiones en el maestro: cada worker usa las suyas
+    from django.db import connections
+
+    connections.close_all()
@@ -0,0 +1,144 @@
+"""
+Enrutamiento primario/réplica.
+
+Las lecturas van al primario salvo que se ejecuten dentro de ``use_replica``.
+Dentro de ese contexto se usa una réplica sana, excepto si el usuario escribió
+hace poco (queda "fijado" al primario) o si hay una transacción abierta.
+
+El pin vive en la caché de Django: con réplicas tiene que ser compartida entre
+workers (``CACHE_BACKEND=database``); si no, otro worker no lo ve y lee de una
+réplica que aún no tiene la escritura.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_wrote = ContextVar("wrote", default=False)
+
+# alias -> (timestamp de la medición, retraso en segundos)
+_lag_cache = {}
+LAG_CHECK_INTERVAL = 10
+# app_label del modelo interno de DatabaseCache
+CACHE_APP_LABEL = "django_cache"
+LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def _pin_key(user_id) -> str:
+    return f"db-pin:{user_id}"
+
+
+def pin_to_primary(user) -> None:
+    """Fija las lecturas del usuario al primario durante la ventana configurada."""
+    seconds = getattr(settings, "DATABASE_REPLICA_PIN_SECONDS", 0)
+    if user is not None and user.is_authenticated and seconds:
+        cache.set(_pin_key(user.pk), True, seconds)
+
+
+def is_pinned(user) -> bool:
+    if user is None or not user.is_authenticated:
+        return False
+    return bool(cache.get(_pin_key(user.pk)))
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Con réplicas, una caché por proceso pierde el pin entre workers."""
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if getattr(settings, "DATABASE_REPLICAS", None) and backend in LOCAL_CACHES:
+        return [
+            checks.Error(
+                "DATABASE_REPLICA_URLS requiere una caché compartida entre workers.",
+                hint="CACHE_BACKEND=database y python manage.py createcachetable.",
+                id="habitmaster.E001",
+            )
+        ]
+    return []
+
+
+def _replica_lag(alias: str) -> float:
+    """Retraso de replicación en segundos (solo Postgres, cacheado unos segundos)."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    checked_at, lag = _lag_cache.get(alias, (0.0, 0.0))
+    if time.monotonic() - checked_at < LAG_CHECK_INTERVAL:
+        return lag
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+            )
+            lag = float(cursor.fetchone()[0])
+    except Exception:
+        lag = float("inf")
+    _lag_cache[alias] = (time.monotonic(), lag)
+    return lag
+
+
+def healthy_replicas() -> list:
+    max_lag = getattr(settings, "DATABASE_REPLICA_MAX_LAG", 0)
+    replicas = list(getattr(settings, "DATABASE_REPLICAS", []))
+    if not max_lag:
+        return replicas
+    return [alias for alias in replicas if _replica_lag(alias) <= max_lag]
+
+
+@contextmanager
+def use_replica(user=None):
+    """Permite que las lecturas seguras de este bloque vayan a una réplica."""
+    if is_pinned(user):
+        yield
+        return
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # La caché en base de datos (pins, rankings) se lee siempre del primario
+        if not _replica_reads.get() or model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        # Lecturas dentro de transaction.atomic deben ver sus propias escrituras
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Tras una petición que escribió, fija al usuario al primario unos segundos."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                pin_to_primary(getattr(request, "user", None))
+            return response
+        finally:
+            _wrote.reset(token)
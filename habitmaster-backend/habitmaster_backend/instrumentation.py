@@ -0,0 +1,40 @@
+"""
+Métricas internas de la aplicación (pool de conexiones, etc.).
+"""
+from typing import Dict
+
+from django.db import connections
+
+
+def database_pool_metrics() -> Dict[str, Dict]:
+    """Estado de los pools psycopg3 por alias de base de datos.
+
+    Los alias sin pool (SQLite, Postgres sin DATABASE_POOL) reportan ``pooled: False``.
+    """
+    metrics = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is None:
+            metrics[alias] = {"pooled": False}
+            continue
+        stats = pool.get_stats()
+        size = stats.get("pool_size", 0)
+        idle = stats.get("pool_available", 0)
+        requests = stats.get("requests_num", 0)
+        metrics[alias] = {
+            "pooled": True,
+            "min_size": stats.get("pool_min", 0),
+            "max_size": stats.get("pool_max", 0),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiting": stats.get("requests_waiting", 0),
+            "requests": requests,
+            "wait_ms_total": stats.get("requests_wait_ms", 0),
+            "wait_ms_avg": stats.get("requests_wait_ms", 0) / requests if requests else 0.0,
+            "acquire_failures": stats.get("requests_errors", 0),
+            "connections_opened": stats.get("connections_num", 0),
+            "connection_setup_ms_total": stats.get("connections_ms", 0),
+            "connection_errors": stats.get("connections_errors", 0),
+        }
+    return metrics
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import dj_database_url
 from dotenv import load_dotenv
@@ -66,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'habitmaster_backend.db_router.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'habitmaster_backend.urls'
@@ -99,14 +101,92 @@ if not DATABASE_URL:
         "DATABASE_URL no está configurada. Por favor, configúrala en el archivo .env"
     )
 
-DATABASES = {
-    'default': dj_database_url.config(
-        default=DATABASE_URL,
-        conn_max_age=600,
-        ssl_require=True,
+# Pool de conexiones psycopg3 (Django 5.2). Con DATABASE_POOL=True los hilos de
+# gunicorn comparten un pool por proceso en lugar de una conexión persistente cada uno.
+DATABASE_POOL = os.getenv("DATABASE_POOL", "False") == "True"
+DATABASE_POOL_OPTIONS = {
+    "min_size": int(os.getenv("DATABASE_POOL_MIN_SIZE", "2")),
+    "max_size": int(os.getenv("DATABASE_POOL_MAX_SIZE", "10")),
+    # Segundos máximos esperando una conexión libre antes de fallar
+    "timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", "10")),
+    "max_idle": float(os.getenv("DATABASE_POOL_MAX_IDLE", "300")),
+}
+
+
+# Neon exige SSL; solo se desactiva para un Postgres local o de CI
+DATABASE_SSL_REQUIRE = os.getenv("DATABASE_SSL_REQUIRE", "True") == "True"
+# Auto: se detecta por el host de Neon (``-pooler``); True/False lo fuerza
+DATABASE_BEHIND_POOLER = os.getenv("DATABASE_BEHIND_POOLER", "auto")
+
+
+def _behind_pooler(url: str) -> bool:
+    if DATABASE_BEHIND_POOLER != "auto":
+        return DATABASE_BEHIND_POOLER == "True"
+    return "-pooler" in (urlsplit(url).hostname or "")
+
+
+def _database_config(url: str) -> dict:
+    """SSL solo aplica a Postgres; SQLite se usa para pruebas locales."""
+    is_postgres = url.startswith(("postgres://", "postgresql://"))
+    pooled = DATABASE_POOL and is_postgres
+    config = dj_database_url.parse(
+        url,
+        # El pool gestiona la vida de las conexiones; Django exige CONN_MAX_AGE=0
+        conn_max_age=0 if pooled else 600,
+        conn_health_checks=True,
+        ssl_require=is_postgres and DATABASE_SSL_REQUIRE,
     )
+    if pooled:
+        config["OPTIONS"]["pool"] = dict(DATABASE_POOL_OPTIONS)
+    if is_postgres and _behind_pooler(url):
+        # Un pooler en modo transacción no conserva cursores con nombre entre
+        # transacciones: .iterator() usaría cursores de cliente en su lugar.
+        config["DISABLE_SERVER_SIDE_CURSORS"] = True
+    if url.startswith("sqlite"):
+        # Evita "database is locked" al pasar de lectura a escritura con concurrencia
+        config.setdefault("OPTIONS", {}).update(transaction_mode="IMMEDIATE", timeout=20)
+    return config
+
+
+DATABASES = {
+    'default': _database_config(DATABASE_URL),
 }
 
+# Réplicas de lectura opcionales (separadas por coma).
+# Ej: DATABASE_REPLICA_URLS=postgresql://...replica1,postgresql://...replica2
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(",")), start=1):
+    alias = f"replica_{index}"
+    DATABASES[alias] = _database_config(replica_url.strip())
+    # En tests las réplicas apuntan a la misma base que el primario
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['habitmaster_backend.db_router.PrimaryReplicaRouter']
+
+# Segundos que las lecturas de un usuario quedan fijadas al primario tras escribir
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv("DATABASE_REPLICA_PIN_SECONDS", "5"))
+# Retraso máximo tolerado (segundos) antes de descartar una réplica; 0 desactiva el chequeo
+DATABASE_REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))
+
+# Caché de Django. "locmem" es por proceso: cada worker de gunicorn ve la suya, así
+# que el pin al primario tras escribir solo funciona con una caché compartida.
+# "database" usa una tabla del primario (crearla con python manage.py createcachetable);
+# es obligatoria con DATABASE_REPLICA_URLS (check habitmaster.E001).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_TABLE = "habitmaster_cache"
+if CACHE_BACKEND == "database":
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': CACHE_TABLE,
+        }
+    }
+elif CACHE_BACKEND == "locmem":
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    raise ValueError(f"CACHE_BACKEND debe ser 'locmem' o 'database', no {CACHE_BACKEND!r}")
+
 # Authentication URLs
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "dashboard"
@@ -185,8 +265,27 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Proxies de confianza delante de Django (p. ej. 1 con Nginx). Con 0 la IP de los
+    # límites por IP es REMOTE_ADDR: un X-Forwarded-For enviado por el cliente no cuenta.
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", "0")),
+    # Token buckets "<scope>.<user|ip|global>" (ver habitmaster_backend/throttling.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'complete.user': os.getenv("THROTTLE_COMPLETE_USER", "30/min"),
+        'complete.global': os.getenv("THROTTLE_COMPLETE_GLOBAL", "1200/min"),
+        'register.ip': os.getenv("THROTTLE_REGISTER_IP", "5/min"),
+        'login.ip': os.getenv("THROTTLE_LOGIN_IP", "20/min"),
+    },
 }
 
+# "database" (tabla compartida por todos los workers y hosts, atómico), "sqlite"
+# (fichero local compartido entre procesos del host, atómico) o "cache" (caché de
+# Django, no atómico; con locmem cada worker tiene sus cubos)
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "database")
+THROTTLE_SQLITE_PATH = os.getenv("THROTTLE_SQLITE_PATH", str(BASE_DIR / "throttle.sqlite3"))
+# Filas en que se reparte cada cubo global (p. ej. complete.global), con la tasa
+# dividida entre ellas; evita que todas las completaciones esperen el mismo bloqueo
+THROTTLE_GLOBAL_SHARDS = int(os.getenv("THROTTLE_GLOBAL_SHARDS", "8"))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'HabitMaster Backend API',
     'DESCRIPTION': 'API imperativa, funcional y declarativa para la gestión de hábitos.',
@@ -204,3 +303,12 @@ SIMPLE_JWT = {
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Los índices con INCLUDE (PointsLedger) solo cubren columnas en Postgres; en SQLite
+# se crean sin ellas, que es lo esperado en desarrollo.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Trabajo derivado de cada completado (rachas, logros, nivel, rankings):
+# "inline" en la misma petición o "queue" en la cola de la base de datos
+# (requiere un worker: python manage.py run_jobs).
+COMPLETION_DERIVED_WORK = os.getenv("COMPLETION_DERIVED_WORK", "inline")
@@ -0,0 +1,221 @@
+"""
+Limitación de peticiones con token buckets.
+
+Cada clave (scope + usuario, IP o global) tiene un cubo de ``capacity`` fichas que
+se rellena a ``capacity / periodo`` fichas por segundo; cada petición gasta una.
+Las tasas salen de ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`` con claves
+``"<scope>.<user|ip|global>"`` (p. ej. ``"complete.user": "30/min"``).
+
+Los cubos globales se reparten en ``THROTTLE_GLOBAL_SHARDS`` claves con la tasa
+dividida entre ellas: cada petición gasta de una al azar, así que las peticiones
+concurrentes no esperan todas el bloqueo de la misma fila.
+
+Almacenes:
+- ``database`` (por defecto): tabla ``ThrottleBucket`` en la base de datos
+  principal, compartida por todos los workers y hosts; cada consumo es un único
+  UPSERT atómico.
+- ``sqlite``: fichero local compartido por todos los procesos del host, mismo
+  UPSERT; no se comparte entre hosts.
+- ``cache``: caché de Django; lectura-escritura sin bloqueo, puede admitir alguna
+  petición de más bajo concurrencia alta. Con la caché local (``locmem``) cada
+  worker tiene sus propios cubos: solo para desarrollo.
+"""
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    capacity: int
+    refill_per_second: float
+
+    @classmethod
+    def parse(cls, rate: str) -> "Rate":
+        """``"30/min"`` -> 30 fichas que se reponen en un minuto."""
+        count, period = rate.split("/")
+        return cls(int(count), int(count) / PERIODS[period.strip()[0]])
+
+    def split(self, parts: int) -> "Rate":
+        """Tasa de cada uno de ``parts`` cubos que juntos suman esta."""
+        return Rate(max(1, self.capacity // parts), self.refill_per_second / parts)
+
+
+class SQLiteBucketStore:
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS buckets ("
+        "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+    )
+    # Rellena y consume en una sola sentencia; sin fila devuelta = sin fichas
+    CONSUME = (
+        "INSERT INTO buckets (key, tokens, updated) VALUES (:key, :capacity - 1, :now) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "tokens = MIN(:capacity, tokens + (:now - updated) * :refill) - 1, updated = :now "
+        "WHERE MIN(:capacity, tokens + (:now - updated) * :refill) >= 1 "
+        "RETURNING tokens"
+    )
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def consume(self, key: str, rate: Rate, now: float) -> Tuple[bool, float]:
+        connection = self._connection()
+        params = {"key": key, "capacity": rate.capacity, "refill": rate.refill_per_second, "now": now}
+        if connection.execute(self.CONSUME, params).fetchone() is not None:
+            return True, 0.0
+        tokens, updated = connection.execute(
+            "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+        ).fetchone()
+        available = min(rate.capacity, tokens + (now - updated) * rate.refill_per_second)
+        return False, (1 - available) / rate.refill_per_second
+
+
+class DatabaseBucketStore:
+    """Cubos en la tabla ``ThrottleBucket``; el UPSERT vale para Postgres y SQLite."""
+
+    # Filas sin tocar en un día están llenas en cualquier tasa: equivalen a no tener fila
+    PURGE_AFTER = PERIODS["d"]
+    PURGE_EVERY = 1000
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        from habits.models import ThrottleBucket
+
+        self.using = using
+        self.table = ThrottleBucket._meta.db_table
+        self._calls = 0
+
+    def consume(self, key: str, rate: Rate, now: float) -> Tuple[bool, float]:
+        connection = connections[self.using]
+        table = connection.ops.quote_name(self.table)
+        capacity, refill = float(rate.capacity), rate.refill_per_second
+        available = f"{table}.tokens + (%s - {table}.updated) * %s"
+        self._calls += 1
+        with connection.cursor() as cursor:
+            if self._calls % self.PURGE_EVERY == 0:
+                cursor.execute(f"DELETE FROM {table} WHERE updated < %s", [now - self.PURGE_AFTER])
+            cursor.execute(
+                f"INSERT INTO {table} (key, tokens, updated) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (key) DO UPDATE SET "
+                f"tokens = CASE WHEN {available} > %s THEN %s ELSE {available} END - 1, updated = %s "
+                f"WHERE {available} >= 1 "
+                f"RETURNING tokens",
+                [key, capacity - 1, now, now, refill, capacity, capacity, now, refill, now, now, refill],
+            )
+            if cursor.fetchone() is not None:
+                return True, 0.0
+            cursor.execute(f"SELECT tokens, updated FROM {table} WHERE key = %s", [key])
+            tokens, updated = cursor.fetchone()
+        available = min(rate.capacity, tokens + (now - updated) * refill)
+        return False, (1 - available) / refill
+
+
+class CacheBucketStore:
+    def consume(self, key: str, rate: Rate, now: float) -> Tuple[bool, float]:
+        cache_key = f"throttle:{key}"
+        tokens, updated = cache.get(cache_key, (rate.capacity, now))
+        tokens = min(rate.capacity, tokens + (now - updated) * rate.refill_per_second)
+        timeout = int(rate.capacity / rate.refill_per_second) + 1
+        if tokens >= 1:
+            cache.set(cache_key, (tokens - 1, now), timeout)
+            return True, 0.0
+        cache.set(cache_key, (tokens, now), timeout)
+        return False, (1 - tokens) / rate.refill_per_second
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        backend = getattr(settings, "THROTTLE_BACKEND", "database")
+        if backend == "sqlite":
+            _store = SQLiteBucketStore(settings.THROTTLE_SQLITE_PATH)
+        elif backend == "cache":
+            _store = CacheBucketStore()
+        else:
+            _store = DatabaseBucketStore()
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle DRF; las subclases fijan ``scope`` y ``kind`` (user, ip o global)."""
+
+    scope: Optional[str] = None
+    kind = "user"
+
+    def get_shards(self) -> int:
+        return getattr(settings, "THROTTLE_GLOBAL_SHARDS", 1) if self.kind == "global" else 1
+
+    def get_rate(self) -> Optional[Rate]:
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f"{self.scope}.{self.kind}")
+        if not rate:
+            return None
+        shards = self.get_shards()
+        return Rate.parse(rate).split(shards) if shards > 1 else Rate.parse(rate)
+
+    def get_key(self, request) -> str:
+        if self.kind == "global":
+            shards = self.get_shards()
+            ident = f"all:{random.randrange(shards)}" if shards > 1 else "all"
+        elif self.kind == "user" and request.user and request.user.is_authenticated:
+            ident = f"u{request.user.pk}"
+        else:
+            ident = f"ip{self.get_ident(request)}"
+        return f"{self.scope}.{self.kind}:{ident}"
+
+    def allow_request(self, request, view):
+        self._wait = None
+        rate = self.get_rate()
+        if rate is None:
+            return True
+        # DRF evalúa todos los throttles: una petición ya rechazada por su usuario/IP
+        # no debe gastar fichas del cubo global de los demás.
+        if self.kind == "global" and getattr(request, "_token_bucket_denied", False):
+            return True
+        allowed, wait = get_store().consume(self.get_key(request), rate, time.time())
+        if not allowed:
+            self._wait = wait
+            request._token_bucket_denied = True
+        return allowed
+
+    def wait(self):
+        # DRF lo usa para la cabecera Retry-After
+        return self._wait
+
+
+class CompleteUserThrottle(TokenBucketThrottle):
+    scope, kind = "complete", "user"
+
+
+class CompleteGlobalThrottle(TokenBucketThrottle):
+    scope, kind = "complete", "global"
+
+
+class RegisterIPThrottle(TokenBucketThrottle):
+    scope, kind = "register", "ip"
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    scope, kind = "login", "ip"
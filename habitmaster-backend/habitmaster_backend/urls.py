@@ -11,17 +11,20 @@ from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from habitmaster_backend.throttling import LoginIPThrottle
 from ui.views import ReactAppView
 
+login_view = TokenObtainPairView.as_view(throttle_classes=[LoginIPThrottle])
+
 urlpatterns = [
     # --- Admin ---
     path("admin/", admin.site.urls),
     
     # --- JWT API ---
-    path("api/auth/login/", TokenObtainPairView.as_view(), name="jwt-login"),
+    path("api/auth/login/", login_view, name="jwt-login"),
     path("api/auth/refresh/", TokenRefreshView.as_view(), name="jwt-refresh"),
     # Compatibilidad con rutas alternativas
-    path("auth/login/", TokenObtainPairView.as_view(), name="jwt-login-alt"),
+    path("auth/login/", login_view, name="jwt-login-alt"),
     path("auth/refresh/", TokenRefreshView.as_view(), name="jwt-refresh-alt"),
 
     # --- API ---
@@ -0,0 +1,22 @@
+"""
+Precalentamiento del proceso antes de hacer fork de los workers (gunicorn --preload).
+
+Todo lo que se carga aquí queda compartido copy-on-write entre workers. No debe
+abrir conexiones a la base de datos: no son seguras tras un fork.
+"""
+import gc
+
+from django.db import connections
+from django.urls import get_resolver
+
+
+def warm_up() -> None:
+    # Importa URLconf, vistas, serializers y controlador (normalmente en la 1ª petición)
+    get_resolver().url_patterns
+    from logic_rules import rules
+
+    rules.warm_up()
+    connections.close_all()
+    # Mueve los objetos actuales a la generación permanente: el GC de los workers
+    # no los recorre y no ensucia las páginas compartidas.
+    gc.freeze()
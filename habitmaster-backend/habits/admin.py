@@ -1,29 +1,116 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-from .models import Achievement, Habit, HabitLog, UserProfile
+from .models import Achievement, AchievementRule, Habit, HabitLog, Job, PointsLedger, UserProfile
+
+# Por encima de estas filas (según las estadísticas de Postgres) no se hace COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+def estimated_rows(connection, table: str) -> int:
+    """Filas según pg_class; en tablas particionadas suma las particiones."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0) FROM pg_class c
+            WHERE c.relkind = 'r' AND (
+                c.oid = to_regclass(%s)
+                OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))
+            )
+            """,
+            [table, table],
+        )
+        return int(cursor.fetchone()[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Sin filtros ni búsqueda, en tablas grandes el total es la estimación del planificador."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            estimate = estimated_rows(connection, queryset.model._meta.db_table)
+            if estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Listados de tablas grandes: total estimado y sin el segundo COUNT(*) al filtrar."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Habit)
-class HabitAdmin(admin.ModelAdmin):
+class HabitAdmin(LargeTableAdmin):
     list_display = ("name", "user", "periodicity", "points_value", "difficulty")
-    search_fields = ("name", "user__username")
+    list_select_related = ("user",)
+    # Usuario por prefijo; nombre con índice trigram en Postgres (migración 0014)
+    search_fields = ("name", "^user__username")
     list_filter = ("periodicity", "difficulty")
+    raw_id_fields = ("user",)
 
 
 @admin.register(HabitLog)
-class HabitLogAdmin(admin.ModelAdmin):
+class HabitLogAdmin(LargeTableAdmin):
     list_display = ("habit", "date", "completed", "points_awarded")
-    search_fields = ("habit__name", "habit__user__username")
+    # str(habit) incluye el usuario
+    list_select_related = ("habit__user",)
+    search_fields = ("habit__name", "^habit__user__username")
     list_filter = ("completed",)
+    date_hierarchy = "date"
+    raw_id_fields = ("habit",)
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdmin):
     list_display = ("user", "level", "total_points", "current_streak", "longest_streak")
-    search_fields = ("user__username",)
+    list_select_related = ("user",)
+    search_fields = ("^user__username",)
+    raw_id_fields = ("user",)
 
 
 @admin.register(Achievement)
-class AchievementAdmin(admin.ModelAdmin):
+class AchievementAdmin(LargeTableAdmin):
     list_display = ("user", "code", "name", "earned_on")
-    search_fields = ("user__username", "code")
+    list_select_related = ("user",)
+    search_fields = ("^user__username", "code")
+    date_hierarchy = "earned_on"
+    raw_id_fields = ("user",)
+
+
+@admin.register(AchievementRule)
+class AchievementRuleAdmin(admin.ModelAdmin):
+    list_display = ("code", "name", "metric", "comparison", "threshold", "difficulty", "bit", "active")
+    list_filter = ("metric", "active")
+    search_fields = ("code", "name")
+
+
+@admin.register(PointsLedger)
+class PointsLedgerAdmin(LargeTableAdmin):
+    list_display = ("user", "date", "delta", "balance", "reason", "habit", "created_at")
+    list_select_related = ("user", "habit__user")
+    list_filter = ("reason",)
+    search_fields = ("^user__username",)
+    date_hierarchy = "date"
+
+    # Solo lectura: los movimientos se registran con controller.points.record
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ("kind", "status", "attempts", "run_after", "locked_by", "finished_at")
+    list_filter = ("status", "kind")
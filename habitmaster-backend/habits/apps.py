@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class HabitsConfig(AppConfig):
@@ -6,4 +7,7 @@ class HabitsConfig(AppConfig):
     name = 'habits'
 
     def ready(self):
-        from . import signals  # noqa
\ No newline at end of file
+        from . import signals  # noqa
+        from habitmaster_backend.db_router import check_shared_cache
+
+        checks.register(check_shared_cache, checks.Tags.caches)
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Búsqueda de texto completo sobre nombre y descripción de los hábitos.
+
+Postgres: columna ``search_vector`` (tsvector, configuración ``spanish``, nombre
+con peso A y descripción con peso B) con índice GIN, mantenida por un trigger
+``BEFORE INSERT OR UPDATE OF name, description``; los UPDATE de rachas no la
+recalculan. Se ordena por ``ts_rank_cd``. Texto y consulta se indexan sin tildes
+(``translate``, sin depender de la extensión unaccent), igual que en SQLite.
+
+SQLite: tabla FTS5 sin contenido ``habits_habit_fts`` (nombre, descripción y el
+dueño como token ``u<id>``) sincronizada con triggers e índices de prefijo; se
+ordena por ``bm25``. Si una migración rehace ``habits_habit`` en
+SQLite (ALTER no soportado) se pierden los triggers: ``rebuild_habit_search``
+los vuelve a crear.
+
+Todas las palabras de la consulta deben aparecer; la última se busca como
+prefijo (búsqueda mientras se escribe). Las expansiones de prefijo no pueden
+saltar por la lista de documentos, así que aplicarlas a todas las palabras hacía
+las consultas con palabras frecuentes varias veces más lentas.
+Nada de esto está en el estado de Django: la columna y la tabla las crea la
+migración 0016 con ``install``.
+"""
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+TABLE = "habits_habit"
+FTS_TABLE = f"{TABLE}_fts"
+PG_CONFIG = "spanish"
+# Peso del nombre frente a la descripción en bm25 (SQLite)
+NAME_WEIGHT, DESCRIPTION_WEIGHT = 10.0, 1.0
+MAX_TERMS = 8
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Plegado de tildes en Postgres; equivale a remove_diacritics de FTS5 y a _fold
+_ACCENTED, _PLAIN = "áàâäéèêëíìîïóòôöúùûüñç", "aaaaeeeeiiiioooouuuunc"
+
+
+def _pg_fold(column: str) -> str:
+    return f"translate(lower(coalesce({column}, '')), '{_ACCENTED}', '{_PLAIN}')"
+
+
+_PG_INSTALL = [
+    f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""
+    CREATE OR REPLACE FUNCTION habit_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{PG_CONFIG}', {_pg_fold("NEW.name")}), 'A')
+            || setweight(to_tsvector('{PG_CONFIG}', {_pg_fold("NEW.description")}), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS habit_search_vector_trg ON {TABLE}",
+    f"""
+    CREATE TRIGGER habit_search_vector_trg BEFORE INSERT OR UPDATE OF name, description ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION habit_search_vector()
+    """,
+]
+_PG_REBUILD = [
+    f"""
+    UPDATE {TABLE} SET search_vector =
+        setweight(to_tsvector('{PG_CONFIG}', {_pg_fold("name")}), 'A')
+        || setweight(to_tsvector('{PG_CONFIG}', {_pg_fold("description")}), 'B')
+    """,
+    # Tras rellenar: construir el GIN una vez es mucho más rápido que mantenerlo fila a fila
+    f"CREATE INDEX IF NOT EXISTS habit_search_idx ON {TABLE} USING gin (search_vector)",
+]
+_PG_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS habit_search_vector_trg ON {TABLE}",
+    "DROP FUNCTION IF EXISTS habit_search_vector()",
+    "DROP INDEX IF EXISTS habit_search_idx",
+    f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+_OWNER = "'u' || {row}.user_id"
+_SQLITE_INSTALL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, owner, content='', prefix='2 3 4',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_fts_insert AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, description, owner)
+        VALUES (new.id, new.name, new.description, {_OWNER.format(row="new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_fts_delete AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, description, owner)
+        VALUES ('delete', old.id, old.name, old.description, {_OWNER.format(row="old")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_fts_update AFTER UPDATE OF name, description, user_id ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, description, owner)
+        VALUES ('delete', old.id, old.name, old.description, {_OWNER.format(row="old")});
+        INSERT INTO {FTS_TABLE} (rowid, name, description, owner)
+        VALUES (new.id, new.name, new.description, {_OWNER.format(row="new")});
+    END
+    """,
+]
+_SQLITE_REBUILD = [
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')",
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, owner)
+    SELECT id, name, description, {_OWNER.format(row=TABLE)} FROM {TABLE}
+    """,
+]
+_SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS habit_fts_insert",
+    "DROP TRIGGER IF EXISTS habit_fts_delete",
+    "DROP TRIGGER IF EXISTS habit_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def supported(connection) -> bool:
+    return connection.vendor in ("postgresql", "sqlite")
+
+
+def _run(connection, statements) -> None:
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install(connection) -> None:
+    """Crea columna/tabla, triggers e índice y rellena con los hábitos existentes."""
+    if connection.vendor == "postgresql":
+        _run(connection, _PG_INSTALL + _PG_REBUILD)
+    elif connection.vendor == "sqlite":
+        _run(connection, _SQLITE_INSTALL + _SQLITE_REBUILD)
+
+
+def rebuild(connection) -> None:
+    """Borra y vuelve a crear triggers e índice desde la tabla (también aplica cambios de definición)."""
+    uninstall(connection)
+    install(connection)
+
+
+def uninstall(connection) -> None:
+    if connection.vendor == "postgresql":
+        _run(connection, _PG_UNINSTALL)
+    elif connection.vendor == "sqlite":
+        _run(connection, _SQLITE_UNINSTALL)
+
+
+def terms(query: str) -> List[str]:
+    return _WORD.findall(query.lower())[:MAX_TERMS]
+
+
+def search(
+    connection, query: str, user_id: Optional[int] = None, limit: int = 20, offset: int = 0
+) -> List[Tuple[int, float]]:
+    """(id, relevancia) de los hábitos que contienen todas las palabras, de más a menos relevante."""
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor == "postgresql":
+        words = [_fold(word) for word in words]
+        scope = "AND h.user_id = %s" if user_id is not None else ""
+        sql = f"""
+            SELECT h.id, ts_rank_cd(h.search_vector, q) AS rank
+            FROM {TABLE} h, to_tsquery('{PG_CONFIG}', %s) q
+            WHERE h.search_vector @@ q {scope}
+            ORDER BY rank DESC, h.id
+            LIMIT %s OFFSET %s
+        """
+        params = [" & ".join(words[:-1] + [f"{words[-1]}:*"])] + ([user_id] if user_id is not None else [])
+    elif user_id is not None:
+        return _search_user_sqlite(connection, words, user_id, limit, offset)
+    else:
+        # bm25 es negativo: más pequeño, más relevante; el dueño no puntúa
+        sql = f"""
+            SELECT rowid, -bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}, 0.0) AS rank
+            FROM {FTS_TABLE}
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY rank DESC, rowid
+            LIMIT %s OFFSET %s
+        """
+        params = [_fts_match(words)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit, offset])
+        return [(habit_id, float(rank)) for habit_id, rank in cursor.fetchall()]
+
+
+def _fts_match(words: List[str]) -> str:
+    return " ".join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+
+
+def _fold(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+
+
+def _score(words: List[str], name: str, description: str) -> float:
+    """Coincidencias por campo con su peso, normalizadas por longitud (bm25 sin IDF)."""
+    score = 0.0
+    for weight, text in ((NAME_WEIGHT, name), (DESCRIPTION_WEIGHT, description)):
+        tokens = _WORD.findall(_fold(text))
+        hits = sum(1 for token in tokens for word in words if token.startswith(word))
+        score += weight * hits / (1 + len(tokens)) ** 0.5
+    return score
+
+
+def _search_user_sqlite(connection, words, user_id, limit, offset) -> List[Tuple[int, float]]:
+    """Búsqueda de un usuario en SQLite.
+
+    El dueño es un token más, así que el MATCH solo cruza listas dentro de FTS5 y
+    el prefijo final se comprueba aquí sobre los hábitos del usuario (expandirlo
+    en FTS5 lee la lista entera de la palabra). Tampoco se ordena con bm25: su IDF
+    recorre toda la tabla. Los candidatos de un usuario son pocos y se puntúan aquí.
+    """
+    match = " AND ".join([f"owner : u{user_id}"] + [f'"{word}"' for word in words[:-1]])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT h.id, h.name, h.description
+            FROM {FTS_TABLE} JOIN {TABLE} h ON h.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            """,
+            [match],
+        )
+        rows = cursor.fetchall()
+    folded = [_fold(word) for word in words]
+    ranked = []
+    for habit_id, name, description in rows:
+        tokens = _WORD.findall(_fold(f"{name} {description}"))
+        if any(token.startswith(folded[-1]) for token in tokens):
+            ranked.append((habit_id, _score(folded, name, description)))
+    ranked.sort(key=lambda item: (-item[1], item[0]))
+    return ranked[offset:offset + limit]
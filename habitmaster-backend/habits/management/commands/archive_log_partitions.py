@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from habits import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva las particiones de HabitLog anteriores a un corte: consolida sus meses en "
+        "HabitMonthlyRollup y las vuelca a CSV comprimido o las deja como tabla fría"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before", help="Fecha (YYYY-MM-DD): se archivan las particiones que terminan antes; por defecto hace 24 meses"
+        )
+        parser.add_argument("--mode", choices=["file", "table"], default="file")
+        parser.add_argument("--directory", default="log_archive", help="Destino de los ficheros en --mode file")
+        parser.add_argument("--dry-run", action="store_true", help="Listar lo que se archivaría")
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            self.stdout.write(f"El archivado de HabitLog solo aplica en Postgres (base actual: {connection.vendor}).")
+            return
+        if not partitions.is_partitioned(connection):
+            raise CommandError(f"{partitions.TABLE} no está particionada; aplica antes las migraciones.")
+        today = timezone.localdate()
+        cutoff = today.replace(year=today.year - 2, day=1)
+        if options["before"]:
+            try:
+                cutoff = date.fromisoformat(options["before"])
+            except ValueError as exc:
+                raise CommandError("--before debe tener formato YYYY-MM-DD") from exc
+        # Nunca el mes en curso ni el anterior: aún admiten completados atrasados
+        previous_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        if cutoff > previous_month:
+            raise CommandError("--before no puede caer en los dos últimos meses.")
+
+        cold = [partition for partition in partitions.list_partitions(connection) if partition["end"] <= cutoff]
+        if not cold:
+            self.stdout.write(self.style.SUCCESS(f"Ninguna partición termina antes de {cutoff}."))
+            return
+        archived_rows = 0
+        for partition in cold:
+            if options["dry_run"]:
+                self.stdout.write(f"  {partition['name']}: {partition['start']} - {partition['end']} (~{partition['rows']} filas)")
+                archived_rows += partition["rows"]
+                continue
+            result = partitions.archive_partition(connection, partition, options["mode"], Path(options["directory"]))
+            archived_rows += result["rows"]
+            self.stdout.write(
+                f"  {result['partition']}: {result['rows']} logs, {result['rollups']} rollups → {result['location']}"
+            )
+        verb = "se archivarían" if options["dry_run"] else "archivadas"
+        approx = "~" if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{len(cold)} particiones {verb} ({approx}{archived_rows} logs)."))
@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+# Llamadas que hace la SPA al cargar sin /api/bootstrap/
+SEPARATE_CALLS = ("/api/profile/", "/api/habits/", "/api/logs/", "/api/achievements/", "/api/ranking/")
+
+
+class Command(BaseCommand):
+    help = "Compara latencia y consultas de /api/bootstrap/ frente a las cinco llamadas separadas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", default="demo")
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['username']} (prueba con seed_habits)")
+
+        # Autenticación JWT real: forma parte del coste que se repite por llamada
+        client = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        for label, paths in (("bootstrap", ("/api/bootstrap/",)), ("separadas", SEPARATE_CALLS)):
+            timings = []
+            # request_started vacía connection.queries, así que se cuentan con un wrapper
+            queries = []
+            with connection.execute_wrapper(self._counter(queries)):
+                self._load(client, paths)
+            for _ in range(options["iterations"]):
+                start = time.perf_counter()
+                self._load(client, paths)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f"{label:10} llamadas={len(paths)} consultas={len(queries)} "
+                f"p50={statistics.median(timings):.1f}ms p95={timings[int(len(timings) * 0.95) - 1]:.1f}ms"
+            )
+
+    def _load(self, client, paths):
+        for path in paths:
+            response = client.get(path)
+            if response.status_code != 200:
+                raise CommandError(f"{path} devolvió {response.status_code}")
+
+    def _counter(self, queries):
+        def wrapper(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        return wrapper
@@ -0,0 +1,90 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from controller import jobs
+from controller.app_controller import HabitController
+from habits.models import Habit, HabitLog, Job
+
+PREFIX = "bench_completion_"
+
+
+class FirstQueryClock:
+    """Marca la primera consulta de la transacción: desde ahí el hábito está bloqueado."""
+
+    def __init__(self):
+        self.first = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.first is None:
+            self.first = time.perf_counter()
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de complete_habit y tiempo con el hábito bloqueado, con el trabajo "
+        "derivado en la petición (inline) o en la cola (queue) más el coste del worker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--completions", type=int, default=300)
+        parser.add_argument("--habits", type=int, default=5, help="Hábitos del usuario de prueba")
+
+    def handle(self, *args, **options):
+        for mode in ("inline", "queue"):
+            user, habits = self._prepare(mode, options["habits"])
+            with override_settings(COMPLETION_DERIVED_WORK=mode):
+                latency, held = self._complete(user, habits, options["completions"])
+            self._print(mode, "petición", latency)
+            self._print(mode, "bloqueo", held)
+            if mode == "queue":
+                pending = Job.objects.filter(kind="habit.completion", status=Job.Status.PENDING).count()
+                start = time.perf_counter()
+                processed = jobs.drain(batch_size=100, worker="bench", timeout=600)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"queue  worker: {processed} trabajos ({pending} en cola) en {elapsed:.2f}s, "
+                    f"{elapsed / max(1, processed) * 1000:.2f} ms/trabajo"
+                )
+
+    def _prepare(self, mode, count):
+        """Usuario nuevo por modo, sin logs previos, para que ambos partan del mismo estado."""
+        User = get_user_model()
+        User.objects.filter(username=f"{PREFIX}{mode}").delete()
+        user = User.objects.create_user(username=f"{PREFIX}{mode}")
+        habits = Habit.objects.bulk_create([Habit(user=user, name=f"Bench {n}") for n in range(count)])
+        return user, [habit.pk for habit in habits]
+
+    def _complete(self, user, habits, completions):
+        controller = HabitController()
+        today = timezone.localdate()
+        latency, held = [], []
+        first_day = today - timedelta(days=completions // len(habits))
+        for n in range(completions):
+            # En orden cronológico, como en uso normal (sin recalcular rachas atrasadas)
+            habit_id = habits[n % len(habits)]
+            day = first_day + timedelta(days=n // len(habits))
+            clock = FirstQueryClock()
+            start = time.perf_counter()
+            with connection.execute_wrapper(clock):
+                controller.complete_habit(user, habit_id, day)
+            end = time.perf_counter()
+            latency.append((end - start) * 1000)
+            held.append((end - clock.first) * 1000)
+        assert HabitLog.objects.filter(habit__user=user).count() == completions
+        return latency, held
+
+    def _print(self, mode, label, values):
+        ordered = sorted(values)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        self.stdout.write(
+            f"{mode:6} {label:8}: p50={statistics.median(values):.2f}ms p95={p95:.2f}ms "
+            f"media={statistics.mean(values):.2f}ms"
+        )
@@ -0,0 +1,92 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from habitmaster_backend.instrumentation import database_pool_metrics
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el coste de obtener conexión y la latencia de cola bajo ráfagas. "
+        "Ejecutar con DATABASE_POOL=True y False para comparar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=32, help="Hilos concurrentes (ráfaga)")
+        parser.add_argument("--requests", type=int, default=50, help="Peticiones simuladas por hilo")
+        parser.add_argument("--database", default="default")
+        parser.add_argument(
+            "--fresh",
+            action="store_true",
+            help="Cerrar la conexión tras cada petición (equivale a CONN_MAX_AGE=0 sin pool)",
+        )
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options["threads"])
+
+        def worker():
+            barrier.wait()
+            local = []
+            for _ in range(options["requests"]):
+                # Reproduce el ciclo de una petición Django (request_started/finished)
+                close_old_connections()
+                start = time.perf_counter()
+                try:
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                        cursor.fetchone()
+                except Exception as exc:
+                    with lock:
+                        errors.append(str(exc))
+                else:
+                    local.append((time.perf_counter() - start) * 1000)
+                if options["fresh"]:
+                    connections[alias].close()
+                else:
+                    close_old_connections()
+            connections.close_all()
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not latencies:
+            self.stderr.write(self.style.ERROR(f"Todas las peticiones fallaron: {errors[:1]}"))
+            return
+
+        self.stdout.write(f"alias={alias} pooled={database_pool_metrics()[alias]['pooled']}")
+        self.stdout.write(f"peticiones={len(latencies)} errores={len(errors)} total={elapsed:.2f}s")
+        self.stdout.write(
+            "latencia ms: p50={:.2f} p95={:.2f} p99={:.2f} max={:.2f} media={:.2f}".format(
+                _percentile(latencies, 50),
+                _percentile(latencies, 95),
+                _percentile(latencies, 99),
+                max(latencies),
+                statistics.mean(latencies),
+            )
+        )
+        metrics = database_pool_metrics()[alias]
+        if metrics["pooled"]:
+            self.stdout.write(
+                "pool: conexiones abiertas={connections_opened} setup_ms={connection_setup_ms_total} "
+                "espera_media_ms={wait_ms_avg:.2f} fallos={acquire_failures}".format(**metrics)
+            )
@@ -0,0 +1,116 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from controller import leaderboards
+from habits.models import Group, GroupMembership, UserProfile
+
+PREFIX = "bench_group_"
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de los rankings de grupo (sin caché, con caché e invalidación) con "
+        "muchos grupos solapados de tamaños muy distintos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50_000)
+        parser.add_argument("--groups", type=int, default=2_000)
+        parser.add_argument("--max-size", type=int, default=20_000, help="Tamaño del grupo más grande")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--reuse", action="store_true", help="No regenerar los datos si ya existen")
+
+    def handle(self, *args, **options):
+        rng = random.Random(3)
+        groups = list(Group.objects.filter(name__startswith=PREFIX).order_by("pk"))
+        if not (options["reuse"] and groups):
+            groups = self._seed(rng, options["users"], options["groups"], options["max_size"])
+        sizes = dict(
+            Group.objects.filter(pk__in=[group.pk for group in groups])
+            .annotate(n=Count("memberships"))
+            .values_list("pk", "n")
+        )
+        memberships = sum(sizes.values())
+        self.stdout.write(f"{len(groups)} grupos, {memberships} pertenencias, máx {max(sizes.values())} miembros")
+
+        today = timezone.localdate()
+        buckets = {"<100": [], "100-1k": [], "1k-10k": [], ">=10k": []}
+        for group in groups:
+            size = sizes[group.pk]
+            key = "<100" if size < 100 else "100-1k" if size < 1000 else "1k-10k" if size < 10_000 else ">=10k"
+            buckets[key].append(group)
+
+        for label, members in buckets.items():
+            if not members:
+                continue
+            sample = [rng.choice(members) for _ in range(options["iterations"])]
+            callers = [self._member(group) for group in sample]
+            cold, warm = [], []
+            for group, caller in zip(sample, callers):
+                cache.clear()
+                # La vista ya tiene el grupo (y su ranking_version) al comprobar la pertenencia
+                compute = lambda: leaderboards.group_leaderboard(  # noqa: E731
+                    group.pk, caller, "all", today, version=group.ranking_version
+                )
+                cold.append(self._time(compute))
+                warm.append(self._time(compute))
+            self.stdout.write(
+                f"grupos {label:7} sin caché p50={statistics.median(cold):.1f}ms p95={self._p95(cold):.1f}ms | "
+                f"con caché p50={statistics.median(warm):.2f}ms"
+            )
+
+        # Invalidación: coste añadido a complete_habit para usuarios en muchos grupos
+        busiest = (
+            GroupMembership.objects.filter(group__in=groups).values("user_id")
+            .order_by("user_id").distinct()[:options["iterations"]]
+        )
+        timings = [self._time(lambda: leaderboards.invalidate_groups_of(row["user_id"])) for row in busiest]
+        self.stdout.write(f"invalidación por completado p50={statistics.median(timings):.2f}ms p95={self._p95(timings):.2f}ms")
+
+    def _member(self, group):
+        return GroupMembership.objects.filter(group=group).order_by("?").values_list("user_id", flat=True).first()
+
+    def _time(self, compute):
+        start = time.perf_counter()
+        compute()
+        return (time.perf_counter() - start) * 1000
+
+    def _p95(self, timings):
+        ordered = sorted(timings)
+        return ordered[max(0, int(len(ordered) * 0.95) - 1)]
+
+    def _seed(self, rng, user_count, group_count, max_size):
+        User = get_user_model()
+        User.objects.filter(username__startswith=PREFIX).delete()
+        password = make_password(None)
+        User.objects.bulk_create([User(username=f"{PREFIX}{i}", password=password) for i in range(user_count)], batch_size=5000)
+        user_ids = list(User.objects.filter(username__startswith=PREFIX).values_list("pk", flat=True))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id, total_points=rng.randint(0, 50_000)) for user_id in user_ids],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        groups = Group.objects.bulk_create([
+            Group(name=f"{PREFIX}{i}", owner_id=rng.choice(user_ids), invite_code=f"{PREFIX}{i}")
+            for i in range(group_count)
+        ])
+        groups = list(Group.objects.filter(name__startswith=PREFIX).order_by("pk"))
+        batch = []
+        for index, group in enumerate(groups):
+            # Distribución de cola larga: muchos grupos pequeños y unos pocos enormes
+            size = min(max_size, len(user_ids), max(3, int(max_size / (index + 1) ** 1.1)))
+            for user_id in rng.sample(user_ids, size):
+                batch.append(GroupMembership(group=group, user_id=user_id))
+            if len(batch) >= 20_000:
+                GroupMembership.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        GroupMembership.objects.bulk_create(batch, ignore_conflicts=True)
+        return groups
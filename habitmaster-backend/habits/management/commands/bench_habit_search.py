@@ -0,0 +1,102 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from controller.app_controller import HabitController
+from habits import fulltext
+from habits.models import Habit
+
+PREFIX = "bench_search_"
+VERBS = ["Leer", "Correr", "Meditar", "Beber", "Estudiar", "Caminar", "Dormir", "Escribir", "Nadar", "Cocinar"]
+WORDS = [
+    "agua", "libro", "minutos", "mañana", "noche", "parque", "guitarra", "inglés", "yoga", "fruta",
+    "pasos", "diario", "respiración", "verduras", "bicicleta", "pesas", "estiramientos", "café", "pantallas", "vitaminas",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de /api/habits/search/ (índice de texto completo) frente a LIKE sobre "
+        "muchos hábitos sintéticos, en un usuario y en todos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--habits", type=int, default=1_000_000, help="Hábitos totales a generar")
+        parser.add_argument("--per-user", type=int, default=300, help="Hábitos por usuario")
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--reuse", action="store_true", help="No regenerar los datos si ya existen")
+
+    def handle(self, *args, **options):
+        users = list(get_user_model().objects.filter(username__startswith=PREFIX).order_by("pk"))
+        if not (options["reuse"] and users):
+            users = self._seed(options["habits"], options["per_user"])
+        self.stdout.write(f"{Habit.objects.count()} hábitos, {len(users)} usuarios de prueba ({connection.vendor})")
+
+        controller = HabitController()
+        admin = users[0]
+        sample = random.Random(1).sample(users, min(options["iterations"], len(users)))
+        queries = {
+            "palabra común": "agua",
+            "palabra rara": "zq7",
+            "prefijo": "respir",
+            "dos palabras": "leer libro",
+        }
+        for label, query in queries.items():
+            self._measure(f"usuario  {label}", sample, lambda user: controller.search_habits(user, query))
+            self._measure(
+                f"todos    {label}", sample[:10], lambda user: controller.search_habits(admin, query, all_users=True)
+            )
+        self._measure("todos    LIKE común", sample[:5], lambda user: self._like("agua"))
+        self._measure("todos    LIKE rara", sample[:5], lambda user: self._like("zq7"))
+        self._measure("todos    LIKE sin filas", sample[:5], lambda user: self._like("zzqx"))
+
+    def _like(self, word):
+        habits = Habit.objects.filter(Q(name__icontains=word) | Q(description__icontains=word))
+        return list(habits.order_by("id").values_list("id", flat=True)[:21])
+
+    def _measure(self, label, users, run):
+        timings = []
+        for user in users:
+            start = time.perf_counter()
+            run(user)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label:24} p50={statistics.median(timings):.2f}ms p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms"
+        )
+
+    def _seed(self, habit_count, per_user):
+        User = get_user_model()
+        User.objects.filter(username__startswith=PREFIX).delete()
+        user_count = max(1, habit_count // per_user)
+        User.objects.bulk_create([User(username=f"{PREFIX}{i}") for i in range(user_count)], batch_size=5000)
+        user_ids = list(User.objects.filter(username__startswith=PREFIX).order_by("pk").values_list("pk", flat=True))
+        rng = random.Random(7)
+        created, batch = 0, []
+        started = time.monotonic()
+        for n in range(habit_count):
+            # Zipf aproximado: pocas palabras muy frecuentes, la mayoría raras
+            words = [WORDS[min(int(rng.paretovariate(1.2)) - 1, len(WORDS) - 1)] for _ in range(3)]
+            if rng.random() < 0.0001:
+                words.append("zq7")
+            batch.append(Habit(
+                user_id=user_ids[n % len(user_ids)],
+                name=f"{rng.choice(VERBS)} {words[0]}",
+                description=" ".join(words[1:]),
+            ))
+            if len(batch) == 10000:
+                Habit.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+                if created % 500_000 == 0:
+                    self.stdout.write(f"  {created} hábitos ({time.monotonic() - started:.0f}s)")
+        Habit.objects.bulk_create(batch)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {fulltext.TABLE}")
+        return list(User.objects.filter(pk__in=user_ids).order_by("pk"))
@@ -0,0 +1,96 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from controller.statistics import habit_statistics, rebuild_monthly_rollups
+from habits.models import Habit, HabitLog
+from processor import functional
+
+PREFIX = "bench_stats_"
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de las estadísticas por hábito (SQL, SQL+rollups y cálculo en Python) "
+        "sobre un volumen grande de logs sintéticos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logs", type=int, default=1_000_000, help="Logs totales a generar")
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--habits", type=int, default=5, help="Hábitos por usuario")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--reuse", action="store_true", help="No regenerar los datos si ya existen")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        users = list(get_user_model().objects.filter(username__startswith=PREFIX).order_by("pk"))
+        if not (options["reuse"] and users):
+            users = self._seed(options["users"], options["habits"], options["logs"], today)
+        total = HabitLog.objects.filter(habit__user__username__startswith=PREFIX).count()
+        self.stdout.write(f"{total} logs, {len(users)} usuarios")
+
+        sample = random.Random(1).sample(users, min(options["iterations"], len(users)))
+        self._measure("python", sample, lambda user: self._python_stats(user, today))
+        self._measure("sql", sample, lambda user: habit_statistics(user, today, use_rollups=False))
+        start = time.perf_counter()
+        rows = rebuild_monthly_rollups(today.replace(day=1))
+        self.stdout.write(f"rollups: {rows} filas en {time.perf_counter() - start:.1f}s")
+        self._measure("sql+rollups", sample, lambda user: habit_statistics(user, today))
+
+    def _measure(self, label, users, compute):
+        timings = []
+        for user in users:
+            start = time.perf_counter()
+            compute(user)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label:12} p50={statistics.median(timings):.1f}ms p95={timings[int(len(timings) * 0.95) - 1]:.1f}ms"
+        )
+
+    def _python_stats(self, user, today):
+        """Lo que haría un cliente hoy: descargar todos los logs y reducir en memoria."""
+        by_habit = {}
+        for habit_id, day, completed in HabitLog.objects.filter(habit__user=user).values_list("habit_id", "date", "completed"):
+            by_habit.setdefault(habit_id, []).append({"date": day, "completed": completed})
+        return {
+            habit_id: (
+                functional.calculate_streak(logs),
+                functional.calculate_current_streak(logs, today),
+                functional.moving_average(logs, today, 7),
+                functional.moving_average(logs, today, 30),
+            )
+            for habit_id, logs in by_habit.items()
+        }
+
+    def _seed(self, user_count, habits_per_user, log_count, today):
+        User = get_user_model()
+        User.objects.filter(username__startswith=PREFIX).delete()
+        User.objects.bulk_create([User(username=f"{PREFIX}{i}") for i in range(user_count)])
+        users = list(User.objects.filter(username__startswith=PREFIX).order_by("pk"))
+        Habit.objects.bulk_create([
+            Habit(user=user, name=f"Hábito {n}", difficulty=random.choice(Habit.Difficulty.values))
+            for user in users
+            for n in range(habits_per_user)
+        ])
+        habits = list(Habit.objects.filter(user__in=users))
+        days = max(1, log_count // len(habits))
+        rng = random.Random(42)
+        batch = []
+        for habit in habits:
+            for offset in range(days):
+                day = today - timedelta(days=offset)
+                completed = rng.random() < 0.8
+                points = functional.calculate_points(habit, day) if completed else 0
+                batch.append(HabitLog(habit=habit, date=day, completed=completed, points_awarded=points))
+                if len(batch) >= 10000:
+                    HabitLog.objects.bulk_create(batch)
+                    batch = []
+        HabitLog.objects.bulk_create(batch)
+        return users
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from habits.models import Habit
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del throttling: usuarios normales completan hábitos a ritmo "
+        "razonable mientras un cliente abusivo satura /complete/. Requiere un servidor "
+        "en marcha contra la misma base de datos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--users", type=int, default=10, help="Usuarios bien comportados")
+        parser.add_argument("--interval", type=float, default=3.0, help="Segundos entre completados de cada usuario normal")
+        parser.add_argument("--abusers", type=int, default=1)
+        parser.add_argument("--abuser-threads", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=20.0)
+
+    def handle(self, *args, **options):
+        good = [self._prepare(f"bench_ok_{i}") for i in range(options["users"])]
+        bad = [self._prepare(f"bench_abuse_{i}") for i in range(options["abusers"])]
+        results = {"good": [], "abuse": []}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def run(group, url, token, pause):
+            while time.monotonic() < deadline:
+                status, elapsed = self._post(url, token)
+                with lock:
+                    results[group].append((status, elapsed))
+                if pause:
+                    time.sleep(pause)
+
+        threads = [
+            threading.Thread(target=run, args=("good", url, token, options["interval"]))
+            for url, token in (self._target(options["base_url"], *item) for item in good)
+        ]
+        for item in bad:
+            url, token = self._target(options["base_url"], *item)
+            threads += [
+                threading.Thread(target=run, args=("abuse", url, token, 0))
+                for _ in range(options["abuser_threads"])
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for group, label in (("good", "normales"), ("abuse", "abusivo")):
+            rows = results[group]
+            ok = [elapsed for status, elapsed in rows if status == 200]
+            statuses = {}
+            for status, _ in rows:
+                statuses[status] = statuses.get(status, 0) + 1
+            self.stdout.write(
+                f"{label:9} peticiones={len(rows)} estados={json.dumps(statuses)} "
+                f"p50={_percentile(ok, 50):.1f}ms p99={_percentile(ok, 99):.1f}ms"
+            )
+
+    def _prepare(self, username):
+        user, _ = get_user_model().objects.get_or_create(username=username)
+        habit, _ = Habit.objects.get_or_create(user=user, name="Benchmark")
+        return habit.id, str(AccessToken.for_user(user))
+
+    def _target(self, base_url, habit_id, token):
+        return f"{base_url.rstrip('/')}/api/habits/{habit_id}/complete/", token
+
+    def _post(self, url, token):
+        request = urllib.request.Request(url, data=b"", method="POST", headers={"Authorization": f"Bearer {token}"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            status = exc.code
+        except OSError:
+            status = 0
+        return status, (time.perf_counter() - start) * 1000
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from habits import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea por adelantado las particiones de HabitLog (Postgres) para que los "
+        "completados nuevos no caigan en la partición DEFAULT; lanzar a diario o semanalmente"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=3)
+        parser.add_argument("--interval", choices=partitions.INTERVALS, default="month")
+        parser.add_argument("--list", action="store_true", help="Mostrar las particiones existentes")
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            self.stdout.write(f"El particionado de HabitLog solo aplica en Postgres (base actual: {connection.vendor}).")
+            return
+        if not partitions.is_partitioned(connection):
+            raise CommandError(f"{partitions.TABLE} no está particionada; aplica antes las migraciones.")
+        today = timezone.localdate()
+        last = today + timedelta(days=31 * options["months_ahead"])
+        created = partitions.ensure_partitions(connection, today, last, options["interval"])
+        for name in created:
+            self.stdout.write(f"  creada {name}")
+        if options["list"]:
+            for partition in partitions.list_partitions(connection):
+                self.stdout.write(
+                    f"  {partition['name']}: {partition['start']} - {partition['end']} (~{partition['rows']} filas)"
+                )
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} particiones nuevas hasta {last:%Y-%m}."))
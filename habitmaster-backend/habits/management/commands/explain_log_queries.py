@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from habits import partitions
+from habits.models import HabitLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Plan de ejecución de las consultas calientes sobre HabitLog; en Postgres "
+        "particionado muestra qué particiones se leen (partition pruning)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Usuario (por defecto, el primero con logs)")
+        parser.add_argument("--analyze", action="store_true", help="Ejecutar las consultas (EXPLAIN ANALYZE, solo Postgres)")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.filter(habits__logs__isnull=False).order_by("pk").first()
+        if user is None:
+            raise CommandError("No hay usuario con logs.")
+
+        today = timezone.localdate()
+        week_start = today - timedelta(days=today.weekday())
+        logs = HabitLog.objects.filter(habit__user=user)
+        queries = {
+            "semana en curso (inicio, progreso)": logs.filter(date__gte=week_start),
+            "completados de hoy (lista de hábitos)": logs.filter(date=today, completed=True),
+            "log del día (complete_habit)": HabitLog.objects.filter(habit=user.habits.order_by("pk").first(), date=today),
+            "historial completo (contraste)": logs,
+        }
+        explain = {}
+        if partitions.supported(connection):
+            explain = {"analyze": options["analyze"], "buffers": options["analyze"]}
+            state = "particionada" if partitions.is_partitioned(connection) else "sin particionar"
+            self.stdout.write(f"{partitions.TABLE}: {state}")
+        for label, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(queryset.order_by().explain(**explain))
@@ -0,0 +1,323 @@
+import json
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from habits.models import Habit, UserProfile
+
+PREFIX = "loadtest_"
+DEFAULT_SLOS = {"p95": 500.0, "p99": 1500.0, "error_rate": 0.01}
+# Ids en la ruta -> una sola serie por endpoint
+ID_PATTERN = re.compile(r"/\d+/")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def endpoint_label(method, path):
+    return f"{method} {ID_PATTERN.sub('/{id}/', path.split('?')[0])}"
+
+
+def summarize(samples, elapsed):
+    """``samples``: (endpoint, estado, ms). 429 cuenta como limitada, no como error."""
+    by_endpoint = defaultdict(list)
+    for endpoint, status, ms in samples:
+        by_endpoint[endpoint].append((status, ms))
+    endpoints = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = [ms for status, ms in rows if status and status < 400]
+        errors = sum(1 for status, _ in rows if status == 0 or (status >= 400 and status != 429))
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "rps": round(len(rows) / elapsed, 2),
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "errors": errors,
+            "throttled": sum(1 for status, _ in rows if status == 429),
+            "error_rate": round(errors / len(rows), 4),
+        }
+    total = len(samples)
+    errors = sum(row["errors"] for row in endpoints.values())
+    return {
+        "duration_s": round(elapsed, 1),
+        "requests": total,
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def evaluate_slos(summary, slos):
+    """Lista de incumplimientos (vacía si todo pasa). ``rps`` es un mínimo global."""
+    failures = []
+    for endpoint, row in summary["endpoints"].items():
+        for key in ("p50", "p95", "p99", "error_rate"):
+            if key in slos and row[key] > slos[key]:
+                failures.append(f"{endpoint} {key}={row[key]} > {slos[key]}")
+    if "rps" in slos and summary["rps"] < slos["rps"]:
+        failures.append(f"rps={summary['rps']} < {slos['rps']}")
+    return failures
+
+
+class LockSampler(threading.Thread):
+    """Muestrea sesiones esperando un lock en Postgres (pg_stat_activity)."""
+
+    QUERY = (
+        "SELECT count(*) FROM pg_stat_activity "
+        "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+    )
+
+    def __init__(self, interval=0.5):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        from django.db import connections
+
+        try:
+            while not self.stopped.is_set():
+                with connections["default"].cursor() as cursor:
+                    cursor.execute(self.QUERY)
+                    self.samples.append(cursor.fetchone()[0])
+                self.stopped.wait(self.interval)
+        finally:
+            connections.close_all()
+
+    def report(self):
+        if not self.samples:
+            return None
+        return {
+            "samples": len(self.samples),
+            "max_waiting": max(self.samples),
+            "avg_waiting": round(sum(self.samples) / len(self.samples), 2),
+            "pct_samples_waiting": round(sum(1 for n in self.samples if n) / len(self.samples), 3),
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga extremo a extremo contra un servidor en marcha: sesiones con login, "
+        "SPA, dashboard, completados y ranking; informa latencias por endpoint y evalúa SLOs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=20, help="Usuarios virtuales simultáneos")
+        parser.add_argument("--duration", type=float, default=60.0)
+        parser.add_argument("--ramp-up", type=float, default=5.0, help="Segundos para arrancar todos los usuarios")
+        parser.add_argument("--think-time", type=float, default=1.0, help="Pausa media entre acciones")
+        parser.add_argument("--users", type=int, default=50, help="Cuentas loadtest_* a preparar")
+        parser.add_argument("--habits", type=int, default=3, help="Hábitos por cuenta")
+        parser.add_argument(
+            "--slo",
+            action="append",
+            default=[],
+            metavar="CLAVE=VALOR",
+            help="Umbral: p50/p95/p99 (ms por endpoint), error_rate (0-1) o rps (mínimo global)",
+        )
+        parser.add_argument("--json", dest="json_path", help="Guardar el resultado en JSON")
+        parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+        parser.add_argument(
+            "--keep-users", action="store_true", help="No borrar las cuentas loadtest_* al terminar",
+        )
+        parser.add_argument(
+            "--i-know-this-is-not-prod",
+            dest="not_prod",
+            action="store_true",
+            help="Permitir la ejecución con DEBUG=False (crea cuentas en la base de DATABASE_URL)",
+        )
+
+    def handle(self, *args, **options):
+        if not (settings.DEBUG or options["not_prod"]):
+            raise CommandError(
+                "loadtest crea cuentas en la base de DATABASE_URL: solo con DEBUG=True "
+                "o con --i-know-this-is-not-prod"
+            )
+        slos = dict(DEFAULT_SLOS)
+        for item in options["slo"]:
+            key, _, value = item.partition("=")
+            if key not in ("p50", "p95", "p99", "error_rate", "rps") or not value:
+                raise CommandError(f"SLO no válido: {item}")
+            slos[key] = float(value)
+
+        # Contraseña nueva en cada ejecución: las cuentas no quedan con una conocida
+        password = secrets.token_urlsafe(16)
+        accounts = self._prepare(options["users"], options["habits"], password)
+        try:
+            summary = self._run(accounts, password, slos, options)
+        finally:
+            if not options["keep_users"]:
+                self._cleanup()
+        self._print(summary, options["baseline"])
+        if options["json_path"]:
+            Path(options["json_path"]).write_text(json.dumps(summary, indent=2))
+        if summary["failures"]:
+            raise CommandError(f"{len(summary['failures'])} SLO incumplidos")
+        self.stdout.write(self.style.SUCCESS("SLOs cumplidos"))
+
+    def _run(self, accounts, password, slos, options):
+        base_url = options["base_url"].rstrip("/")
+        samples = []
+        lock = threading.Lock()
+        started = time.monotonic()
+        deadline = started + options["duration"]
+
+        def record(endpoint, status, ms):
+            with lock:
+                samples.append((endpoint, status, ms))
+
+        sessions = [
+            threading.Thread(
+                target=self._session,
+                args=(
+                    base_url, accounts[i % len(accounts)], password, deadline,
+                    options["think_time"], record, random.Random(i),
+                ),
+                daemon=True,
+            )
+            for i in range(options["concurrency"])
+        ]
+        sampler = LockSampler() if connection.vendor == "postgresql" else None
+        if sampler:
+            sampler.start()
+        for index, session in enumerate(sessions):
+            session.start()
+            time.sleep(options["ramp_up"] / max(1, len(sessions)) if index < len(sessions) - 1 else 0)
+        for session in sessions:
+            session.join()
+        if sampler:
+            sampler.stopped.set()
+            sampler.join()
+
+        summary = summarize(samples, time.monotonic() - started)
+        summary["concurrency"] = options["concurrency"]
+        summary["lock_waits"] = sampler.report() if sampler else None
+        summary["slos"] = slos
+        summary["failures"] = evaluate_slos(summary, slos)
+        return summary
+
+    def _prepare(self, count, habits_per_user, password):
+        """Cuentas de prueba con una misma contraseña (se hashea una sola vez)."""
+        User = get_user_model()
+        names = [f"{PREFIX}{i}" for i in range(count)]
+        hashed = make_password(password)
+        # Restos de una ejecución interrumpida: se les pone la contraseña de esta
+        existing = User.objects.filter(username__in=names)
+        existing.update(password=hashed)
+        known = set(existing.values_list("username", flat=True))
+        User.objects.bulk_create([User(username=name, password=hashed) for name in names if name not in known])
+        users = list(User.objects.filter(username__in=names))
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users], ignore_conflicts=True)
+        with_habits = set(Habit.objects.filter(user__in=users).values_list("user_id", flat=True))
+        Habit.objects.bulk_create([
+            Habit(user=user, name=f"Carga {n}")
+            for user in users
+            if user.id not in with_habits
+            for n in range(habits_per_user)
+        ])
+        return [user.username for user in users]
+
+    def _cleanup(self):
+        User = get_user_model()
+        deleted = User.objects.filter(username__startswith=PREFIX).delete()[1].get(User._meta.label, 0)
+        self.stdout.write(f"{deleted} cuentas {PREFIX}* borradas")
+
+    def _session(self, base_url, username, password, deadline, think_time, record, rng):
+        """Una sesión realista: login, SPA, dashboard y luego acciones mezcladas."""
+
+        def call(method, path, body=None, token=None):
+            status, ms, data = self._request(base_url, method, path, body, token)
+            record(endpoint_label(method, path), status, ms)
+            return status, data
+
+        while time.monotonic() < deadline:
+            status, tokens = call("POST", "/api/auth/login/", {"username": username, "password": password})
+            if status != 200:
+                time.sleep(think_time)
+                continue
+            token = tokens["access"]
+            call("GET", "/dashboard")
+            call("GET", "/api/bootstrap/", token=token)
+            _, habits = call("GET", "/api/habits/", token=token)
+            habit_ids = [habit["id"] for habit in habits or []]
+            # Tras el login, unas cuantas acciones antes de "cerrar sesión"
+            for _ in range(rng.randint(5, 15)):
+                if time.monotonic() >= deadline:
+                    return
+                action = rng.random()
+                if action < 0.35:
+                    call("GET", "/api/bootstrap/", token=token)
+                elif action < 0.55 and habit_ids:
+                    call("POST", f"/api/habits/{rng.choice(habit_ids)}/complete/", token=token)
+                elif action < 0.8:
+                    call("GET", "/api/ranking/", token=token)
+                elif action < 0.9:
+                    call("GET", "/api/profile/", token=token)
+                else:
+                    call("GET", "/api/logs/", token=token)
+                time.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+
+    def _request(self, base_url, method, path, body, token):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        data = json.dumps(body).encode() if body is not None else (b"" if method == "POST" else None)
+        request = urllib.request.Request(base_url + path, data=data, method=method, headers=headers)
+        start = time.perf_counter()
+        payload = None
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                raw = response.read()
+                status = response.status
+                if response.headers.get_content_type() == "application/json":
+                    payload = json.loads(raw)
+        except urllib.error.HTTPError as exc:
+            status = exc.code
+        except OSError:
+            status = 0
+        return status, (time.perf_counter() - start) * 1000, payload
+
+    def _print(self, summary, baseline_path):
+        baseline = json.loads(Path(baseline_path).read_text())["endpoints"] if baseline_path else {}
+        self.stdout.write(
+            f"{summary['requests']} peticiones en {summary['duration_s']}s "
+            f"({summary['rps']} req/s, concurrencia {summary['concurrency']}, errores {summary['error_rate']:.2%})"
+        )
+        self.stdout.write(f"{'endpoint':40} {'n':>6} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'err':>5} {'429':>5}")
+        for endpoint, row in summary["endpoints"].items():
+            line = (
+                f"{endpoint:40} {row['requests']:>6} {row['rps']:>7} {row['p50']:>7} "
+                f"{row['p95']:>7} {row['p99']:>7} {row['errors']:>5} {row['throttled']:>5}"
+            )
+            if endpoint in baseline:
+                line += f"  (p95 {row['p95'] - baseline[endpoint]['p95']:+.1f}ms)"
+            self.stdout.write(line)
+        locks = summary["lock_waits"]
+        if locks:
+            self.stdout.write(
+                f"esperas de lock: máx {locks['max_waiting']} sesiones, media {locks['avg_waiting']}, "
+                f"{locks['pct_samples_waiting']:.0%} de las muestras con esperas"
+            )
+        else:
+            self.stdout.write("esperas de lock: no disponible (solo Postgres)")
+        for failure in summary["failures"]:
+            self.stdout.write(self.style.ERROR(f"SLO: {failure}"))
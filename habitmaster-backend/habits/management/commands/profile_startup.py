@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Se ejecuta en un intérprete nuevo para medir un arranque en frío real
+PROBE = r"""
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from habitmaster_backend.wsgi import application
+if os.environ.get("PROBE_WARM_UP") == "1":
+    from habitmaster_backend.warmup import warm_up
+    warm_up()
+app_loaded = time.perf_counter()
+
+def request(path):
+    status = []
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "8000", "HTTP_HOST": "localhost",
+        "wsgi.url_scheme": "http", "wsgi.input": sys.stdin.buffer, "wsgi.errors": sys.stderr,
+    }
+    start = time.perf_counter()
+    body = application(environ, lambda s, h, exc_info=None: status.append(s))
+    b"".join(body)
+    return time.perf_counter() - start, status[0]
+
+first, first_status = request(sys.argv[1])
+second, _ = request(sys.argv[1])
+print(json.dumps({
+    "setup_ms": (setup_done - started) * 1000,
+    "app_load_ms": (app_loaded - setup_done) * 1000,
+    "first_request_ms": first * 1000,
+    "second_request_ms": second * 1000,
+    "first_status": first_status,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def parse_importtime(stderr: str):
+    """Convierte la salida de ``-X importtime`` en (módulo, propio_us, acumulado_us)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Perfila el arranque: tiempo de import por módulo y tiempo hasta la primera petición WSGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/habits/", help="Ruta de la primera petición")
+        parser.add_argument("--top", type=int, default=20, help="Módulos más lentos a mostrar")
+        parser.add_argument("--warm-up", action="store_true", help="Aplicar warm_up() como en --preload")
+        parser.add_argument("--json", action="store_true", help="Salida en JSON")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PROBE_WARM_UP="1" if options["warm_up"] else "0")
+        env.setdefault("DJANGO_SETTINGS_MODULE", os.environ.get("DJANGO_SETTINGS_MODULE", "habitmaster_backend.settings"))
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE, options["path"]],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            self.stderr.write(completed.stderr[-2000:])
+            return
+
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        imports = parse_importtime(completed.stderr)
+        # Agrupar por paquete de primer nivel (kanren, rest_framework, habits...)
+        packages = {}
+        for module, _, cumulative in imports:
+            if "." not in module:
+                packages[module] = packages.get(module, 0) + cumulative
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[: options["top"]]
+
+        if options["json"]:
+            timings["imports_ms"] = {name: us / 1000 for name, us in slowest}
+            self.stdout.write(json.dumps(timings, indent=2))
+            return
+
+        self.stdout.write(f"django.setup():        {timings['setup_ms']:.1f} ms")
+        self.stdout.write(f"carga WSGI (+warm-up): {timings['app_load_ms']:.1f} ms")
+        self.stdout.write(f"primera petición:      {timings['first_request_ms']:.1f} ms ({timings['first_status']})")
+        self.stdout.write(f"segunda petición:      {timings['second_request_ms']:.1f} ms")
+        self.stdout.write(f"módulos cargados:      {timings['modules']}")
+        self.stdout.write("\nImports más costosos (acumulado, paquetes de primer nivel):")
+        for name, us in slowest:
+            self.stdout.write(f"  {us / 1000:8.1f} ms  {name}")
@@ -0,0 +1,51 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controller import accounts
+from habits.models import Group
+
+
+class Command(BaseCommand):
+    help = (
+        "Alta masiva de usuarios desde CSV (columnas username, email y password opcional) "
+        "con bulk_create de usuarios, perfiles y, si se indica, membresías del grupo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv", help="Fichero CSV con cabecera, o - para la entrada estándar")
+        parser.add_argument("--group", type=int, help="Id del grupo al que se unen los usuarios")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--hash-workers", type=int, default=4, help="Hilos para calcular los hashes")
+        parser.add_argument("--show-skipped", type=int, default=20, help="Máximo de filas omitidas a imprimir")
+
+    def handle(self, *args, **options):
+        group = None
+        if options["group"] is not None:
+            group = Group.objects.filter(pk=options["group"]).first()
+            if group is None:
+                raise CommandError(f"No existe el grupo {options['group']}.")
+        if options["csv"] == "-":
+            rows = list(csv.DictReader(sys.stdin))
+        else:
+            try:
+                with open(options["csv"], newline="", encoding="utf-8") as source:
+                    rows = list(csv.DictReader(source))
+            except OSError as exc:
+                raise CommandError(str(exc)) from exc
+        if rows and "username" not in rows[0]:
+            raise CommandError("El CSV necesita al menos la columna username.")
+
+        started = time.monotonic()
+        result = accounts.provision_users(
+            rows, group=group, batch_size=options["batch_size"], hash_workers=options["hash_workers"]
+        )
+        elapsed = time.monotonic() - started
+        for row, reason in result.skipped[:options["show_skipped"]]:
+            self.stdout.write(f"  omitido {row.get('username')!r}: {reason}")
+        rate = len(result.created) / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result.created)} usuarios creados, {len(result.skipped)} omitidos en {elapsed:.1f}s ({rate:.0f}/s)."
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from habits import fulltext
+
+
+class Command(BaseCommand):
+    help = (
+        "Reinstala los triggers del índice de texto completo de hábitos y lo recalcula "
+        "(p. ej. después de una migración que rehaga habits_habit en SQLite)"
+    )
+
+    def handle(self, *args, **options):
+        if not fulltext.supported(connection):
+            self.stdout.write(f"La búsqueda de hábitos no tiene índice en {connection.vendor}.")
+            return
+        fulltext.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f"Índice de búsqueda de hábitos reconstruido ({connection.vendor})."))
@@ -0,0 +1,249 @@
+import json
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import groupby
+from pathlib import Path
+from types import SimpleNamespace
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from controller import points, statistics
+from habits.models import Achievement, Habit, HabitLog, LogArchive, UserProfile
+from logic_rules import achievements as achievement_engine
+from logic_rules import rules
+from processor import functional, streaks
+
+HABIT_FIELDS = ("current_streak", "longest_streak", "last_completed", "streak_expires")
+PROFILE_FIELDS = (
+    "current_streak",
+    "longest_streak",
+    "last_completed",
+    "completion_counts",
+    "achievement_mask",
+    "level",
+)
+# No se escribe con bulk_update: los puntos pasan por el libro (points.align_with_logs)
+POINTS_FIELDS = ("total_points",)
+
+
+def _init_worker():
+    # Con "spawn" el hijo no hereda Django configurado; con "fork" no debe reutilizar
+    # las conexiones abiertas del proceso padre.
+    django.setup()
+    connections.close_all()
+
+
+def pending_users(user_ids, done):
+    """Usuarios fuera de los rangos ``[primero, último]`` ya procesados (búsqueda binaria)."""
+    ranges = sorted(done)
+    firsts = [first for first, _ in ranges]
+    pending = []
+    for user_id in user_ids:
+        index = bisect_right(firsts, user_id) - 1
+        if index < 0 or user_id > ranges[index][1]:
+            pending.append(user_id)
+    return pending
+
+
+def _rebuild(logs, streak, ledger):
+    """Recalcula los campos derivados de un perfil a partir de sus logs y su racha.
+
+    ``ledger`` es (total del libro, parte que viene de logs): el total nuevo es el
+    del libro con la parte de logs sustituida por lo que suman los logs, así que
+    los ajustes manuales se conservan.
+    """
+    completed = [log for log in logs if log["completed"]]
+    counts = {"habits": {}, "difficulty": {}}
+    for log in completed:
+        habit_key = str(log["habit_id"])
+        counts["habits"][habit_key] = counts["habits"].get(habit_key, 0) + 1
+        counts["difficulty"][log["difficulty"]] = counts["difficulty"].get(log["difficulty"], 0) + 1
+
+    log_points = sum(log["points"] for log in completed)
+    ledger_total, from_logs = ledger
+    total_points = ledger_total - from_logs + log_points
+    return {
+        "log_points": log_points,
+        "total_points": total_points,
+        "current_streak": streak["current"],
+        "longest_streak": streak["longest"],
+        "level": rules.determine_level(total_points),
+        "last_completed": completed[-1]["date"] if completed else None,
+        "completion_counts": counts,
+    }
+
+
+def _rebuild_habit_streaks(user_ids):
+    """Hábitos del shard cuyo estado de racha no coincide con sus logs."""
+    habit_streaks = statistics.streaks("habit", user_ids)
+    habits = (
+        Habit.objects.filter(user_id__in=user_ids)
+        .annotate(last_day=Max("logs__date", filter=Q(logs__completed=True)))
+        .only("id", "periodicity", "interval_days", *HABIT_FIELDS)
+    )
+    changed = []
+    for habit in habits:
+        state = habit_streaks.get(habit.id, {"current": 0, "longest": 0})
+        expires = None
+        if habit.last_day is not None:
+            last_period = streaks.period_index(habit.periodicity, habit.last_day, habit.interval_days)
+            expires = streaks.expires_on(habit.periodicity, last_period, habit.interval_days)
+        values = (state["current"], state["longest"], habit.last_day, expires)
+        if values != tuple(getattr(habit, field) for field in HABIT_FIELDS):
+            habit.current_streak, habit.longest_streak, habit.last_completed, habit.streak_expires = values
+            changed.append(habit)
+    return changed
+
+
+def recompute_chunk(user_ids, dry_run=False):
+    """Procesa un shard de usuarios: una consulta ordenada de logs y un bulk_update."""
+    profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user_id__in=user_ids)}
+    rows = (
+        HabitLog.objects.filter(habit__user_id__in=user_ids)
+        .order_by("habit__user_id", "date")
+        .values_list("habit__user_id", "habit_id", "date", "completed", "habit__points_value", "habit__difficulty")
+        .iterator(chunk_size=5000)
+    )
+    logs_by_user = {}
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        logs_by_user[user_id] = [
+            {
+                "date": day,
+                "completed": completed,
+                "habit_id": habit_id,
+                "difficulty": difficulty,
+                "points": functional.calculate_points(
+                    SimpleNamespace(points_value=points_value, difficulty=difficulty), day
+                ),
+            }
+            for _, habit_id, day, completed, points_value, difficulty in user_rows
+        ]
+
+    # Rachas de todo el shard en una sola consulta
+    today = timezone.localdate()
+    shard_streaks = statistics.coverage_streaks(user_ids, today)
+    ledger = points.log_totals(user_ids)
+    plan = achievement_engine.get_plan()
+    changed, diffs, new_achievements, corrections = [], [], [], []
+    for user_id, profile in profiles.items():
+        streak = shard_streaks.get(user_id, {"current": 0, "longest": 0})
+        user_ledger = ledger.get(user_id, (0, 0))
+        values = _rebuild(logs_by_user.get(user_id, []), streak, user_ledger)
+        before = {field: getattr(profile, field) for field in PROFILE_FIELDS + POINTS_FIELDS}
+        log_points = values.pop("log_points")
+        if log_points != user_ledger[1] or values["total_points"] != profile.total_points:
+            corrections.append((user_id, log_points))
+        for field, value in values.items():
+            setattr(profile, field, value)
+        _, unlocked = achievement_engine.evaluate(profile, plan=plan)
+        profile.achievement_mask |= unlocked
+        new_achievements.extend(
+            Achievement(user_id=user_id, code=plan.rules_by_bit[bit].code, name=plan.rules_by_bit[bit].name)
+            for bit in plan.rules_by_bit
+            if unlocked & (1 << bit)
+        )
+        diff = {
+            field: (before[field], getattr(profile, field))
+            for field in PROFILE_FIELDS + POINTS_FIELDS
+            if before[field] != getattr(profile, field)
+        }
+        if diff:
+            changed.append(profile)
+            diffs.append((user_id, diff))
+
+    habits = _rebuild_habit_streaks(user_ids)
+    if not dry_run:
+        Habit.objects.bulk_update(habits, HABIT_FIELDS, batch_size=1000)
+        UserProfile.objects.bulk_update(changed, PROFILE_FIELDS, batch_size=1000)
+        Achievement.objects.bulk_create(new_achievements, ignore_conflicts=True, batch_size=1000)
+        for user_id, user_log_points in corrections:
+            points.align_with_logs(user_id, today, user_log_points)
+    return len(user_ids), diffs
+
+
+class Command(BaseCommand):
+    help = "Recalcula puntos, rachas, nivel y logros de todos los perfiles en paralelo"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Usuarios por shard")
+        parser.add_argument("--dry-run", action="store_true", help="Mostrar diferencias sin escribir")
+        parser.add_argument("--show-diffs", type=int, default=20, help="Máximo de diferencias a imprimir")
+        parser.add_argument(
+            "--state-file",
+            default="recompute_profiles.state.json",
+            help="Fichero con los shards terminados (permite reanudar)",
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignorar el progreso guardado")
+        parser.add_argument(
+            "--allow-archived",
+            action="store_true",
+            help="Recalcular aunque haya logs archivados (puntos y rachas saldrían solo del histórico caliente)",
+        )
+
+    def handle(self, *args, **options):
+        if LogArchive.objects.exists() and not options["allow_archived"] and not options["dry_run"]:
+            raise CommandError(
+                "Hay particiones de logs archivadas: recalcular desde los logs perdería su historial. "
+                "Usa --dry-run o --allow-archived."
+            )
+        state_path = Path(options["state_file"])
+        dry_run = options["dry_run"]
+        done = []
+        if state_path.exists() and not options["restart"] and not dry_run:
+            done = json.loads(state_path.read_text())["done"]
+            self.stdout.write(f"Reanudando: {len(done)} shards ya procesados")
+
+        user_ids = list(get_user_model().objects.order_by("pk").values_list("pk", flat=True))
+        pending = pending_users(user_ids, done)
+        size = options["chunk_size"]
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        if not chunks:
+            self.stdout.write(self.style.SUCCESS("Nada que recalcular."))
+            return
+
+        started = time.monotonic()
+        processed = changed = 0
+        shown = 0
+        for index, (chunk, (count, diffs)) in enumerate(self._run(chunks, dry_run, options["workers"]), start=1):
+            processed += count
+            changed += len(diffs)
+            if not dry_run:
+                done.append([chunk[0], chunk[-1]])
+                state_path.write_text(json.dumps({"done": done}))
+            for user_id, diff in diffs:
+                if shown >= options["show_diffs"]:
+                    break
+                shown += 1
+                fields = ", ".join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in diff.items())
+                self.stdout.write(f"  usuario {user_id}: {fields}")
+            elapsed = time.monotonic() - started
+            eta = elapsed / processed * (len(pending) - processed)
+            self.stdout.write(
+                f"[{index}/{len(chunks)}] {processed}/{len(pending)} usuarios, "
+                f"{changed} con cambios, {elapsed:.1f}s (restante ~{eta:.0f}s)"
+            )
+
+        if not dry_run and state_path.exists():
+            state_path.unlink()
+        verb = "cambiarían" if dry_run else "actualizados"
+        self.stdout.write(self.style.SUCCESS(f"Completado: {changed} perfiles {verb} de {processed}."))
+
+    def _run(self, chunks, dry_run, workers):
+        """Genera (shard, resultado) en orden de finalización."""
+        if workers <= 1:
+            for chunk in chunks:
+                yield chunk, recompute_chunk(chunk, dry_run)
+            return
+        # Los procesos hijos abren sus propias conexiones
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(recompute_chunk, chunk, dry_run): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from controller import points
+
+
+def _init_worker():
+    # Igual que recompute_profiles: Django configurado y sin conexiones heredadas
+    django.setup()
+    connections.close_all()
+
+
+def reconcile_chunk(user_ids, fix=False):
+    """Compara libro y perfiles de un shard (tres consultas) y, con ``fix``, los corrige."""
+    mismatches = points.reconcile(user_ids)
+    if fix and mismatches:
+        points.repair([row["user_id"] for row in mismatches], timezone.localdate())
+    return len(user_ids), mismatches
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia PointsLedger con UserProfile.total_points por shards de usuarios en "
+        "paralelo; con --fix el perfil pasa a la suma del libro"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Usuarios por shard")
+        parser.add_argument("--fix", action="store_true", help="Corregir los descuadres")
+        parser.add_argument("--show-diffs", type=int, default=20, help="Máximo de descuadres a imprimir")
+        parser.add_argument("--fail-on-mismatch", action="store_true", help="Salir con error si hay descuadres")
+
+    def handle(self, *args, **options):
+        user_ids = list(get_user_model().objects.order_by("pk").values_list("pk", flat=True))
+        size = options["chunk_size"]
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+        started = time.monotonic()
+        processed = shown = 0
+        mismatched = []
+        for index, (count, mismatches) in enumerate(self._run(chunks, options["fix"], options["workers"]), start=1):
+            processed += count
+            mismatched += mismatches
+            for row in mismatches:
+                if shown >= options["show_diffs"]:
+                    break
+                shown += 1
+                self.stdout.write(
+                    f"  usuario {row['user_id']}: perfil={row['profile']} libro={row['ledger']} "
+                    f"saldo={row['balance']}"
+                )
+            self.stdout.write(
+                f"[{index}/{len(chunks)}] {processed}/{len(user_ids)} usuarios, "
+                f"{len(mismatched)} descuadres, {time.monotonic() - started:.1f}s"
+            )
+
+        verb = "corregidos" if options["fix"] else "encontrados"
+        self.stdout.write(self.style.SUCCESS(f"Completado: {len(mismatched)} descuadres {verb} de {processed}."))
+        if mismatched and options["fail_on_mismatch"] and not options["fix"]:
+            raise CommandError(f"{len(mismatched)} perfiles no cuadran con el libro de puntos")
+
+    def _run(self, chunks, fix, workers):
+        """Genera el resultado de cada shard en orden de finalización."""
+        if workers <= 1:
+            for chunk in chunks:
+                yield reconcile_chunk(chunk, fix)
+            return
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(reconcile_chunk, chunk, fix) for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
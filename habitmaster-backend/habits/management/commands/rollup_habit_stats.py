@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from controller.statistics import rebuild_monthly_rollups
+
+
+class Command(BaseCommand):
+    help = "Consolida completados y puntos por hábito y mes cerrado (HabitMonthlyRollup)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--until", help="Mes (YYYY-MM) hasta el que consolidar, sin incluirlo; por defecto el actual")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        until = timezone.localdate().replace(day=1)
+        if options["until"]:
+            try:
+                until = date.fromisoformat(f"{options['until']}-01")
+            except ValueError as exc:
+                raise CommandError("--until debe tener formato YYYY-MM") from exc
+        created = rebuild_monthly_rollups(until, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{created} filas de rollup hasta {until:%Y-%m}."))
@@ -0,0 +1,56 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Registra los handlers (p. ej. el trabajo derivado de los completados)
+import controller.app_controller  # noqa: F401
+from controller import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la cola de trabajos en la base de datos: reclama lotes con "
+        "FOR UPDATE SKIP LOCKED; se pueden lanzar varios en paralelo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--poll", type=float, default=1.0, help="Segundos de espera con la cola vacía")
+        parser.add_argument("--once", action="store_true", help="Vaciar la cola y salir")
+        parser.add_argument("--stale-after", type=int, default=300, help="Segundos para recuperar trabajos huérfanos")
+        parser.add_argument("--purge-days", type=int, default=7, help="Días que se conservan los trabajos hechos")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        stale_after = timedelta(seconds=options["stale_after"])
+        done = failed = 0
+        started = last_report = last_maintenance = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                if now - last_maintenance >= 60 or done + failed == 0:
+                    recovered = jobs.requeue_stale(stale_after)
+                    purged = jobs.purge(timezone.now() - timedelta(days=options["purge_days"]))
+                    if recovered or purged:
+                        self.stdout.write(f"{recovered} trabajos recuperados, {purged} purgados")
+                    last_maintenance = now
+                batch_done, batch_failed = jobs.run_batch(options["batch_size"], worker)
+                done, failed = done + batch_done, failed + batch_failed
+                if now - last_report >= 10:
+                    self._report(done, failed, now - started)
+                    last_report = now
+                if not batch_done and not batch_failed:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+        except KeyboardInterrupt:
+            pass
+        self._report(done, failed, time.monotonic() - started)
+
+    def _report(self, done, failed, elapsed):
+        rate = done / elapsed if elapsed else 0.0
+        self.stdout.write(f"{done} hechos, {failed} fallidos en {elapsed:.1f}s ({rate:.1f}/s)")
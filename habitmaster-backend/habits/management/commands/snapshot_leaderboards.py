@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from controller import leaderboards
+from habits.models import Period
+
+
+class Command(BaseCommand):
+    help = (
+        "Congela los rankings (top-K y posición de cada usuario) de la semana, el mes y el "
+        "histórico que contienen --date. Pensado para ejecutarse a diario tras medianoche."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", action="append", choices=Period.values, help="Por defecto, todos")
+        parser.add_argument("--date", help="Día (YYYY-MM-DD); por defecto ayer")
+        parser.add_argument("--top", type=int, default=100, help="Posiciones guardadas en el top-K")
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Rehacer antes los contadores semana/mes desde el libro de puntos"
+        )
+
+    def handle(self, *args, **options):
+        day = timezone.localdate() - timedelta(days=1)
+        if options["date"]:
+            try:
+                day = date.fromisoformat(options["date"])
+            except ValueError as exc:
+                raise CommandError("--date debe tener formato YYYY-MM-DD") from exc
+        for period in options["period"] or Period.values:
+            if options["rebuild"] and period in leaderboards.WINDOWED:
+                leaderboards.rebuild_window(period, day)
+            board = leaderboards.snapshot(period, day, options["top"])
+            self.stdout.write(f"{period:5} {board.start}: {board.participants} usuarios, top {len(board.top)}")
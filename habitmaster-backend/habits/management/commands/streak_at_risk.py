@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from controller.app_controller import HabitController
+from processor import functional
+
+
+class Command(BaseCommand):
+    help = "Exporta en NDJSON los usuarios cuya racha se rompe si no completan algo hoy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Fichero de salida (por defecto stdout)")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rows = HabitController().iter_streak_at_risk(chunk_size=options["chunk_size"])
+        chunks = functional.to_ndjson_chunks(rows, options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                total = self._write(chunks, output.write)
+        else:
+            total = self._write(chunks, lambda chunk: self.stdout.write(chunk, ending=""))
+        self.stderr.write(f"{total} usuarios en riesgo")
+
+    def _write(self, chunks, write) -> int:
+        total = 0
+        for chunk in chunks:
+            write(chunk)
+            total += chunk.count("\n")
+        return total
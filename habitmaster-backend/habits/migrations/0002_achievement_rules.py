@@ -0,0 +1,91 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:19
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count
+
+# Mismos umbrales que los hechos Kanren originales de logic_rules/rules.py
+DEFAULT_RULES = [
+    ("medalla_7", "streak", "gte", 7),
+    ("medalla_14", "streak", "gte", 14),
+    ("medalla_30", "streak", "gte", 30),
+    ("medalla_90", "streak", "gte", 90),
+    ("racha_semana", "streak", "eq", 7),
+    ("racha_mes", "streak", "eq", 30),
+]
+
+
+def seed_rules_and_backfill(apps, schema_editor):
+    AchievementRule = apps.get_model("habits", "AchievementRule")
+    Achievement = apps.get_model("habits", "Achievement")
+    HabitLog = apps.get_model("habits", "HabitLog")
+    UserProfile = apps.get_model("habits", "UserProfile")
+
+    bits = {}
+    for bit, (code, metric, comparison, threshold) in enumerate(DEFAULT_RULES):
+        AchievementRule.objects.create(
+            code=code,
+            name=code.replace("_", " ").title(),
+            metric=metric,
+            comparison=comparison,
+            threshold=threshold,
+            bit=bit,
+        )
+        bits[code] = bit
+
+    masks = {}
+    for user_id, code in Achievement.objects.filter(code__in=bits).values_list("user_id", "code"):
+        masks[user_id] = masks.get(user_id, 0) | (1 << bits[code])
+
+    counts = {}
+    completed = HabitLog.objects.filter(completed=True)
+    for row in completed.values("habit__user_id", "habit_id").annotate(n=Count("id")):
+        user_counts = counts.setdefault(row["habit__user_id"], {"habits": {}, "difficulty": {}})
+        user_counts["habits"][str(row["habit_id"])] = row["n"]
+    for row in completed.values("habit__user_id", "habit__difficulty").annotate(n=Count("id")):
+        user_counts = counts.setdefault(row["habit__user_id"], {"habits": {}, "difficulty": {}})
+        user_counts["difficulty"][row["habit__difficulty"]] = row["n"]
+
+    for profile in UserProfile.objects.filter(user_id__in=set(masks) | set(counts)):
+        profile.achievement_mask = masks.get(profile.user_id, 0)
+        profile.completion_counts = counts.get(profile.user_id, {})
+        profile.save(update_fields=["achievement_mask", "completion_counts"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AchievementRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(max_length=120)),
+                ('metric', models.CharField(choices=[('streak', 'Racha actual'), ('total_points', 'Puntos totales'), ('habit_completions', 'Completados de un hábito'), ('difficulty_completions', 'Completados por dificultad')], max_length=32)),
+                ('comparison', models.CharField(choices=[('gte', 'Mayor o igual'), ('eq', 'Igual')], default='gte', max_length=3)),
+                ('threshold', models.PositiveIntegerField()),
+                ('difficulty', models.CharField(blank=True, choices=[('easy', 'Fácil'), ('medium', 'Media'), ('hard', 'Difícil')], max_length=12)),
+                ('bit', models.PositiveSmallIntegerField(unique=True, validators=[django.core.validators.MaxValueValidator(62)])),
+                ('active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('bit',),
+            },
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='achievement_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='completion_counts',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(seed_rules_and_backfill, migrations.RunPython.noop),
+    ]
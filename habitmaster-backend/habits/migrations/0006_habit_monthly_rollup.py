@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0005_profile_points_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('points', models.IntegerField(default=0)),
+                ('first_day', models.DateField()),
+                ('last_day', models.DateField()),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='habits.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+def backfill_period_points(apps, schema_editor):
+    HabitLog = apps.get_model("habits", "HabitLog")
+    PeriodPoints = apps.get_model("habits", "PeriodPoints")
+    completed = HabitLog.objects.filter(completed=True).order_by()
+    for period, trunc in (("week", TruncWeek), ("month", TruncMonth)):
+        rows = (
+            completed.annotate(start=trunc("date"))
+            .values("habit__user_id", "start")
+            .annotate(points=Sum("points_awarded"))
+        )
+        PeriodPoints.objects.bulk_create(
+            [
+                PeriodPoints(user_id=row["habit__user_id"], period=period, start=row["start"], points=row["points"])
+                for row in rows.iterator(chunk_size=5000)
+            ],
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_habit_monthly_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Semana'), ('month', 'Mes'), ('all', 'Histórico')], max_length=5)),
+                ('start', models.DateField()),
+                ('taken_at', models.DateTimeField(auto_now=True)),
+                ('participants', models.PositiveIntegerField(default=0)),
+                ('top', models.JSONField(default=list)),
+            ],
+            options={
+                'unique_together': {('period', 'start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PeriodPoints',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Semana'), ('month', 'Mes'), ('all', 'Histórico')], max_length=5)),
+                ('start', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_points', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'start', '-points'], name='period_points_rank_idx')],
+                'unique_together': {('user', 'period', 'start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRankSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Semana'), ('month', 'Mes'), ('all', 'Histórico')], max_length=5)),
+                ('start', models.DateField()),
+                ('rank', models.PositiveIntegerField()),
+                ('points', models.IntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rank_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'period', 'start')},
+            },
+        ),
+        migrations.RunPython(backfill_period_points, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:48
+
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import migrations, models
+
+
+def backfill_streak_state(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    HabitLog = apps.get_model("habits", "HabitLog")
+    rows = (
+        HabitLog.objects.filter(completed=True)
+        .order_by("habit_id", "date")
+        .values_list("habit_id", "date")
+        .iterator(chunk_size=5000)
+    )
+    updated = []
+    for habit_id, habit_rows in groupby(rows, key=lambda row: row[0]):
+        current = longest = 0
+        last = None
+        for _, day in habit_rows:
+            current = current + 1 if last is not None and day - last == timedelta(days=1) else 1
+            longest = max(longest, current)
+            last = day
+        updated.append(Habit(pk=habit_id, current_streak=current, longest_streak=longest, last_completed=last))
+    Habit.objects.bulk_update(updated, ["current_streak", "longest_streak", "last_completed"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0008_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='current_streak',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_completed',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='longest_streak',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_streak_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:52
+
+from datetime import timedelta
+from itertools import groupby
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def backfill_periodic_streaks(apps, schema_editor):
+    """Recalcula las rachas semanales por semanas ISO y fija ``streak_expires`` en todos.
+
+    Al añadir el campo todos los intervalos valen 1, así que los "custom" se comportan
+    como diarios; solo los semanales cambian de unidad.
+    """
+    Habit = apps.get_model("habits", "Habit")
+    HabitLog = apps.get_model("habits", "HabitLog")
+    weekly = set(Habit.objects.filter(periodicity="weekly").values_list("id", flat=True))
+    rows = (
+        HabitLog.objects.filter(completed=True)
+        .order_by("habit_id", "date")
+        .values_list("habit_id", "date")
+        .iterator(chunk_size=5000)
+    )
+    updated = []
+    for habit_id, habit_rows in groupby(rows, key=lambda row: row[0]):
+        is_weekly = habit_id in weekly
+        current = longest = 0
+        last = None
+        for _, day in habit_rows:
+            period = day - timedelta(days=day.weekday()) if is_weekly else day
+            if period == last:
+                continue
+            step = timedelta(days=7 if is_weekly else 1)
+            current = current + 1 if last is not None and period - last == step else 1
+            longest = max(longest, current)
+            last = period
+        # Fin del periodo siguiente al último completado
+        expires = last + timedelta(days=13) if is_weekly else last + timedelta(days=1)
+        updated.append(Habit(pk=habit_id, current_streak=current, longest_streak=longest, streak_expires=expires))
+    Habit.objects.bulk_update(updated, ["current_streak", "longest_streak", "streak_expires"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_habit_streak_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='interval_days',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='streak_expires',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_periodic_streaks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:55
+
+from itertools import groupby
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_ledger(apps, schema_editor):
+    """Un movimiento por log completado y, si el perfil no cuadra, uno de saldo inicial.
+
+    Así, tras migrar, la suma del libro, el último ``balance`` y ``total_points`` coinciden.
+    """
+    HabitLog = apps.get_model("habits", "HabitLog")
+    PointsLedger = apps.get_model("habits", "PointsLedger")
+    UserProfile = apps.get_model("habits", "UserProfile")
+    totals = dict(UserProfile.objects.values_list("user_id", "total_points"))
+    rows = (
+        HabitLog.objects.filter(completed=True)
+        .order_by("habit__user_id", "date", "id")
+        .values_list("habit__user_id", "habit_id", "date", "points_awarded")
+        .iterator(chunk_size=5000)
+    )
+    batch = []
+    seen = set()
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        seen.add(user_id)
+        balance, last_day = 0, None
+        for _, habit_id, day, points in user_rows:
+            balance += points
+            last_day = day
+            batch.append(PointsLedger(
+                user_id=user_id, habit_id=habit_id, date=day, delta=points, balance=balance, reason="backfill",
+            ))
+        difference = totals.get(user_id, balance) - balance
+        if difference:
+            batch.append(PointsLedger(
+                user_id=user_id, date=last_day, delta=difference, balance=balance + difference,
+                reason="backfill", note="Saldo inicial del perfil",
+            ))
+        if len(batch) >= 5000:
+            PointsLedger.objects.bulk_create(batch)
+            batch = []
+    today = django.utils.timezone.localdate()
+    batch += [
+        PointsLedger(
+            user_id=user_id, date=today, delta=total, balance=total, reason="backfill", note="Saldo inicial del perfil",
+        )
+        for user_id, total in totals.items()
+        if total and user_id not in seen
+    ]
+    PointsLedger.objects.bulk_create(batch, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_habit_periodicity_streaks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('delta', models.IntegerField()),
+                ('balance', models.IntegerField()),
+                ('reason', models.CharField(choices=[('completion', 'Completado'), ('adjustment', 'Ajuste manual'), ('backfill', 'Histórico')], max_length=12)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('habit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_entries', to='habits.habit')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-id'], name='ledger_user_latest_idx'), models.Index(fields=['user', 'date'], include=('delta',), name='ledger_user_date_idx'), models.Index(fields=['date'], include=('user', 'delta'), name='ledger_date_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
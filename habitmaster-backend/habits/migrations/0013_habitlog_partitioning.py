@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:04
+
+from datetime import date, timedelta
+
+from django.db import migrations, models
+
+from habits import partitions
+
+
+def partition_habitlog(apps, schema_editor):
+    """Solo en Postgres: la tabla pasa a particionarse por mes; el estado de Django no cambia."""
+    connection = schema_editor.connection
+    if not partitions.supported(connection) or partitions.is_partitioned(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(date) FROM {partitions.TABLE}")
+        first = cursor.fetchone()[0]
+    today = date.today()
+    partitions.partition_table(connection, first or today, today + timedelta(days=93))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0012_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.CharField(max_length=63, unique=True)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('mode', models.CharField(choices=[('file', 'Fichero comprimido'), ('table', 'Tabla fría')], max_length=8)),
+                ('location', models.CharField(max_length=255)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('start',),
+            },
+        ),
+        # Al revertir la tabla sigue particionada; para Django es la misma tabla
+        migrations.RunPython(partition_habitlog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _search_indexes(apps):
+    """Índices de las búsquedas del admin con las mismas expresiones que genera Django en Postgres."""
+    users = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    return [
+        # icontains -> UPPER(name::text) LIKE '%...%': trigram
+        ("habit_name_trgm_idx", "habits_habit USING gin (UPPER(name::text) gin_trgm_ops)"),
+        # ^username (istartswith) -> UPPER(username::text) LIKE '...%': btree por prefijo
+        ("user_username_prefix_idx", f"{users} (UPPER(username::text) text_pattern_ops)"),
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, definition in _search_indexes(apps):
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in _search_indexes(apps):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0013_habitlog_partitioning'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='achievement',
+            index=models.Index(fields=['earned_on'], name='achievement_earned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitlog',
+            index=models.Index(fields=['date'], name='habitlog_date_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations
+
+INDEX = "user_email_lower_uniq"
+
+
+def create_email_index(apps, schema_editor):
+    """Email único sin distinguir mayúsculas (los vacíos no cuentan); el registro depende de ello."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    table = User._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT LOWER(email) FROM {table} WHERE email <> '' GROUP BY LOWER(email) HAVING COUNT(*) > 1 LIMIT 5"
+        )
+        duplicated = [row[0] for row in cursor.fetchall()]
+    if duplicated:
+        raise RuntimeError(
+            f"Hay emails repetidos en {table} ({', '.join(duplicated)}...); resuélvelos antes de migrar."
+        )
+    schema_editor.execute(f"CREATE UNIQUE INDEX {INDEX} ON {table} (LOWER(email)) WHERE email <> ''")
+
+
+def drop_email_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0014_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
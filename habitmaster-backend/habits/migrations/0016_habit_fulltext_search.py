@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from habits import fulltext
+
+
+def install_search(apps, schema_editor):
+    """tsvector + GIN en Postgres, FTS5 en SQLite; fuera del estado de Django (ver habits.fulltext)."""
+    fulltext.install(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    fulltext.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0015_user_email_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0017_throttle_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='ranking_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0018_group_ranking_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointsledger',
+            name='reason',
+            field=models.CharField(choices=[('completion', 'Completado'), ('adjustment', 'Ajuste manual'), ('backfill', 'Histórico'), ('recompute', 'Recálculo desde los logs')], max_length=12),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from habits import fulltext
+
+
+def refold_search(apps, schema_editor):
+    """Postgres: trigger y search_vector con el texto sin tildes (SQLite ya los pliega en FTS5)."""
+    if schema_editor.connection.vendor == "postgresql":
+        fulltext.rebuild(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0019_ledger_recompute_reason'),
+    ]
+
+    operations = [
+        migrations.RunPython(refold_search, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
+import secrets
+
 from django.conf import settings
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Cast
+from django.utils import timezone
 
 
 class Habit(models.Model):
@@ -17,14 +22,55 @@ class Habit(models.Model):
     name = models.CharField(max_length=120)
     description = models.TextField(blank=True)
     periodicity = models.CharField(max_length=12, choices=Periodicity.choices, default=Periodicity.DAILY)
+    # Longitud en días del periodo de los hábitos "custom"
+    interval_days = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
     points_value = models.PositiveIntegerField(default=10)
     difficulty = models.CharField(max_length=12, choices=Difficulty.choices, default=Difficulty.MEDIUM)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Estado de racha mantenido en complete_habit (evita recorrer los logs al listar).
+    # Las rachas cuentan periodos (días, semanas o ventanas); ``streak_expires`` es el
+    # último día en que la racha sigue viva sin un nuevo completado.
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    last_completed = models.DateField(null=True, blank=True)
+    streak_expires = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "updated_at"], name="habit_user_updated_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.name} ({self.user})"
 
 
+def _insert_log_tombstones(queryset, using) -> None:
+    """Una lápida por log del queryset con un solo INSERT ... SELECT."""
+    rows = queryset.order_by().annotate(
+        tombstone_kind=models.Value(Tombstone.Kind.LOG, output_field=models.CharField()),
+        tombstone_key=Cast("pk", models.CharField()),
+        tombstone_at=models.Value(timezone.now(), output_field=models.DateTimeField()),
+    ).values_list("habit__user_id", "tombstone_kind", "tombstone_key", "tombstone_at")
+    sql, params = rows.query.get_compiler(using).as_sql()
+    connection = connections[using]
+    table = connection.ops.quote_name(Tombstone._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} (user_id, kind, object_key, deleted_at) {sql}", params)
+
+
+class HabitLogQuerySet(models.QuerySet):
+    def delete(self):
+        # Solo borrados directos (admin, shell): la cascada de hábitos y usuarios
+        # usa el manager base y no deja lápidas de logs.
+        using = self._db or router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            _insert_log_tombstones(self, using)
+            return super().delete()
+
+    delete.alters_data = True
+
+
 class HabitLog(models.Model):
     habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="logs")
     date = models.DateField()
@@ -32,14 +78,46 @@ class HabitLog(models.Model):
     points_awarded = models.IntegerField(default=0)
     note = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = HabitLogQuerySet.as_manager()
 
     class Meta:
         unique_together = ("habit", "date")
         ordering = ("-date",)
+        indexes = [
+            models.Index(fields=["habit", "updated_at"], name="habitlog_habit_updated_idx"),
+            # Navegación por fechas del admin (date_hierarchy)
+            models.Index(fields=["date"], name="habitlog_date_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.habit.name} - {self.date}"
 
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            _insert_log_tombstones(HabitLog.objects.filter(pk=self.pk), using)
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+class HabitMonthlyRollup(models.Model):
+    """Completados y puntos de un hábito en un mes cerrado (ver rollup_habit_stats)."""
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name="monthly_rollups")
+    # Primer día del mes
+    month = models.DateField()
+    completions = models.PositiveIntegerField(default=0)
+    points = models.IntegerField(default=0)
+    first_day = models.DateField()
+    last_day = models.DateField()
+
+    class Meta:
+        unique_together = ("habit", "month")
+
+    def __str__(self) -> str:
+        return f"{self.habit_id} {self.month:%Y-%m}: {self.completions}"
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="profile")
@@ -48,19 +126,301 @@ class UserProfile(models.Model):
     current_streak = models.PositiveIntegerField(default=0)
     longest_streak = models.PositiveIntegerField(default=0)
     last_completed = models.DateField(null=True, blank=True)
+    # Bits de AchievementRule.bit ya obtenidos (evita consultar Achievement en cada completado)
+    achievement_mask = models.BigIntegerField(default=0)
+    # Contadores de completados: {"habits": {"<id>": n}, "difficulty": {"hard": n}}
+    completion_counts = models.JSONField(default=dict, blank=True)
+    # Zona horaria IANA del usuario (define su "hoy" para rachas y avisos)
+    timezone = models.CharField(max_length=64, default="UTC")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["timezone", "last_completed"], name="profile_tz_last_completed_idx"),
+            models.Index(fields=["total_points"], name="profile_total_points_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Perfil {self.user.username}"
 
 
+class PointsLedger(models.Model):
+    """Movimiento de puntos; solo se añaden filas.
+
+    ``balance`` es el total del usuario tras el movimiento, así que el último
+    movimiento da el total vigente sin sumar el historial.
+    """
+
+    class Reason(models.TextChoices):
+        COMPLETION = "completion", "Completado"
+        ADJUSTMENT = "adjustment", "Ajuste manual"
+        BACKFILL = "backfill", "Histórico"
+        # Corrección de recompute_profiles para que el libro cuadre con los logs
+        RECOMPUTE = "recompute", "Recálculo desde los logs"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="points_entries")
+    habit = models.ForeignKey(Habit, on_delete=models.SET_NULL, null=True, blank=True, related_name="points_entries")
+    # Día al que se imputan los puntos (el del completado, no el de la escritura)
+    date = models.DateField()
+    delta = models.IntegerField()
+    balance = models.IntegerField()
+    reason = models.CharField(max_length=12, choices=Reason.choices)
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-id"], name="ledger_user_latest_idx"),
+            # Sumas por rango de fechas; en Postgres el delta va en el índice (index-only scan)
+            models.Index(fields=["user", "date"], include=["delta"], name="ledger_user_date_idx"),
+            models.Index(fields=["date"], include=["user", "delta"], name="ledger_date_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("PointsLedger es de solo inserción: registra un ajuste en su lugar")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("PointsLedger es de solo inserción: registra un ajuste en su lugar")
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.date} {self.delta:+d} ({self.reason})"
+
+
+class Period(models.TextChoices):
+    WEEK = "week", "Semana"
+    MONTH = "month", "Mes"
+    ALL = "all", "Histórico"
+
+
+class PeriodPoints(models.Model):
+    """Puntos de un usuario en una semana o mes; se incrementa en cada completado."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="period_points")
+    period = models.CharField(max_length=5, choices=Period.choices)
+    # Lunes de la semana o día 1 del mes
+    start = models.DateField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "period", "start")
+        indexes = [
+            models.Index(fields=["period", "start", "-points"], name="period_points_rank_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.period} {self.start}: {self.points}"
+
+
+class LeaderboardSnapshot(models.Model):
+    """Top-K congelado de una ventana (ver snapshot_leaderboards)."""
+
+    period = models.CharField(max_length=5, choices=Period.choices)
+    # Inicio de la ventana; en "all" es el día del snapshot
+    start = models.DateField()
+    taken_at = models.DateTimeField(auto_now=True)
+    participants = models.PositiveIntegerField(default=0)
+    # [[username, puntos], ...] ordenado por posición
+    top = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ("period", "start")
+
+    def __str__(self) -> str:
+        return f"{self.period} {self.start} ({self.participants})"
+
+
+class UserRankSnapshot(models.Model):
+    """Posición de un usuario en una ventana ya fotografiada (historial de ranking)."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="rank_snapshots")
+    period = models.CharField(max_length=5, choices=Period.choices)
+    start = models.DateField()
+    rank = models.PositiveIntegerField()
+    points = models.IntegerField()
+
+    class Meta:
+        # También sirve para leer el historial de un usuario (user, period, start)
+        unique_together = ("user", "period", "start")
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.period} {self.start}: #{self.rank}"
+
+
+def _invite_code() -> str:
+    return secrets.token_urlsafe(6)
+
+
+class Group(models.Model):
+    """Grupo de amigos/equipo con su propio ranking."""
+
+    name = models.CharField(max_length=120)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="owned_groups")
+    invite_code = models.CharField(max_length=16, unique=True, default=_invite_code)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Forma parte de la clave de caché del ranking: subirla lo invalida en todos los workers
+    ranking_version = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class GroupMembership(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name="memberships")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="group_memberships")
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # (group, user) para rankear un grupo; (user, group) para invalidar sus cachés
+        unique_together = ("group", "user")
+        indexes = [
+            models.Index(fields=["user", "group"], name="membership_user_group_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} en {self.group_id}"
+
+
 class Achievement(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="achievements")
     code = models.CharField(max_length=50)
     name = models.CharField(max_length=120)
     earned_on = models.DateField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "code")
+        indexes = [
+            models.Index(fields=["user", "updated_at"], name="achievement_user_updated_idx"),
+            models.Index(fields=["earned_on"], name="achievement_earned_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.user.username} - {self.name}"
+
+
+class Tombstone(models.Model):
+    """Registro de borrados para la sincronización incremental (/api/sync/)."""
+
+    class Kind(models.TextChoices):
+        HABIT = "habit", "Hábito"
+        LOG = "log", "Registro"
+        ACHIEVEMENT = "achievement", "Logro"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tombstones")
+    kind = models.CharField(max_length=12, choices=Kind.choices)
+    # id del objeto borrado (code en logros, que es su clave natural para el cliente)
+    object_key = models.CharField(max_length=64)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "deleted_at"], name="tombstone_user_deleted_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.object_key} ({self.deleted_at:%Y-%m-%d})"
+
+
+class AchievementRule(models.Model):
+    """Definición de un logro como datos; se compila en logic_rules.achievements."""
+
+    class Metric(models.TextChoices):
+        STREAK = "streak", "Racha actual"
+        TOTAL_POINTS = "total_points", "Puntos totales"
+        HABIT_COMPLETIONS = "habit_completions", "Completados de un hábito"
+        DIFFICULTY_COMPLETIONS = "difficulty_completions", "Completados por dificultad"
+
+    class Comparison(models.TextChoices):
+        AT_LEAST = "gte", "Mayor o igual"
+        EXACTLY = "eq", "Igual"
+
+    code = models.CharField(max_length=50, unique=True)
+    name = models.CharField(max_length=120)
+    metric = models.CharField(max_length=32, choices=Metric.choices)
+    comparison = models.CharField(max_length=3, choices=Comparison.choices, default=Comparison.AT_LEAST)
+    threshold = models.PositiveIntegerField()
+    # Solo para DIFFICULTY_COMPLETIONS
+    difficulty = models.CharField(max_length=12, choices=Habit.Difficulty.choices, blank=True)
+    # Posición en UserProfile.achievement_mask (0-62)
+    bit = models.PositiveSmallIntegerField(unique=True, validators=[MaxValueValidator(62)])
+    active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ("bit",)
+
+    def __str__(self) -> str:
+        return f"{self.code} ({self.get_metric_display()} {self.comparison} {self.threshold})"
+
+
+class Job(models.Model):
+    """Trabajo diferido (ver controller.jobs); la propia tabla hace de cola, sin broker."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pendiente"
+        RUNNING = "running", "En curso"
+        DONE = "done", "Hecho"
+        FAILED = "failed", "Fallido"
+
+    kind = models.CharField(max_length=40)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Solo los pendientes: el índice no crece con el histórico de trabajos hechos
+            models.Index(
+                fields=["run_after", "id"], condition=models.Q(status="pending"), name="job_pending_idx"
+            ),
+            models.Index(fields=["status", "locked_at"], name="job_status_locked_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class ThrottleBucket(models.Model):
+    """Cubo de fichas del limitador (habitmaster_backend.throttling, almacén "database")."""
+
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField()
+    # Epoch en segundos de la última recarga
+    updated = models.FloatField()
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.tokens:.1f}"
+
+
+class LogArchive(models.Model):
+    """Partición de HabitLog sacada de la tabla caliente (ver habits.partitions).
+
+    Sus meses quedan consolidados en HabitMonthlyRollup; los logs se conservan en
+    un fichero comprimido o en una tabla fría, fuera de las consultas de la app.
+    """
+
+    class Mode(models.TextChoices):
+        FILE = "file", "Fichero comprimido"
+        TABLE = "table", "Tabla fría"
+
+    partition = models.CharField(max_length=63, unique=True)
+    start = models.DateField()
+    # Exclusivo, como el límite de la partición
+    end = models.DateField()
+    mode = models.CharField(max_length=8, choices=Mode.choices)
+    location = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("start",)
+
+    def __str__(self) -> str:
+        return f"{self.partition} → {self.location}"
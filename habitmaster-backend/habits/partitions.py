@@ -0,0 +1,259 @@
+"""
+Particionado por rango de fecha de HabitLog (solo Postgres).
+
+``habits_habitlog`` pasa a ser ``PARTITION BY RANGE (date)`` con una partición por
+mes (``habits_habitlog_p2025_01``) o por año (``habits_habitlog_p2025``) y una
+DEFAULT para las fechas sin partición. La clave primaria es (id, date) porque
+Postgres exige que contenga la columna de partición; ``id`` sigue siendo único
+(sale de una sola secuencia). Las consultas con filtro de fecha (la semana en
+curso, ``date = hoy``) solo leen las particiones que tocan.
+
+Las particiones frías se archivan (``archive_partition``): antes se consolidan sus
+meses en HabitMonthlyRollup, así que estadísticas, puntos y rachas guardadas no
+cambian aunque sus logs salgan de la tabla caliente.
+"""
+import gzip
+import re
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+TABLE = "habits_habitlog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+INTERVALS = ("month", "year")
+_BOUND = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+def supported(connection) -> bool:
+    return connection.vendor == "postgresql"
+
+
+def is_partitioned(connection) -> bool:
+    if not supported(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def bounds(day: date, interval: str) -> Tuple[date, date]:
+    """[inicio, fin) de la partición que contiene ``day``."""
+    if interval == "year":
+        return date(day.year, 1, 1), date(day.year + 1, 1, 1)
+    start = day.replace(day=1)
+    return start, date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start: date, interval: str) -> str:
+    return f"{TABLE}_p{start:%Y}" if interval == "year" else f"{TABLE}_p{start:%Y_%m}"
+
+
+def list_partitions(connection) -> List[Dict]:
+    """Particiones con rango (sin la DEFAULT), ordenadas por fecha."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound, estimated_rows in rows:
+        match = _BOUND.search(bound or "")
+        if match:
+            partitions.append({
+                "name": name,
+                "start": date.fromisoformat(match.group(1)),
+                "end": date.fromisoformat(match.group(2)),
+                "rows": max(0, int(estimated_rows)),
+            })
+    return sorted(partitions, key=lambda partition: partition["start"])
+
+
+def create_partition(connection, day: date, interval: str) -> Optional[str]:
+    """Crea la partición que contiene ``day``; devuelve su nombre o None si ya existía.
+
+    Si la DEFAULT ya tiene filas de ese rango, se separa, se mueven las filas a la
+    partición nueva y se vuelve a adjuntar (Postgres no deja crearla con ellas dentro).
+    """
+    start, end = bounds(day, interval)
+    name = partition_name(start, interval)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", [name])
+        if cursor.fetchone():
+            return None
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s)", [start, end]
+        )
+        misplaced = cursor.fetchone()[0]
+        if misplaced:
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        if misplaced:
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *) "
+                f"INSERT INTO {TABLE} SELECT * FROM moved",
+                [start, end],
+            )
+            cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    return name
+
+
+def ensure_partitions(connection, first: date, last: date, interval: str) -> List[str]:
+    """Crea las particiones que falten entre ``first`` y ``last`` (incluidos)."""
+    created, day = [], first
+    while day <= last:
+        name = create_partition(connection, day, interval)
+        if name:
+            created.append(name)
+        day = bounds(day, interval)[1]
+    return created
+
+
+def _table_definitions(cursor) -> Tuple[List[Tuple[str, str, List[str], str]], List[str]]:
+    """Restricciones (nombre, tipo, columnas, definición) e índices sueltos de la tabla.
+
+    Las definiciones salen del catálogo tal cual (``pg_get_constraintdef`` y
+    ``pg_get_indexdef``), así que CHECK, tipo de índice, INCLUDE y WHERE se conservan.
+    """
+    cursor.execute(
+        """
+        SELECT c.conname, c.contype,
+            ARRAY(
+                SELECT a.attname FROM unnest(c.conkey) WITH ORDINALITY AS k(attnum, n)
+                JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+                ORDER BY k.n
+            ),
+            pg_get_constraintdef(c.oid)
+        FROM pg_constraint c
+        WHERE c.conrelid = %s::regclass
+        ORDER BY c.contype = 'p' DESC, c.conname
+        """,
+        [TABLE],
+    )
+    constraints = [tuple(row) for row in cursor.fetchall()]
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+        WHERE i.indrelid = %s::regclass AND NOT EXISTS (
+            SELECT 1 FROM pg_constraint c WHERE c.conrelid = i.indrelid AND c.conindid = i.indexrelid
+        )
+        """,
+        [TABLE],
+    )
+    return constraints, [row[0] for row in cursor.fetchall()]
+
+
+def _partitioned_constraint(name: str, kind: str, columns: List[str], definition: str) -> Optional[str]:
+    """Definición válida en la tabla particionada; None si ``LIKE`` ya la copió.
+
+    Lanza ValueError con lo que no se puede trasladar sin cambiar su significado.
+    """
+    if kind == "n":
+        return None
+    if kind not in ("p", "u", "f", "c"):
+        raise ValueError(f"{name}: restricción de tipo {kind!r} no soportada al particionar {TABLE}")
+    if kind in ("p", "u") and "date" not in columns:
+        # La clave primaria gana la columna de partición; un UNIQUE sin ella dejaría de serlo
+        if kind == "u" or " INCLUDE " in definition:
+            raise ValueError(f"{name}: {definition} no incluye la columna de partición (date)")
+        return f"PRIMARY KEY ({', '.join(columns)}, date)"
+    return definition
+
+
+def partition_table(connection, first: date, last: date, interval: str = "month") -> List[str]:
+    """Convierte ``habits_habitlog`` en tabla particionada conservando filas, nombres e identidad.
+
+    Se hace en una transacción: tabla nueva con la misma definición, particiones
+    del rango de datos más la DEFAULT, copia, borrado de la antigua y recreación
+    de restricciones e índices con los nombres y definiciones originales. Si hay
+    algo que no se puede trasladar se lanza ValueError antes de tocar la tabla.
+    """
+    with connection.cursor() as cursor:
+        constraints, indexes = _table_definitions(cursor)
+        statements = []
+        for name, kind, columns, definition in constraints:
+            definition = _partitioned_constraint(name, kind, columns, definition)
+            if definition is not None:
+                statements.append(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        # Capturadas antes del RENAME: apuntan a habits_habitlog, que será la tabla nueva
+        statements.extend(indexes)
+
+        legacy = f"{TABLE}_unpartitioned"
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY RANGE (date)"
+        )
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+    created = ensure_partitions(connection, first, last, interval)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {legacy}")
+        cursor.execute(f"DROP TABLE {legacy}")
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+    return created
+
+
+def copy_to(cursor, sql: str, target) -> None:
+    """Vuelca ``COPY ... TO STDOUT`` en ``target`` (fichero binario) por bloques.
+
+    Django usa psycopg3 si está instalado (``cursor.copy``); con psycopg2 queda
+    ``copy_expert``.
+    """
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        with cursor.copy(sql) as copy:
+            for chunk in copy:
+                target.write(chunk)
+    else:
+        cursor.copy_expert(sql, target)
+
+
+def archive_partition(connection, partition: Dict, mode: str, directory: Optional[Path] = None) -> Dict:
+    """Saca una partición del árbol caliente tras consolidar sus meses en rollups.
+
+    ``mode="file"``: se vuelca a ``<directory>/<nombre>.csv.gz`` y se borra.
+    ``mode="table"``: se separa y renombra a ``habits_habitlog_archive_*`` (tabla fría
+    consultable con SQL, fuera de las consultas de la aplicación).
+    """
+    from controller import statistics
+    from habits.models import LogArchive
+
+    name = partition["name"]
+    with transaction.atomic(using=connection.alias):
+        rolled = statistics.rollup_range(partition["start"], partition["end"])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {name}")
+            rows = cursor.fetchone()[0]
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+            if mode == "file":
+                path = Path(directory) / f"{name}.csv.gz"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with gzip.open(path, "wb") as target:
+                    copy_to(cursor, f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", target)
+                cursor.execute(f"DROP TABLE {name}")
+                location = str(path)
+            else:
+                location = name.replace(TABLE, f"{TABLE}_archive", 1)
+                cursor.execute(f"ALTER TABLE {name} RENAME TO {location}")
+        LogArchive.objects.using(connection.alias).create(
+            partition=name,
+            start=partition["start"],
+            end=partition["end"],
+            mode=mode,
+            location=location,
+            rows=rows,
+        )
+    return {"partition": name, "rows": rows, "rollups": rolled, "location": location}
@@ -1,17 +1,94 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
 from rest_framework import serializers
 
-from .models import Achievement, Habit, HabitLog, UserProfile
+from .models import Achievement, Group, Habit, HabitLog, UserProfile
+
+
+def _split(value: str) -> Set[str]:
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+@dataclass
+class Fieldset:
+    """Campos pedidos con ``?fields=a,b,rel.c`` y relaciones pedidas con ``?expand=rel``."""
+
+    fields: Optional[Set[str]] = None
+    nested: Dict[str, Set[str]] = field(default_factory=dict)
+    expand: Set[str] = field(default_factory=set)
+
+    @classmethod
+    def from_query_params(cls, params) -> "Fieldset":
+        fieldset = cls(expand=_split(params.get("expand", "")))
+        requested = _split(params.get("fields", ""))
+        if requested:
+            fieldset.fields = set()
+            for name in requested:
+                parent, _, child = name.partition(".")
+                fieldset.fields.add(parent)
+                if child:
+                    fieldset.nested.setdefault(parent, set()).add(child)
+        # Pedir sub-campos de una relación implica expandirla
+        fieldset.expand |= set(fieldset.nested)
+        return fieldset
+
+    def child(self, name: str) -> "Fieldset":
+        return Fieldset(fields=self.nested.get(name))
+
+    @property
+    def is_default(self) -> bool:
+        return self.fields is None and not self.expand
+
+
+class SparseFieldsetMixin:
+    """Recorta los campos del serializer según el ``Fieldset`` del contexto.
 
+    ``expandable_fields`` mapea relación -> (serializer anidado, expandida por defecto).
+    Sin ``?fields=`` se respeta el valor por defecto; con ``?fields=`` la relación se
+    devuelve como id salvo que se pida en ``?expand=`` o con sub-campos.
+    """
 
-class HabitSerializer(serializers.ModelSerializer):
+    expandable_fields = {}
+
+    def __init__(self, *args, fieldset: Optional[Fieldset] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = fieldset or self.context.get("fieldset")
+        if fieldset is None or fieldset.is_default:
+            return
+
+        for name, (serializer_class, default) in self.expandable_fields.items():
+            expanded = name in fieldset.expand or (fieldset.fields is None and default)
+            if expanded:
+                self.fields[name] = serializer_class(read_only=True, fieldset=fieldset.child(name))
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+        if fieldset.fields is not None:
+            for name in set(self.fields) - fieldset.fields:
+                self.fields.pop(name)
+
+
+class HabitSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Habit
-        fields = ("id", "name", "description", "periodicity", "points_value", "difficulty", "created_at")
+        fields = ("id", "name", "description", "periodicity", "interval_days", "points_value", "difficulty", "created_at")
         read_only_fields = ("id", "created_at")
 
 
-class HabitLogSerializer(serializers.ModelSerializer):
+class HabitStatusSerializer(HabitSerializer):
+    """Hábito con su estado del día (requiere ``annotate_habit_status``)."""
+    completed_today = serializers.BooleanField(read_only=True)
+    current_streak = serializers.IntegerField(source="active_streak", read_only=True)
+
+    class Meta(HabitSerializer.Meta):
+        fields = HabitSerializer.Meta.fields + ("completed_today", "last_completed", "current_streak", "longest_streak")
+        read_only_fields = HabitSerializer.Meta.read_only_fields + ("last_completed", "longest_streak")
+
+
+class HabitLogSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     habit = HabitSerializer(read_only=True)
+    expandable_fields = {"habit": (HabitSerializer, True)}
 
     class Meta:
         model = HabitLog
@@ -24,8 +101,16 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ("level", "total_points", "current_streak", "longest_streak", "last_completed")
 
 
-class AchievementSerializer(serializers.ModelSerializer):
+class AchievementSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Achievement
         fields = ("code", "name", "earned_on")
 
+
+class GroupSerializer(serializers.ModelSerializer):
+    member_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Group
+        fields = ("id", "name", "owner", "invite_code", "member_count", "created_at")
+        read_only_fields = ("owner", "invite_code", "created_at")
@@ -1,12 +1,51 @@
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import UserProfile
+from controller import leaderboards
+from logic_rules import achievements
 
+from .models import Achievement, AchievementRule, GroupMembership, Habit, Tombstone, UserProfile
 
-@receiver(post_save, sender=get_user_model())
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
+    # Un solo INSERT (sin SELECT previo); si el perfil ya existe no hace nada
     if created:
-        UserProfile.objects.get_or_create(user=instance)
+        UserProfile.objects.bulk_create([UserProfile(user=instance)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=AchievementRule)
+@receiver(post_delete, sender=AchievementRule)
+def invalidate_achievement_plan(sender, **kwargs):
+    achievements.invalidate_plan()
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def invalidate_group_ranking(sender, instance, **kwargs):
+    leaderboards.invalidate_group(instance.group_id)
+
+
+def _from_user_delete(origin) -> bool:
+    """Cascada de un usuario borrado: sus lápidas se irían con él."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, User)
+
+
+# Los logs no tienen receptores de borrado: así la cascada de un hábito o usuario
+# los borra con un solo DELETE y el cliente descarta los logs del hábito borrado.
+# Los borrados directos de logs dejan lápida en HabitLogQuerySet.delete().
+@receiver(post_delete, sender=Habit)
+def record_habit_tombstone(sender, instance, origin=None, **kwargs):
+    if not _from_user_delete(origin):
+        Tombstone.objects.create(user_id=instance.user_id, kind=Tombstone.Kind.HABIT, object_key=str(instance.pk))
+
 
+@receiver(post_delete, sender=Achievement)
+def record_achievement_tombstone(sender, instance, origin=None, **kwargs):
+    if not _from_user_delete(origin):
+        Tombstone.objects.create(user_id=instance.user_id, kind=Tombstone.Kind.ACHIEVEMENT, object_key=instance.code)
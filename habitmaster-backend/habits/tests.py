@@ -1,13 +1,55 @@
-from datetime import date
+import gzip
+import json
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from rest_framework.test import APIClient
 
-from controller.app_controller import HabitController
-from logic_rules import rules
-from processor import functional
-from .models import Habit, HabitLog
+from controller import accounts, jobs, leaderboards, points, statistics
+from controller.app_controller import HabitController, encode_sync_cursor
+from habitmaster_backend.instrumentation import database_pool_metrics
+from habitmaster_backend.settings import _database_config
+from habitmaster_backend.throttling import CompleteGlobalThrottle, DatabaseBucketStore, Rate, SQLiteBucketStore
+from habits import partitions
+from habits.management.commands import loadtest, recompute_profiles
+from habits.management.commands.profile_startup import parse_importtime
+from habits.viewsets import LEADERBOARD_PARAM_ERRORS
+from habitmaster_backend.db_router import PrimaryReplicaRouter, check_shared_cache, pin_to_primary, use_replica
+from logic_rules import achievements, rules
+from processor import functional, streaks
+from .models import (
+    Achievement,
+    AchievementRule,
+    Group,
+    GroupMembership,
+    Habit,
+    HabitLog,
+    Job,
+    LogArchive,
+    PeriodPoints,
+    PointsLedger,
+    ThrottleBucket,
+    Tombstone,
+    UserProfile,
+)
 
 
 class FunctionalModuleTests(TestCase):
@@ -43,8 +85,1321 @@ class ControllerTests(TestCase):
         self.assertGreater(result["points_awarded"], 0)
         self.assertIn("streak", result)
 
+    def test_complete_endpoint_uses_profile_timezone(self):
+        UserProfile.objects.filter(user=self.user).update(timezone="Pacific/Kiritimati")
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # 12:00 UTC del 1 de enero ya es día 2 en UTC+14
+        noon_utc = datetime(2025, 1, 1, 12, tzinfo=dt_timezone.utc)
+        with mock.patch("django.utils.timezone.now", return_value=noon_utc):
+            response = client.post(f"/api/habits/{self.habit.id}/complete/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["completed_on"], date(2025, 1, 2))
+
 
 class LogicRulesTests(TestCase):
     def test_rules_return_medals(self):
         medals = rules.check_achievements(30)
         self.assertIn("medalla_30", medals)
+
+    def test_kanren_is_loaded_lazily(self):
+        probe = "import sys, logic_rules.rules as r; a = 'kanren' in sys.modules; r.determine_level(0); print(a, 'kanren' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR).stdout
+        self.assertEqual(output.split(), ["False", "True"])
+
+    def test_determine_level_follows_thresholds(self):
+        self.assertEqual(rules.determine_level(0), 1)
+        self.assertEqual(rules.determine_level(250), 2)
+        self.assertEqual(rules.determine_level(5000), 5)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], DATABASE_REPLICA_MAX_LAG=0, DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = get_user_model().objects.create_user(username="lector", password="demo1234")
+
+    def test_reads_go_to_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Habit), "default")
+
+    def test_safe_reads_use_replica(self):
+        with use_replica(self.user):
+            self.assertEqual(self.router.db_for_read(Habit), "replica_1")
+        self.assertEqual(self.router.db_for_read(Habit), "default")
+
+    def test_atomic_blocks_stay_on_primary(self):
+        with use_replica(self.user):
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Habit), "default")
+
+    def test_recent_writer_is_pinned_to_primary(self):
+        pin_to_primary(self.user)
+        with use_replica(self.user):
+            self.assertEqual(self.router.db_for_read(Habit), "default")
+
+    def test_writes_and_migrations_only_on_primary(self):
+        self.assertEqual(self.router.db_for_write(Habit), "default")
+        self.assertFalse(self.router.allow_migrate("replica_1", "habits"))
+
+    @override_settings(CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": settings.CACHE_TABLE,
+    }})
+    def test_pin_is_shared_between_workers(self):
+        call_command("createcachetable", verbosity=0)
+        pin_to_primary(self.user)
+        # Otro worker: su propia instancia de caché sobre la misma tabla
+        other_worker = DatabaseCache(settings.CACHE_TABLE, {})
+        self.assertTrue(other_worker.get(f"db-pin:{self.user.pk}"))
+        with use_replica(self.user):
+            self.assertEqual(self.router.db_for_read(other_worker.cache_model_class), "default")
+        self.assertEqual(check_shared_cache(None), [])
+
+    def test_replicas_require_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ["habitmaster.E001"])
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_pooler_host_disables_server_side_cursors(self):
+        pooler = _database_config("postgresql://u:p@ep-demo-123-pooler.us-east-2.aws.neon.tech/db")
+        direct = _database_config("postgresql://u:p@ep-demo-123.us-east-2.aws.neon.tech/db")
+        self.assertTrue(pooler["DISABLE_SERVER_SIDE_CURSORS"])
+        self.assertFalse(direct.get("DISABLE_SERVER_SIDE_CURSORS", False))
+
+class ViewContextTests(TestCase):
+    def test_contexts_are_evaluated_inside_replica_block(self):
+        self.user = get_user_model().objects.create_user(username="lector", password="demo1234")
+        Habit.objects.create(user=self.user, name="Leer")
+        controller = HabitController()
+        for context in (controller.get_profile_context(self.user), controller.get_progress_context(self.user)):
+            self.assertIsInstance(context["habits"], list)
+        self.assertEqual(controller.get_profile_context(self.user)["total_habits"], 1)
+
+
+class MetricsTests(TestCase):
+    def test_pool_metrics_report_unpooled_alias(self):
+        self.assertEqual(database_pool_metrics()["default"], {"pooled": False})
+
+    def test_metrics_endpoint_requires_admin(self):
+        User = get_user_model()
+        user = User.objects.create_user(username="normal", password="demo1234")
+        admin = User.objects.create_superuser(username="root", password="demo1234")
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get("/api/metrics/").status_code, 403)
+        client.force_authenticate(admin)
+        response = client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("default", response.data["database_pools"])
+
+
+class AchievementEngineTests(TestCase):
+    def setUp(self):
+        achievements.invalidate_plan()
+        self.user = get_user_model().objects.create_user(username="logros", password="demo1234")
+        self.habit = Habit.objects.create(user=self.user, name="Leer", points_value=10)
+        self.controller = HabitController()
+
+    def tearDown(self):
+        achievements.invalidate_plan()
+
+    def _complete_days(self, days, end):
+        for offset in reversed(range(days)):
+            result = self.controller.complete_habit(self.user, self.habit.id, end - timedelta(days=offset))
+        return result
+
+    def test_compiled_plan_matches_thresholds(self):
+        def rule(code, metric, comparison, threshold, bit, difficulty=""):
+            return SimpleNamespace(
+                code=code, name=code, metric=metric, comparison=comparison,
+                threshold=threshold, bit=bit, difficulty=difficulty,
+            )
+
+        plan = achievements.compile_plan([
+            rule("r7", "streak", "gte", 7, 0),
+            rule("r30", "streak", "gte", 30, 1),
+            rule("semana", "streak", "eq", 7, 2),
+            rule("duro", "difficulty_completions", "gte", 2, 3, "hard"),
+        ])
+        profile = SimpleNamespace(
+            current_streak=7, total_points=0, achievement_mask=0b1,
+            completion_counts={"difficulty": {"hard": 2}},
+        )
+        satisfied, unlocked = achievements.evaluate(profile, plan=plan)
+        self.assertEqual(plan.codes(satisfied), ["r7", "semana", "duro"])
+        self.assertEqual(plan.codes(unlocked), ["semana", "duro"])
+
+    def test_completion_unlocks_streak_medals_once(self):
+        today = timezone.localdate()
+        result = self._complete_days(7, today)
+        self.assertIn("medalla_7", result["achievements"])
+        self.assertEqual(
+            set(Achievement.objects.filter(user=self.user).values_list("code", flat=True)),
+            {"medalla_7", "racha_semana"},
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.controller.complete_habit(self.user, self.habit.id, today + timedelta(days=1))
+        self.assertFalse(any("habits_achievement" in query["sql"] for query in queries.captured_queries))
+
+    def test_new_rule_is_picked_up(self):
+        AchievementRule.objects.create(
+            code="cien_puntos", name="Cien puntos", metric=AchievementRule.Metric.TOTAL_POINTS,
+            threshold=10, bit=40,
+        )
+        self.controller.complete_habit(self.user, self.habit.id, timezone.localdate())
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertTrue(profile.achievement_mask & (1 << 40))
+        self.assertTrue(Achievement.objects.filter(user=self.user, code="cien_puntos").exists())
+
+
+    @override_settings(CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": settings.CACHE_TABLE,
+    }})
+    def test_plan_version_is_not_read_on_every_completion(self):
+        call_command("createcachetable", verbosity=0)
+        plan = achievements.get_plan()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIs(achievements.get_plan(), plan)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        # Otro worker cambia las reglas: se ve al vencer VERSION_CHECK_TTL
+        DatabaseCache(settings.CACHE_TABLE, {}).set(achievements.VERSION_KEY, "otra", None)
+        self.assertIs(achievements.get_plan(), plan)
+        with mock.patch.object(achievements, "VERSION_CHECK_TTL", 0):
+            self.assertEqual(achievements.get_plan().version, "otra")
+
+
+class RecomputeProfilesCommandTests(TestCase):
+    def setUp(self):
+        achievements.invalidate_plan()
+        self.user = get_user_model().objects.create_user(username="recalculo", password="demo1234")
+        habit = Habit.objects.create(user=self.user, name="Correr", points_value=10, difficulty=Habit.Difficulty.EASY)
+        monday = date(2024, 12, 2)
+        for offset in range(3):
+            HabitLog.objects.create(habit=habit, date=monday + timedelta(days=offset), completed=True, points_awarded=1)
+        UserProfile.objects.filter(user=self.user).update(total_points=999, current_streak=0)
+        self.state_file = Path(tempfile.mkdtemp()) / "state.json"
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command("recompute_profiles", "--workers", "1", "--state-file", str(self.state_file), *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_without_writing(self):
+        output = self._run("--dry-run")
+        self.assertIn("total_points: 999 -> 30", output)
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_points, 999)
+
+    def test_rebuilds_profile_from_logs(self):
+        self._run()
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_points, 30)
+        self.assertEqual(profile.current_streak, 3)
+        self.assertEqual(profile.last_completed, date(2024, 12, 4))
+        self.assertEqual(profile.level, rules.determine_level(30))
+        self.assertFalse(self.state_file.exists())
+
+    def test_points_go_through_the_ledger(self):
+        points.record(self.user.pk, date(2024, 12, 1), 5, PointsLedger.Reason.ADJUSTMENT, note="bonus")
+        self._run()
+        # Los logs suman 30 y el ajuste manual se conserva; el libro cuadra con el perfil
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_points, 35)
+        self.assertEqual(points.reconcile([self.user.pk]), [])
+        entry = PointsLedger.objects.filter(user=self.user).latest("id")
+        self.assertEqual((entry.reason, entry.delta, entry.balance), (PointsLedger.Reason.RECOMPUTE, 30, 35))
+        self._run("--restart")
+        self.assertEqual(PointsLedger.objects.filter(user=self.user).count(), 2)
+
+    def test_level_threshold_change_is_saved(self):
+        self._run()
+        entries = PointsLedger.objects.filter(user=self.user).count()
+        levels = (("nivel_1", 0), ("nivel_2", 20))
+        with mock.patch.object(rules, "_table", lambda relation: levels if relation == "levels" else ()):
+            self.assertIn("level: 1 -> 2", self._run("--restart"))
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_points, profile.level), (30, 2))
+        self.assertEqual(PointsLedger.objects.filter(user=self.user).count(), entries)
+
+    def test_resume_skips_finished_ranges(self):
+        done = [[21, 30], [1, 10]]
+        self.assertEqual(recompute_profiles.pending_users(range(0, 35), done), [0, *range(11, 21), *range(31, 35)])
+
+
+class StreakAtRiskTests(TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 12, 10, 16, 0, tzinfo=dt_timezone.utc)
+        self.today = date(2024, 12, 10)
+        User = get_user_model()
+        self.at_risk = User.objects.create_user(username="riesgo", email="riesgo@example.com")
+        self.done = User.objects.create_user(username="hecho")
+        self.broken = User.objects.create_user(username="rota")
+        self.tokyo = User.objects.create_user(username="tokio")
+        yesterday = self.today - timedelta(days=1)
+        UserProfile.objects.filter(user=self.at_risk).update(current_streak=4, last_completed=yesterday)
+        UserProfile.objects.filter(user=self.done).update(current_streak=4, last_completed=yesterday)
+        UserProfile.objects.filter(user=self.broken).update(current_streak=4, last_completed=yesterday - timedelta(days=3))
+        # En Tokio ya es 11/12: completó "ayer" local (10/12) así que está en riesgo
+        UserProfile.objects.filter(user=self.tokyo).update(current_streak=2, last_completed=self.today, timezone="Asia/Tokyo")
+        habit = Habit.objects.create(user=self.done, name="Agua")
+        HabitLog.objects.create(habit=habit, date=self.today, completed=True)
+
+    def test_single_query_finds_users_at_risk(self):
+        controller = HabitController()
+        with self.assertNumQueries(2):
+            rows = list(controller.iter_streak_at_risk(now=self.now))
+        self.assertEqual({row["username"] for row in rows}, {"riesgo", "tokio"})
+
+    def test_endpoint_streams_ndjson(self):
+        admin = get_user_model().objects.create_superuser(username="admin", password="demo1234")
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get("/api/streaks/at-risk/")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(all("user_id" in json.loads(line) for line in lines))
+
+
+class StartupProfileTests(TestCase):
+    def test_parse_importtime(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       411 |      41075 | kanren\n"
+            "import time:        94 |         94 |   kanren.dispatch\n"
+        )
+        self.assertEqual(parse_importtime(stderr), [("kanren", 411, 41075), ("kanren.dispatch", 94, 94)])
+
+
+class LoadTestReportTests(TestCase):
+    def test_summary_and_slos(self):
+        samples = [
+            (loadtest.endpoint_label("POST", "/api/habits/7/complete/"), 200, 10.0),
+            (loadtest.endpoint_label("POST", "/api/habits/9/complete/"), 429, 1.0),
+            (loadtest.endpoint_label("GET", "/api/ranking/?x=1"), 200, 900.0),
+            (loadtest.endpoint_label("GET", "/api/ranking/"), 500, 5.0),
+        ]
+        summary = loadtest.summarize(samples, elapsed=2.0)
+        complete = summary["endpoints"]["POST /api/habits/{id}/complete/"]
+        self.assertEqual((complete["requests"], complete["errors"], complete["throttled"]), (2, 0, 1))
+        self.assertEqual(summary["endpoints"]["GET /api/ranking/"]["error_rate"], 0.5)
+        self.assertEqual(summary["rps"], 2.0)
+        failures = loadtest.evaluate_slos(summary, {"p95": 500, "error_rate": 0.1, "rps": 5})
+        self.assertEqual(len(failures), 3)
+
+    def test_refuses_outside_debug_and_removes_accounts(self):
+        args = ("loadtest", "--duration", "0", "--ramp-up", "0", "--users", "3", "--concurrency", "1")
+        with self.assertRaises(CommandError):
+            call_command(*args, stdout=StringIO())
+        out = StringIO()
+        call_command(*args, "--i-know-this-is-not-prod", "--base-url", "http://127.0.0.1:9", stdout=out)
+        self.assertIn("3 cuentas loadtest_* borradas", out.getvalue())
+        self.assertFalse(get_user_model().objects.filter(username__startswith=loadtest.PREFIX).exists())
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="campos", password="demo1234")
+        self.habit = Habit.objects.create(user=self.user, name="Leer", description="20 páginas")
+        HabitLog.objects.create(habit=self.habit, date=date(2024, 12, 1), completed=True, points_awarded=12)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        select = [q["sql"] for q in queries.captured_queries if "habits_habit" in q["sql"]][-1]
+        return response.data, select
+
+    def test_default_output_is_unchanged(self):
+        data, _ = self._get("/api/logs/")
+        self.assertEqual(data[0]["habit"]["description"], "20 páginas")
+        self.assertEqual(set(data[0]), {"id", "habit", "date", "completed", "points_awarded", "note"})
+
+    def test_fields_narrow_habit_columns(self):
+        data, sql = self._get("/api/habits/?fields=id,name")
+        self.assertEqual(data, [{"id": self.habit.id, "name": "Leer"}])
+        self.assertIn('"name"', sql)
+        self.assertNotIn("description", sql)
+        self.assertNotIn("points_value", sql)
+
+    def test_log_habit_is_id_unless_expanded(self):
+        data, sql = self._get("/api/logs/?fields=id,completed,habit")
+        self.assertEqual(data[0]["habit"], self.habit.id)
+        self.assertNotIn('"habits_habit"."name"', sql)
+        self.assertNotIn("points_awarded", sql)
+
+        data, sql = self._get("/api/logs/?fields=id,habit.name")
+        self.assertEqual(data[0], {"id": data[0]["id"], "habit": {"name": "Leer"}})
+        self.assertIn('"habits_habit"."name"', sql)
+        self.assertNotIn("description", sql)
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="sync", password="demo1234")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(user=self.user, name="Agua")
+        HabitLog.objects.create(habit=self.habit, date=date(2024, 12, 1), completed=True)
+
+    def test_full_then_incremental_sync(self):
+        first = self.client.get("/api/sync/").data
+        self.assertTrue(first["full"])
+        self.assertEqual([h["name"] for h in first["habits"]], ["Agua"])
+        self.assertEqual(first["logs"][0]["habit"], self.habit.id)
+
+        # Simula que el cursor se emitió hace una hora
+        old_cursor = encode_sync_cursor(timezone.now() - timedelta(hours=1))
+        Habit.objects.filter(pk=self.habit.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        HabitLog.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        new_habit = Habit.objects.create(user=self.user, name="Leer")
+
+        with CaptureQueriesContext(connection) as queries:
+            delta = self.client.get("/api/sync/", {"cursor": old_cursor}).data
+        self.assertFalse(delta["full"])
+        self.assertEqual([h["id"] for h in delta["habits"]], [new_habit.id])
+        self.assertEqual(delta["logs"], [])
+        self.assertEqual(len(queries), 4)
+
+    def test_deletes_return_tombstones(self):
+        cursor = self.client.get("/api/sync/").data["cursor"]
+        habit_id = self.habit.id
+        self.habit.delete()
+        delta = self.client.get("/api/sync/", {"cursor": cursor}).data
+        self.assertEqual(delta["deleted"]["habit"], [str(habit_id)])
+        # Los logs borrados en cascada no generan lápida propia
+        self.assertEqual(delta["deleted"]["log"], [])
+        self.assertFalse(Tombstone.objects.filter(kind=Tombstone.Kind.LOG).exists())
+
+    def _add_logs(self, habit, days):
+        for offset in range(1, days + 1):
+            HabitLog.objects.create(habit=habit, date=date(2024, 12, 1) + timedelta(days=offset), completed=True)
+
+    def test_habit_delete_fast_deletes_logs(self):
+        self._add_logs(self.habit, 10)
+        with CaptureQueriesContext(connection) as queries:
+            self.habit.delete()
+        sql = [q["sql"] for q in queries.captured_queries]
+        self.assertFalse([q for q in sql if q.startswith("SELECT") and "habits_habitlog" in q])
+        self.assertEqual(len([q for q in sql if q.startswith("INSERT") and "habits_tombstone" in q]), 1)
+        self.assertFalse(HabitLog.objects.exists())
+
+    def test_direct_log_delete_writes_tombstones_in_one_statement(self):
+        other = Habit.objects.create(user=self.user, name="Leer")
+        self._add_logs(self.habit, 5)
+        self._add_logs(other, 5)
+        with CaptureQueriesContext(connection) as queries:
+            HabitLog.objects.all().delete()
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Tombstone.objects.filter(user=self.user, kind=Tombstone.Kind.LOG).count(), 11)
+
+        log = HabitLog.objects.create(habit=other, date=date(2025, 1, 1), completed=True)
+        log_id = log.pk
+        log.delete()
+        self.assertTrue(Tombstone.objects.filter(kind=Tombstone.Kind.LOG, object_key=str(log_id)).exists())
+
+    def test_deleting_user_leaves_no_tombstones(self):
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/sync/", {"cursor": "nope"}).status_code, 400)
+
+
+class BootstrapTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="inicio", password="demo1234")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.controller = HabitController()
+
+    def _add_history(self, habits, days):
+        today = timezone.localdate()
+        for index in range(habits):
+            habit = Habit.objects.create(user=self.user, name=f"Hábito {index}")
+            for offset in range(days):
+                self.controller.complete_habit(self.user, habit.id, today - timedelta(days=offset))
+
+    def test_query_count_is_constant(self):
+        self._add_history(habits=1, days=2)
+        with self.assertNumQueries(5):
+            self.client.get("/api/bootstrap/")
+        self._add_history(habits=4, days=10)
+        with self.assertNumQueries(5):
+            response = self.client.get("/api/bootstrap/")
+        self.assertEqual(len(response.data["habits"]), 5)
+        self.assertTrue(all(habit["completed_today"] for habit in response.data["habits"]))
+        self.assertEqual(response.data["rank"], 1)
+
+    def test_fewer_queries_than_separate_calls(self):
+        self._add_history(habits=2, days=3)
+        with CaptureQueriesContext(connection) as separate:
+            for path in ("/api/profile/", "/api/habits/", "/api/logs/", "/api/achievements/", "/api/ranking/"):
+                self.client.get(path)
+        with CaptureQueriesContext(connection) as bootstrap:
+            response = self.client.get("/api/bootstrap/")
+        self.assertLess(len(bootstrap), len(separate))
+        profile = self.client.get("/api/profile/").data
+        self.assertEqual(response.data["profile"]["streak"], profile["streak"])
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sqlite_bucket_refills_over_time(self):
+        store = SQLiteBucketStore(Path(tempfile.mkdtemp()) / "throttle.sqlite3")
+        rate = Rate.parse("2/min")
+        self.assertEqual(rate, Rate(2, 2 / 60))
+        self.assertEqual(store.consume("k", rate, 1000.0), (True, 0.0))
+        self.assertEqual(store.consume("k", rate, 1000.0), (True, 0.0))
+        allowed, wait = store.consume("k", rate, 1000.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30.0)
+        self.assertTrue(store.consume("k", rate, 1030.0)[0])
+
+    def test_database_bucket_is_shared_and_purged(self):
+        rate = Rate.parse("2/min")
+        worker_a, worker_b = DatabaseBucketStore(), DatabaseBucketStore()
+        self.assertEqual(worker_a.consume("k", rate, 1000.0), (True, 0.0))
+        self.assertEqual(worker_b.consume("k", rate, 1000.0), (True, 0.0))
+        allowed, wait = worker_a.consume("k", rate, 1000.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30.0)
+        self.assertTrue(worker_b.consume("k", rate, 1030.0)[0])
+
+        worker_a.PURGE_EVERY = 1
+        worker_a.consume("otra", rate, 1000.0 + 2 * 86400)
+        self.assertEqual(list(ThrottleBucket.objects.values_list("key", flat=True)), ["otra"])
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"complete.user": "2/min", "complete.global": "100/min"},
+    })
+    def test_complete_is_limited_per_user(self):
+        User = get_user_model()
+        client = APIClient()
+        habit = Habit.objects.create(user=User.objects.create_user(username="abuso"), name="Spam")
+        client.force_authenticate(habit.user)
+        url = f"/api/habits/{habit.id}/complete/"
+        self.assertEqual(client.post(url).status_code, 200)
+        self.assertEqual(client.post(url).status_code, 200)
+        response = client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+        # Otro usuario no se ve afectado
+        other = Habit.objects.create(user=User.objects.create_user(username="normal"), name="Leer")
+        client.force_authenticate(other.user)
+        self.assertEqual(client.post(f"/api/habits/{other.id}/complete/").status_code, 200)
+
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"login.ip": "1/min"},
+    })
+    def test_forwarded_for_does_not_change_ip_bucket(self):
+        client = APIClient()
+        credentials = {"username": "nadie", "password": "x"}
+        self.assertEqual(client.post("/api/auth/login/", credentials, HTTP_X_FORWARDED_FOR="10.0.0.1").status_code, 401)
+        response = client.post("/api/auth/login/", credentials, HTTP_X_FORWARDED_FOR="10.0.0.2")
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(THROTTLE_GLOBAL_SHARDS=4, REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"complete.global": "8/min"},
+    })
+    def test_global_bucket_is_sharded(self):
+        throttle = CompleteGlobalThrottle()
+        with mock.patch("habitmaster_backend.throttling.random.randrange", return_value=0):
+            allowed = [throttle.allow_request(SimpleNamespace(user=None), None) for _ in range(3)]
+        self.assertEqual(allowed, [True, True, False])
+        with mock.patch("habitmaster_backend.throttling.random.randrange", return_value=1):
+            self.assertTrue(throttle.allow_request(SimpleNamespace(user=None), None))
+        self.assertEqual(
+            set(ThrottleBucket.objects.values_list("key", flat=True)),
+            {"complete.global:all:0", "complete.global:all:1"},
+        )
+
+class HabitStatisticsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="stats")
+        self.today = date(2025, 3, 20)
+        rng = random.Random(7)
+        self.logs = {}
+        for index, difficulty in enumerate(Habit.Difficulty.values):
+            habit = Habit.objects.create(user=self.user, name=f"Hábito {index}", difficulty=difficulty)
+            logs = []
+            for offset in range(120):
+                day = self.today - timedelta(days=offset)
+                completed = rng.random() < 0.75
+                points = functional.calculate_points(habit, day) if completed else 0
+                HabitLog.objects.create(habit=habit, date=day, completed=completed, points_awarded=points)
+                logs.append({"date": day, "completed": completed, "points": points})
+            self.logs[habit.id] = (habit, logs)
+
+    def _expected(self, habit, logs):
+        completed = [log for log in logs if log["completed"]]
+        return {
+            "completions": len(completed),
+            "total_points": sum(functional.calculate_points(habit, log["date"]) for log in completed),
+            "best_streak": functional.calculate_streak(logs),
+            "current_streak": functional.calculate_current_streak(logs, self.today),
+            "average_7d": functional.moving_average(logs, self.today, 7),
+            "average_30d": functional.moving_average(logs, self.today, 30),
+            "last_completed": max(log["date"] for log in completed),
+        }
+
+    def test_sql_matches_functional_reference(self):
+        with self.assertNumQueries(2):
+            data = statistics.habit_statistics(self.user, self.today, use_rollups=False)
+        self.assertEqual(len(data["habits"]), 3)
+        for row in data["habits"]:
+            habit, logs = self.logs[row["habit_id"]]
+            expected = self._expected(habit, logs)
+            self.assertEqual({key: row[key] for key in expected}, expected)
+            first_completed = min(log["date"] for log in logs if log["completed"])
+            tracked_days = (self.today - first_completed).days + 1
+            self.assertEqual(row["completion_rate"], round(expected["completions"] / tracked_days, 3))
+        self.assertEqual(data["user"]["completions"], sum(row["completions"] for row in data["habits"]))
+
+    def test_rollups_give_the_same_result(self):
+        without = statistics.habit_statistics(self.user, self.today, use_rollups=False)
+        self.assertGreater(statistics.rebuild_monthly_rollups(self.today.replace(day=1)), 0)
+        with_rollups = statistics.habit_statistics(self.user, self.today)
+        self.assertTrue(with_rollups["user"].pop("from_rollups"))
+        self.assertFalse(without["user"].pop("from_rollups"))
+        self.assertEqual(with_rollups, without)
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get("/api/habits/stats/", {"rollups": "0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["habits"]), 3)
+
+
+class DatabaseStreakTests(TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.today = date(2025, 6, 30)
+        self.user_days, self.habit_logs = {}, {}
+        for index in range(4):
+            user = get_user_model().objects.create_user(username=f"racha{index}")
+            days = {}
+            for habit_index in range(rng.randint(1, 3)):
+                habit = Habit.objects.create(user=user, name=f"H{habit_index}")
+                logs = []
+                for offset in range(90):
+                    if rng.random() < 0.3:
+                        continue
+                    day = self.today - timedelta(days=offset)
+                    completed = rng.random() < 0.85
+                    HabitLog.objects.create(habit=habit, date=day, completed=completed)
+                    logs.append({"date": day, "completed": completed})
+                    days[day] = days.get(day, False) or completed
+                self.habit_logs[habit.id] = logs
+            # Referencia por usuario: un registro por día (completado si algo lo está)
+            self.user_days[user.id] = [{"date": day, "completed": done} for day, done in days.items()]
+
+    def _reference(self, logs, today=None):
+        completed = [log["date"] for log in logs if log["completed"]]
+        if not completed:
+            return None
+        return {
+            "current": functional.calculate_current_streak(logs, today or max(completed)),
+            "longest": functional.calculate_streak(logs),
+        }
+
+    def test_matches_reduce_for_all_users_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = statistics.streaks("user")
+        for user_id, logs in self.user_days.items():
+            self.assertEqual(result.get(user_id), self._reference(logs))
+
+    def test_per_habit_and_single_user(self):
+        user_id = next(iter(self.user_days))
+        by_habit = statistics.streaks("habit", today=self.today)
+        for habit_id, logs in self.habit_logs.items():
+            self.assertEqual(by_habit.get(habit_id), self._reference(logs, self.today))
+        single = statistics.streaks("user", [user_id], today=self.today + timedelta(days=5))
+        self.assertEqual(single[user_id]["current"], 0)
+        self.assertEqual(single[user_id]["longest"], self._reference(self.user_days[user_id])["longest"])
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.controller = HabitController()
+        self.monday = date(2025, 3, 3)
+        self.users = []
+        for index, days in enumerate((1, 3, 2)):
+            user = get_user_model().objects.create_user(username=f"lider{index}")
+            habit = Habit.objects.create(user=user, name="Leer", points_value=10, difficulty=Habit.Difficulty.EASY)
+            for offset in range(days):
+                self.controller.complete_habit(user, habit.id, self.monday + timedelta(days=offset))
+            self.users.append(user)
+
+    def test_completion_increments_period_counters(self):
+        counters = PeriodPoints.objects.filter(user=self.users[1])
+        self.assertEqual(
+            set(counters.values_list("period", "start", "points")),
+            {("week", self.monday, 30), ("month", date(2025, 3, 1), 30)},
+        )
+
+    def test_live_top_then_snapshot_and_history(self):
+        with self.assertNumQueries(1):
+            board = leaderboards.top("week", self.monday, self.monday + timedelta(days=2), limit=2)
+        self.assertEqual((board["source"], board["ranking"]), ("live", [("lider1", 30), ("lider2", 20)]))
+
+        today = date(2025, 3, 12)
+
+        leaderboards.snapshot("week", self.monday, top_k=10)
+        with self.assertNumQueries(1):
+            board = leaderboards.top("week", self.monday, today, limit=2)
+        self.assertEqual((board["source"], board["ranking"]), ("snapshot", [("lider1", 30), ("lider2", 20)]))
+        # Un completado posterior no altera la ventana ya congelada
+        self.controller.complete_habit(self.users[0], self.users[0].habits.get().id, self.monday + timedelta(days=6))
+        self.assertEqual(leaderboards.top("week", self.monday, today)["ranking"][0], ("lider1", 30))
+
+        leaderboards.snapshot("week", today)
+        self.assertEqual(
+            leaderboards.rank_history(self.users[2].id, "week"),
+            [{"start": self.monday, "rank": 2, "points": 20}],
+        )
+
+    def test_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.get("/api/ranking/", {"period": "month", "date": "2025-03-10"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["ranking"][0], ("lider1", 30))
+        self.assertEqual(client.get("/api/ranking/", {"period": "year"}).status_code, 400)
+        for params, field in (({"date": "<b>x</b>"}, "date"), ({"limit": "9e9"}, "limit")):
+            response = client.get("/api/ranking/", {"period": "week", **params})
+            self.assertEqual(response.data, {"error": LEADERBOARD_PARAM_ERRORS[field]})
+        call_command("snapshot_leaderboards", "--date", "2025-03-04", stdout=StringIO())
+        history = client.get("/api/ranking/history/", {"period": "week"}).data["history"]
+        self.assertEqual(history, [{"start": self.monday, "rank": 3, "points": 10}])
+
+
+class GroupLeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.users = [User.objects.create_user(username=f"miembro{index}") for index in range(6)]
+        for index, user in enumerate(self.users):
+            UserProfile.objects.filter(user=user).update(total_points=index * 10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post("/api/groups/", {"name": "Equipo"})
+        self.group = Group.objects.get(pk=response.data["id"])
+        for user in self.users[1:4]:
+            GroupMembership.objects.create(group=self.group, user=user)
+        # Grupo solapado: sus miembros no cuentan en el primero
+        other = Group.objects.create(name="Otro", owner=self.users[5])
+        GroupMembership.objects.create(group=other, user=self.users[5])
+        GroupMembership.objects.create(group=other, user=self.users[3])
+
+    def test_ranking_within_group_with_caller_rank(self):
+        response = self.client.get(f"/api/groups/{self.group.id}/ranking/", {"limit": 2})
+        self.assertEqual(response.data["ranking"], [("miembro3", 30), ("miembro2", 20)])
+        self.assertEqual(response.data["me"], {"rank": 4, "points": 0})
+        groups = self.client.get("/api/groups/").data
+        self.assertEqual([(group["name"], group["member_count"]) for group in groups], [("Equipo", 4)])
+
+    def test_cache_is_invalidated_when_a_member_completes(self):
+        url = f"/api/groups/{self.group.id}/ranking/"
+        self.client.get(url)
+        version = Group.objects.get(pk=self.group.pk).ranking_version
+        with self.assertNumQueries(0):
+            leaderboards.group_leaderboard(self.group.id, self.users[3].id, "all", date.today(), version=version)
+        habit = Habit.objects.create(user=self.users[0], name="Subir", points_value=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            HabitController().complete_habit(self.users[0], habit.id, date.today())
+        self.assertEqual(Group.objects.get(pk=self.group.pk).ranking_version, version + 1)
+        # La entrada vieja sigue en la caché (como en la de otro worker) pero ya no se usa
+        self.assertIsNotNone(cache.get(leaderboards.group_cache_key(self.group.id, version)))
+        self.assertEqual(self.client.get(url).data["ranking"][0][0], "miembro0")
+
+    def test_join_and_membership_required(self):
+        outsider = APIClient()
+        outsider.force_authenticate(self.users[4])
+        self.assertEqual(outsider.get(f"/api/groups/{self.group.id}/ranking/").status_code, 404)
+        response = outsider.post("/api/groups/join/", {"invite_code": self.group.invite_code})
+        self.assertEqual(response.data["member_count"], 5)
+        ranking = outsider.get(f"/api/groups/{self.group.id}/ranking/").data
+        self.assertEqual(ranking["me"], {"rank": 1, "points": 40})
+
+
+class HabitStatusListTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="estado")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.controller = HabitController()
+        self.today = timezone.localdate()
+
+    def _habit(self, name, days_ago):
+        habit = Habit.objects.create(user=self.user, name=name)
+        for offset in days_ago:
+            self.controller.complete_habit(self.user, habit.id, self.today - timedelta(days=offset))
+        return habit
+
+    def test_constant_queries_and_values(self):
+        self._habit("Hoy", [2, 1, 0])
+        with self.assertNumQueries(1):
+            self.client.get("/api/habits/", {"expand": "status"})
+        self._habit("Ayer", [5, 1, 3, 2])
+        self._habit("Rota", [9, 8])
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/habits/", {"expand": "status"})
+        by_name = {habit["name"]: habit for habit in response.data}
+        self.assertEqual(
+            {name: (h["completed_today"], h["current_streak"], h["longest_streak"]) for name, h in by_name.items()},
+            {"Hoy": (True, 3, 3), "Ayer": (False, 3, 3), "Rota": (False, 0, 2)},
+        )
+        self.assertEqual(by_name["Rota"]["last_completed"], str(self.today - timedelta(days=8)))
+        self.assertNotIn("completed_today", self.client.get("/api/habits/").data[0])
+
+    def test_recompute_restores_habit_state(self):
+        habit = self._habit("Leer", [1, 0])
+        Habit.objects.filter(pk=habit.pk).update(current_streak=0, longest_streak=0, last_completed=None)
+        call_command("recompute_profiles", "--workers", "1", "--state-file", str(Path(tempfile.mkdtemp()) / "s.json"), stdout=StringIO())
+        habit.refresh_from_db()
+        self.assertEqual((habit.current_streak, habit.longest_streak, habit.last_completed), (2, 2, self.today))
+
+
+def _bucket_key(periodicity, interval_days, day):
+    """Referencia ingenua del periodo de un día (semana ISO por isocalendar)."""
+    if periodicity == "weekly":
+        return tuple(day.isocalendar())[:2]
+    if periodicity == "custom":
+        return (day - date(1970, 1, 1)).days // interval_days
+    return day
+
+
+def _brute_runs(flags):
+    """Longitudes de los tramos de True consecutivos."""
+    runs, length = [], 0
+    for flag in flags:
+        length = length + 1 if flag else 0
+        if flag:
+            runs.append(length)
+    return runs
+
+
+class PeriodicStreakTests(TestCase):
+    START = date(2025, 12, 1)
+
+    def _random_habit(self, rng):
+        periodicity = rng.choice(["daily", "weekly", "custom"])
+        interval = rng.randint(2, 10) if periodicity == "custom" else 1
+        days = {self.START + timedelta(days=rng.randrange(120)) for _ in range(rng.randint(0, 60))}
+        return periodicity, interval, sorted(days)
+
+    def _brute_habit(self, periodicity, interval, days):
+        """Recorre día a día la secuencia de periodos y cuenta tramos completados."""
+        if not days:
+            return 0, 0
+        done = {_bucket_key(periodicity, interval, day) for day in days}
+        sequence = []
+        for offset in range((days[-1] - days[0]).days + 1):
+            key = _bucket_key(periodicity, interval, days[0] + timedelta(days=offset))
+            if not sequence or sequence[-1] != key:
+                sequence.append(key)
+        runs = _brute_runs(key in done for key in sequence)
+        return runs[-1], max(runs)
+
+    def test_habit_engine_matches_brute_force(self):
+        rng = random.Random(42)
+        for _ in range(300):
+            periodicity, interval, days = self._random_habit(rng)
+            state = streaks.from_periods(streaks.period_index(periodicity, day, interval) for day in days)
+            self.assertEqual((state.current, state.longest), self._brute_habit(periodicity, interval, days))
+            # Incremental en orden = recálculo completo
+            incremental = streaks.StreakState()
+            for day in days:
+                incremental = incremental.advance(streaks.period_index(periodicity, day, interval))
+            self.assertEqual(incremental, state)
+
+    def test_user_streak_matches_brute_force(self):
+        rng = random.Random(7)
+        until = self.START + timedelta(days=100)
+        for _ in range(200):
+            habits = [self._random_habit(rng) for _ in range(rng.randint(1, 3))]
+            covered = [
+                any(
+                    _bucket_key(periodicity, interval, self.START + timedelta(days=offset))
+                    in {_bucket_key(periodicity, interval, day) for day in days if day <= until}
+                    for periodicity, interval, days in habits
+                )
+                for offset in range(-14, (until - self.START).days + 1)
+            ]
+            runs = _brute_runs(covered)
+            result = streaks.user_streak(
+                [
+                    (periodicity, interval, [streaks.period_index(periodicity, d, interval) for d in days if d <= until])
+                    for periodicity, interval, days in habits
+                ],
+                until,
+            )
+            # El último tramo es el que acaba en el último día cubierto
+            last = runs[-1] if runs else 0
+            self.assertEqual((result["current"], result["longest"]), (last, max(runs, default=0)))
+
+    def test_sql_coverage_streak_matches_engine(self):
+        rng = random.Random(11)
+        until = self.START + timedelta(days=100)
+        expected, user_ids = {}, []
+        for n in range(40):
+            user = get_user_model().objects.create_user(username=f"cobertura{n}")
+            user_ids.append(user.pk)
+            habits = [self._random_habit(rng) for _ in range(rng.randint(0, 3))]
+            for index, (periodicity, interval, days) in enumerate(habits):
+                habit = Habit.objects.create(user=user, name=f"h{index}", periodicity=periodicity, interval_days=interval)
+                HabitLog.objects.bulk_create(HabitLog(habit=habit, date=day, completed=True) for day in days)
+            periods = [
+                (periodicity, interval, [streaks.period_index(periodicity, d, interval) for d in days if d <= until])
+                for periodicity, interval, days in habits
+            ]
+            if any(indices for _, _, indices in periods):
+                expected[user.pk] = streaks.user_streak(periods, until)
+        # Sin completados hasta ``until`` no hay clave
+        self.assertEqual(statistics.coverage_streaks(user_ids, until), expected)
+
+    def test_database_and_incremental_state_match_engine(self):
+        rng = random.Random(3)
+        user = get_user_model().objects.create_user(username="periodos")
+        controller = HabitController()
+        expected = {}
+        for n in range(8):
+            periodicity, interval, days = self._random_habit(rng)
+            habit = Habit.objects.create(user=user, name=f"h{n}", periodicity=periodicity, interval_days=interval)
+            # Orden aleatorio: incluye completados atrasados que fuerzan el recálculo
+            for day in rng.sample(days, len(days)):
+                controller.complete_habit(user, habit.id, day)
+            expected[habit.id] = self._brute_habit(periodicity, interval, days)
+
+        in_sql = statistics.streaks("habit", [user.id])
+        for habit in Habit.objects.filter(user=user):
+            self.assertEqual((habit.current_streak, habit.longest_streak), expected[habit.id])
+            if expected[habit.id] != (0, 0):
+                self.assertEqual(
+                    (in_sql[habit.id]["current"], in_sql[habit.id]["longest"]), expected[habit.id]
+                )
+
+    def test_weekly_habit_keeps_streak_across_days(self):
+        user = get_user_model().objects.create_user(username="semanal")
+        habit = Habit.objects.create(user=user, name="Correr", periodicity="weekly")
+        controller = HabitController()
+        today = timezone.localdate()
+        monday = today - timedelta(days=today.weekday())
+        for weeks in (2, 1, 0):
+            controller.complete_habit(user, habit.id, monday - timedelta(weeks=weeks))
+        habit.refresh_from_db()
+        self.assertEqual((habit.current_streak, habit.streak_expires), (3, monday + timedelta(days=13)))
+        # Cada semana hecha cubre sus días: la racha del usuario no se corta entre lunes
+        streak = controller.get_streaks(user, today)
+        self.assertEqual(streak["current"], 15 + today.weekday())
+
+        client = APIClient()
+        client.force_authenticate(user)
+        client.patch(f"/api/habits/{habit.id}/", {"periodicity": "daily"}, format="json")
+        habit.refresh_from_db()
+        self.assertEqual((habit.current_streak, habit.longest_streak), (1, 1))
+
+
+class PointsLedgerTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="libro")
+        self.habit = Habit.objects.create(user=self.user, name="Leer", points_value=10)
+        self.controller = HabitController()
+        self.monday = date(2025, 3, 3)
+        for offset in (0, 1, 9):
+            self.controller.complete_habit(self.user, self.habit.id, self.monday + timedelta(days=offset))
+
+    def test_completions_append_entries_with_running_balance(self):
+        entries = list(PointsLedger.objects.filter(user=self.user).order_by("id"))
+        self.assertEqual([entry.reason for entry in entries], [PointsLedger.Reason.COMPLETION] * 3)
+        running = 0
+        for entry in entries:
+            running += entry.delta
+            self.assertEqual(entry.balance, running)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_points, running)
+        self.assertEqual(points.balance(self.user.id), running)
+        with self.assertRaises(ValueError):
+            entries[0].save()
+
+    def test_period_sums_and_window_rebuild(self):
+        week = points.period_sum(self.user.id, self.monday, self.monday + timedelta(days=6))
+        logs = HabitLog.objects.filter(habit=self.habit, date__lte=self.monday + timedelta(days=6))
+        self.assertEqual(week, sum(log.points_awarded for log in logs))
+        self.assertEqual(points.window_totals(self.monday, self.monday + timedelta(days=6)), {self.user.id: week})
+
+        PeriodPoints.objects.filter(user=self.user).update(points=0)
+        leaderboards.rebuild_window("week", self.monday)
+        self.assertEqual(PeriodPoints.objects.get(user=self.user, period="week", start=self.monday).points, week)
+
+    def test_reconcile_command_reports_and_repairs(self):
+        total = points.balance(self.user.id)
+        UserProfile.objects.filter(user=self.user).update(total_points=5)
+        # Un saldo roto solo puede aparecer saltándose el modelo
+        PointsLedger.objects.filter(pk=PointsLedger.objects.filter(user=self.user).latest("id").pk).update(balance=1)
+
+        out = StringIO()
+        call_command("reconcile_points", "--workers", "1", stdout=out)
+        self.assertIn(f"perfil=5 libro={total} saldo=1", out.getvalue())
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_points, 5)
+
+        call_command("reconcile_points", "--workers", "1", "--fix", stdout=StringIO())
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_points, total)
+        self.assertEqual(points.balance(self.user.id), total)
+        self.assertEqual(points.reconcile([self.user.id]), [])
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="cola")
+        self.habit = Habit.objects.create(user=self.user, name="Meditar")
+        self.controller = HabitController()
+        self.today = timezone.localdate()
+
+    @override_settings(COMPLETION_DERIVED_WORK="queue")
+    def test_completion_defers_derived_work_until_worker_runs(self):
+        result = self.controller.complete_habit(self.user, self.habit.id, self.today)
+        self.assertTrue(result["deferred"])
+        self.assertIsNone(result["streak"])
+        # Log y puntos ya son durables; racha y rankings esperan al worker
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_points, result["points_awarded"])
+        self.assertEqual((profile.current_streak, Habit.objects.get(pk=self.habit.pk).current_streak), (0, 0))
+        self.assertFalse(PeriodPoints.objects.filter(user=self.user).exists())
+
+        call_command("run_jobs", "--once", stdout=StringIO())
+        profile.refresh_from_db()
+        self.habit.refresh_from_db()
+        self.assertEqual((profile.current_streak, self.habit.current_streak), (1, 1))
+        self.assertEqual(profile.total_points, result["points_awarded"])
+        self.assertTrue(PeriodPoints.objects.filter(user=self.user, period="week").exists())
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+    @override_settings(COMPLETION_DERIVED_WORK="queue")
+    def test_derived_work_locks_the_profile(self):
+        other = Habit.objects.create(user=self.user, name="Leer")
+        for habit in (self.habit, other):
+            self.controller.complete_habit(self.user, habit.id, self.today)
+        locked, select_for_update = [], QuerySet.select_for_update
+
+        def spy(queryset, *args, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "select_for_update", spy):
+            call_command("run_jobs", "--once", stdout=StringIO())
+        self.assertEqual(locked.count(UserProfile), 2)
+        counts = UserProfile.objects.get(user=self.user).completion_counts["habits"]
+        self.assertEqual(counts, {str(self.habit.id): 1, str(other.id): 1})
+
+    def test_claimed_jobs_are_not_claimed_twice_and_failures_retry(self):
+        calls = []
+        jobs.HANDLERS["test.flaky"] = lambda payload: calls.append(payload) or 1 / 0
+        self.addCleanup(jobs.HANDLERS.pop, "test.flaky")
+        job = jobs.enqueue("test.flaky", {"n": 1})
+
+        claimed = jobs.claim(10, "a")
+        self.assertEqual([j.pk for j in claimed], [job.pk])
+        self.assertEqual(jobs.claim(10, "b"), [])
+        self.assertFalse(jobs.run(claimed[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("ZeroDivisionError", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(attempts=jobs.MAX_ATTEMPTS - 1, run_after=timezone.now())
+        self.assertEqual(jobs.run_batch(10, "a"), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(len(calls), 2)
+
+
+class LogPartitionTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="particiones")
+        self.habit = Habit.objects.create(user=self.user, name="Correr")
+        for day in (date(2023, 1, 10), date(2023, 1, 20), date(2023, 2, 5), date(2025, 3, 1)):
+            HabitLog.objects.create(habit=self.habit, date=day, completed=True, points_awarded=10)
+
+    def test_bounds_and_names(self):
+        self.assertEqual(partitions.bounds(date(2024, 12, 15), "month"), (date(2024, 12, 1), date(2025, 1, 1)))
+        self.assertEqual(partitions.bounds(date(2024, 6, 30), "year"), (date(2024, 1, 1), date(2025, 1, 1)))
+        self.assertEqual(partitions.partition_name(date(2024, 2, 1), "month"), "habits_habitlog_p2024_02")
+        self.assertEqual(partitions.partition_name(date(2024, 1, 1), "year"), "habits_habitlog_p2024")
+
+    def test_log_endpoint_filters_by_date_range(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get("/api/logs/", {"from": "2023-01-15", "to": "2023-02-28"})
+        self.assertEqual([log["date"] for log in response.data], ["2023-02-05", "2023-01-20"])
+        self.assertEqual(client.get("/api/logs/", {"from": "enero"}).status_code, 400)
+
+    def test_archived_months_survive_rollup_rebuild(self):
+        statistics.rollup_range(date(2023, 1, 1), date(2023, 3, 1))
+        LogArchive.objects.create(
+            partition="habits_habitlog_p2023_01", start=date(2023, 1, 1), end=date(2023, 3, 1), mode="file", location="x"
+        )
+        HabitLog.objects.filter(date__lt=date(2023, 3, 1)).delete()
+        statistics.rebuild_monthly_rollups(date(2025, 4, 1))
+        rollups = {r.month: r.completions for r in self.habit.monthly_rollups.all()}
+        self.assertEqual(rollups, {date(2023, 1, 1): 2, date(2023, 2, 1): 1, date(2025, 3, 1): 1})
+        data = statistics.habit_statistics(self.user, date(2025, 3, 20))
+        self.assertEqual((data["user"]["completions"], data["user"]["total_points"]), (4, 40))
+
+        with self.assertRaises(CommandError):
+            call_command("recompute_profiles", stdout=StringIO())
+
+
+    def test_archive_to_file_with_psycopg3_copy(self):
+        statements = []
+
+        class FakeCopy:
+            def __enter__(self):
+                return iter([b"id,date\n", memoryview(b"1,2023-01-10\n")])
+
+            def __exit__(self, *exc):
+                return False
+
+        class FakeCursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=None):
+                statements.append(sql)
+
+            def fetchone(self):
+                return (1,)
+
+            def copy(self, sql):
+                statements.append(sql)
+                return FakeCopy()
+
+        fake = SimpleNamespace(alias="default", cursor=FakeCursor)
+        partition = {"name": "habits_habitlog_p2023_01", "start": date(2023, 1, 1), "end": date(2023, 2, 1)}
+        directory = Path(tempfile.mkdtemp())
+        with mock.patch("django.db.backends.postgresql.psycopg_any.is_psycopg3", True):
+            result = partitions.archive_partition(fake, partition, "file", directory)
+        with gzip.open(result["location"], "rt") as archived:
+            self.assertEqual(archived.read(), "id,date\n1,2023-01-10\n")
+        self.assertIn("COPY habits_habitlog_p2023_01 TO STDOUT WITH (FORMAT csv, HEADER)", statements)
+        self.assertEqual(statements[-1], "DROP TABLE habits_habitlog_p2023_01")
+        self.assertEqual(LogArchive.objects.get().rows, 1)
+
+    def _partition_with(self, constraints, indexes):
+        statements = []
+        results = [constraints, [(index,) for index in indexes]]
+
+        class FakeCursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=None):
+                statements.append(sql)
+
+            def fetchall(self):
+                return results.pop(0)
+
+            def fetchone(self):
+                return (1,)
+
+        partitions.partition_table(SimpleNamespace(alias="default", cursor=FakeCursor), date(2025, 1, 1), date(2025, 1, 1))
+        return statements
+
+    def test_partition_table_keeps_checks_and_index_definitions(self):
+        partial = "CREATE INDEX habitlog_note_idx ON public.habits_habitlog USING gin (note) WHERE completed"
+        statements = self._partition_with(
+            [
+                ("habits_habitlog_pkey", "p", ["id"], "PRIMARY KEY (id)"),
+                ("habitlog_points_check", "c", ["points_awarded"], "CHECK ((points_awarded >= 0))"),
+                ("habitlog_id_not_null", "n", ["id"], "NOT NULL id"),
+            ],
+            [partial],
+        )
+        self.assertIn("ALTER TABLE habits_habitlog ADD CONSTRAINT habits_habitlog_pkey PRIMARY KEY (id, date)", statements)
+        self.assertIn("ALTER TABLE habits_habitlog ADD CONSTRAINT habitlog_points_check CHECK ((points_awarded >= 0))", statements)
+        self.assertIn(partial, statements)
+        self.assertFalse([sql for sql in statements if "habitlog_id_not_null" in sql])
+        # Los índices se recrean después de borrar la tabla antigua (mismos nombres)
+        self.assertLess(statements.index("DROP TABLE habits_habitlog_unpartitioned"), statements.index(partial))
+
+    def test_partition_table_refuses_unique_without_partition_key(self):
+        with self.assertRaises(ValueError):
+            self._partition_with([("habitlog_note_uniq", "u", ["note"], "UNIQUE (note)")], [])
+
+
+class AdminChangelistTests(TestCase):
+    URLS = (
+        "/admin/habits/habit/",
+        "/admin/habits/habitlog/",
+        "/admin/habits/userprofile/",
+        "/admin/habits/achievement/",
+        "/admin/habits/pointsledger/",
+    )
+
+    def setUp(self):
+        admin_user = get_user_model().objects.create_superuser(username="admin", password="x")
+        self.client.force_login(admin_user)
+        self.controller = HabitController()
+        self.day = date(2025, 3, 1)
+
+    def _add_users(self, count):
+        for _ in range(count):
+            user = get_user_model().objects.create_user(username=f"u{get_user_model().objects.count()}")
+            habit = Habit.objects.create(user=user, name="Leer")
+            for offset in range(3):
+                self.controller.complete_habit(user, habit.id, self.day + timedelta(days=offset))
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def _all_queries(self):
+        # En Postgres el listado sin filtros hace además la consulta de estimación
+        return {url: (self._queries(url), self._queries(f"{url}?q=u1")) for url in self.URLS}
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self._add_users(2)
+        small = self._all_queries()
+        self._add_users(8)
+        self.assertEqual(self._all_queries(), small)
+
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def _register(self, username, email):
+        return self.client.post(
+            "/api/auth/register/", {"username": username, "email": email, "password": "demo1234"}, format="json"
+        )
+
+    def test_register_uses_constraints_and_writes_profile_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._register("nuevo", "Nuevo@Example.com")
+        self.assertEqual(response.status_code, 201)
+        statements = [q["sql"].split()[0] for q in queries.captured_queries if "throttlebucket" not in q["sql"]]
+        # Usuario, perfil y token (aparte del cubo del limitador); sin SELECT de comprobación previa
+        self.assertEqual([s for s in statements if s in ("SELECT", "INSERT", "UPDATE")], ["INSERT"] * 3)
+        self.assertTrue(UserProfile.objects.filter(user__username="nuevo").exists())
+
+        self.assertEqual(self._register("nuevo", "otro@example.com").data["error"], "El usuario ya existe")
+        self.assertEqual(self._register("otro", "nuevo@EXAMPLE.com").data["error"], "El email ya está registrado")
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_conflict_field_comes_from_the_constraint(self):
+        self._register("myemail", "a@example.com")
+        self.assertEqual(self._register("myemail", "b@example.com").data["error"], "El usuario ya existe")
+        # Postgres: nombre de la restricción en diag, aunque el mensaje mencione "email"
+        for constraint, field in (("auth_user_username_key", "username"), (accounts.EMAIL_INDEX, "email")):
+            cause = Exception("duplicate key (username)=(myemail)")
+            cause.diag = SimpleNamespace(constraint_name=constraint)
+            exc = IntegrityError(*cause.args)
+            exc.__cause__ = cause
+            self.assertEqual(accounts._conflict_field(exc), field)
+
+    def test_bulk_provisioning(self):
+        admin = get_user_model().objects.create_superuser(username="admin", email="admin@example.com")
+        group = Group.objects.create(name="Acme", owner=admin)
+        self.client.force_authenticate(admin)
+        rows = [
+            {"username": "ana", "email": "ana@acme.com", "password": "secreto123"},
+            {"username": "luis", "email": "luis@acme.com"},
+            {"username": "ana", "email": "ana2@acme.com"},
+            {"username": "eva", "email": "ADMIN@example.com"},
+        ]
+        response = self.client.post("/api/auth/provision/", {"users": rows, "group": group.pk}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            [(row["username"], row["reason"]) for row in response.data["skipped"]],
+            [("ana", "repetido en la entrada"), ("eva", "ya existe")],
+        )
+        users = get_user_model().objects.filter(username__in=["ana", "luis"])
+        self.assertEqual(UserProfile.objects.filter(user__in=users).count(), 2)
+        self.assertEqual(GroupMembership.objects.filter(group=group).count(), 2)
+        self.assertTrue(users.get(username="ana").check_password("secreto123"))
+        self.assertFalse(users.get(username="luis").has_usable_password())
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as source:
+            source.write("username,email\nmarta,marta@acme.com\nluis,x@acme.com\n")
+        self.addCleanup(Path(source.name).unlink)
+        out = StringIO()
+        call_command("provision_users", source.name, "--group", str(group.pk), stdout=out)
+        self.assertIn("1 usuarios creados, 1 omitidos", out.getvalue())
+        self.assertEqual(GroupMembership.objects.filter(group=group).count(), 3)
+
+        self.client.force_authenticate(users.get(username="luis"))
+        self.assertEqual(self.client.post("/api/auth/provision/", {"users": rows}, format="json").status_code, 403)
+
+    def test_provisioning_without_new_users(self):
+        self.client.force_authenticate(get_user_model().objects.create_superuser(username="admin"))
+        rows = [{"username": 123, "email": "n@acme.com"}, {"username": "bad", "email": ["x"]}, {"username": "admin"}]
+        response = self.client.post("/api/auth/provision/", {"users": rows}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 0)
+        self.assertEqual(
+            [row["reason"] for row in response.data["skipped"]],
+            ["username, email y password deben ser texto"] * 2 + ["ya existe"],
+        )
+
+
+class HabitSearchTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="buscador")
+        self.other = User.objects.create_user(username="otro")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.described = Habit.objects.create(user=self.user, name="Respirar", description="Meditación guiada")
+        self.named = Habit.objects.create(user=self.user, name="Meditación matutina", description="10 minutos")
+        Habit.objects.create(user=self.other, name="Meditación nocturna")
+
+    def _search(self, **params):
+        response = self.client.get("/api/habits/search/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranked_prefix_search_scoped_to_user(self):
+        data = self._search(q="meditacion")
+        self.assertEqual([row["id"] for row in data["results"]], [self.named.id, self.described.id])
+        self.assertGreater(data["results"][0]["rank"], data["results"][1]["rank"])
+        self.assertEqual([row["id"] for row in self._search(q="meditación matu")["results"]], [self.named.id])
+
+        page = self._search(q="medit", limit=1)
+        self.assertTrue(page["has_more"])
+        self.assertFalse(self._search(q="medit", limit=1, offset=1)["has_more"])
+        for param in ("limit", "offset"):
+            response = self.client.get("/api/habits/search/", {"q": "medit", param: "x"})
+            self.assertEqual((response.status_code, list(response.data)), (400, [param]))
+
+        self.assertEqual(self.client.get("/api/habits/search/", {"q": "medit", "all": "1"}).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(len(self._search(q="medit", all="1")["results"]), 3)
+
+    def test_index_follows_writes(self):
+        self.named.name = "Yoga"
+        self.named.save()
+        self.described.delete()
+        self.assertEqual(self._search(q="meditación")["results"], [])
+        self.assertEqual([row["name"] for row in self._search(q="yoga")["results"]], ["Yoga"])
+        self.assertEqual(self.client.get("/api/habits/search/").status_code, 400)
@@ -1,12 +1,18 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import register
+from .views import provision, register
 from .viewsets import (
     AchievementViewSet,
+    BootstrapView,
+    GroupViewSet,
     HabitLogViewSet,
     HabitViewSet,
+    MetricsView,
+    RankHistoryView,
     RankingView,
+    StreakAtRiskView,
+    SyncView,
     UserProfileView,
 )
 
@@ -14,13 +20,22 @@ router = DefaultRouter()
 router.register(r'habits', HabitViewSet, basename='habit')
 router.register(r'logs', HabitLogViewSet, basename='habit-log')
 router.register(r'achievements', AchievementViewSet, basename='achievement')
+router.register(r'groups', GroupViewSet, basename='group')
 
 urlpatterns = [
     # Auth endpoints
     path('auth/register/', register, name='register'),
+    path('auth/provision/', provision, name='provision'),
     # Profile and ranking
     path('profile/', UserProfileView.as_view(), name='profile'),
+    path('bootstrap/', BootstrapView.as_view(), name='bootstrap'),
     path('ranking/', RankingView.as_view(), name='ranking'),
+    path('ranking/history/', RankHistoryView.as_view(), name='ranking-history'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    # Instrumentación
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Notificaciones
+    path('streaks/at-risk/', StreakAtRiskView.as_view(), name='streak-at-risk'),
     # Router endpoints
     path('', include(router.urls)),
 ]
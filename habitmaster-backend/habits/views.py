@@ -1,20 +1,23 @@
 """
 Views para autenticación y registro de usuarios
 """
-from django.contrib.auth import get_user_model
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from habits.models import UserProfile
+from controller import accounts
+from habitmaster_backend.throttling import RegisterIPThrottle
+from habits.models import Group
 
-User = get_user_model()
+# Filas por petición de aprovisionamiento; para más, el comando provision_users
+MAX_PROVISION_ROWS = 5000
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterIPThrottle])
 def register(request):
     """
     Registro de nuevo usuario.
@@ -38,45 +41,54 @@ def register(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Verificar si el usuario ya existe
-    if User.objects.filter(username=username).exists():
-        return Response(
-            {'error': 'El usuario ya existe'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    # Sin comprobaciones previas: los duplicados los rechazan las restricciones únicas
+    try:
+        user = accounts.register_user(username, email, password)
+    except accounts.RegistrationConflict as conflict:
+        message = 'El email ya está registrado' if conflict.field == 'email' else 'El usuario ya existe'
+        return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Generar tokens JWT
+    refresh = RefreshToken.for_user(user)
+
+    return Response({
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+        }
+    }, status=status.HTTP_201_CREATED)
+
 
-    if User.objects.filter(email=email).exists():
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def provision(request):
+    """
+    Alta masiva de usuarios (onboarding de organizaciones), solo administradores.
+    Body: {"users": [{"username", "email", "password"?}], "group": id opcional}.
+    Sin password, el usuario queda sin contraseña utilizable hasta recuperarla.
+    """
+    rows = request.data.get('users')
+    if not isinstance(rows, list) or not rows:
+        return Response({'error': 'users debe ser una lista no vacía'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(rows) > MAX_PROVISION_ROWS:
         return Response(
-            {'error': 'El email ya está registrado'},
+            {'error': f'Máximo {MAX_PROVISION_ROWS} usuarios por petición'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    if not all(isinstance(row, dict) for row in rows):
+        return Response({'error': 'Cada usuario debe ser un objeto'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Crear usuario
-    try:
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            password=password
-        )
-        # El signal debería crear el UserProfile automáticamente
-        # Pero lo creamos explícitamente por si acaso
-        UserProfile.objects.get_or_create(user=user)
+    group = None
+    if request.data.get('group') is not None:
+        group = Group.objects.filter(pk=request.data['group']).first()
+        if group is None:
+            return Response({'error': 'Grupo no encontrado'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Generar tokens JWT
-        refresh = RefreshToken.for_user(user)
-        
-        return Response({
-            'access': str(refresh.access_token),
-            'refresh': str(refresh),
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-            }
-        }, status=status.HTTP_201_CREATED)
-    
-    except Exception as e:
-        return Response(
-            {'error': f'Error al crear usuario: {str(e)}'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+    result = accounts.provision_users(rows, group=group)
+    return Response({
+        'created': len(result.created),
+        'skipped': [{'username': row.get('username'), 'reason': reason} for row, reason in result.skipped],
+    }, status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
@@ -1,47 +1,165 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Count
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from rest_framework import permissions, status, viewsets
+from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from controller.app_controller import HabitController
-from .models import Achievement, Habit, HabitLog, UserProfile
+from controller.app_controller import HabitController, annotate_habit_status, decode_sync_cursor
+from habitmaster_backend.db_router import use_replica
+from habitmaster_backend.instrumentation import database_pool_metrics
+from habitmaster_backend.throttling import CompleteGlobalThrottle, CompleteUserThrottle
+from processor import functional
+from .models import Achievement, Group, GroupMembership, Habit, HabitLog, Period, UserProfile
 from .serializers import (
     AchievementSerializer,
+    Fieldset,
+    GroupSerializer,
     HabitLogSerializer,
     HabitSerializer,
+    HabitStatusSerializer,
     UserProfileSerializer,
 )
 
 
 class IsOwner(permissions.BasePermission):
+    # Se comparan ids para no cargar el User de cada objeto
     def has_object_permission(self, request, view, obj):
         if isinstance(obj, Habit):
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         if isinstance(obj, HabitLog):
-            return obj.habit.user == request.user
+            return obj.habit.user_id == request.user.id
         if isinstance(obj, Achievement):
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         if isinstance(obj, UserProfile):
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         return False
 
 
-class HabitViewSet(viewsets.ModelViewSet):
+class SparseFieldsetViewMixin:
+    """Aplica ``?fields=``/``?expand=`` a la respuesta y a las columnas del SELECT."""
+
+    # Columnas que se cargan siempre (clave primaria, dueño para IsOwner)
+    required_columns = ("id",)
+
+    def get_fieldset(self) -> Fieldset:
+        if not hasattr(self, "_fieldset"):
+            self._fieldset = Fieldset.from_query_params(self.request.query_params)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fieldset"] = self.get_fieldset()
+        return context
+
+    def narrow_queryset(self, queryset):
+        """select_related/only() con exactamente las columnas que va a serializar."""
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        columns = set(self.required_columns)
+        related = []
+        for field in self.get_serializer().fields.values():
+            if field.source in queryset.query.annotations:
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                related.append(field.source)
+                columns.add(field.source)
+                columns.update(f"{field.source}__{child.source}" for child in field.fields.values())
+            else:
+                columns.add(field.source)
+        if related:
+            # select_related() sin argumentos seguiría todas las FK
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+
+class ReplicaReadMixin:
+    """Sirve list/retrieve desde una réplica de lectura cuando está configurada."""
+
+    def list(self, request, *args, **kwargs):
+        with use_replica(request.user):
+            return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        with use_replica(request.user):
+            return super().retrieve(request, *args, **kwargs)
+
+
+class HabitViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = HabitSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    required_columns = ("id", "user")
+
+    def wants_status(self) -> bool:
+        """``?expand=status``: estado de hoy y racha de cada hábito en la misma consulta."""
+        return self.request.method in permissions.SAFE_METHODS and "status" in self.get_fieldset().expand
+
+    def get_serializer_class(self):
+        return HabitStatusSerializer if self.wants_status() else HabitSerializer
 
     def get_queryset(self):
-        return Habit.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Habit.objects.filter(user=self.request.user).order_by('-created_at')
+        if self.wants_status():
+            queryset = annotate_habit_status(queryset, timezone.localdate())
+        return self.narrow_queryset(queryset)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-    @action(detail=True, methods=["post"])
+    def perform_update(self, serializer):
+        before = (serializer.instance.periodicity, serializer.instance.interval_days)
+        habit = serializer.save()
+        # La racha guardada está en periodos: si cambia el periodo hay que recontarla
+        if (habit.periodicity, habit.interval_days) != before:
+            HabitController().refresh_habit_streak(habit)
+
+    @action(detail=False, methods=["get"])
+    def stats(self, request):
+        """Estadísticas por hábito calculadas en SQL; ``?rollups=0`` ignora los rollups."""
+        use_rollups = request.query_params.get("rollups", "1") != "0"
+        data = HabitController().get_habit_statistics(request.user, use_rollups=use_rollups)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """``?q=`` en nombre y descripción, por relevancia; ``?limit=``/``?offset=``.
+
+        ``?all=1`` (solo staff) busca en los hábitos de todos los usuarios.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise serializers.ValidationError({"q": "Requerido"})
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+        except ValueError:
+            raise serializers.ValidationError({"limit": "Debe ser un entero"})
+        try:
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+        except ValueError:
+            raise serializers.ValidationError({"offset": "Debe ser un entero"})
+        all_users = request.query_params.get("all") == "1"
+        if all_users and not request.user.is_staff:
+            raise PermissionDenied("Solo el staff puede buscar en todos los usuarios")
+
+        habits, has_more = HabitController().search_habits(request.user, query, limit, offset, all_users)
+        results = self.get_serializer(habits, many=True).data
+        for habit, row in zip(habits, results):
+            row["rank"] = habit.search_rank
+        return Response(
+            {"results": results, "limit": limit, "offset": offset, "has_more": has_more},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=True, methods=["post"], throttle_classes=[CompleteUserThrottle, CompleteGlobalThrottle])
     def complete(self, request, pk=None):
         try:
             controller = HabitController()
-            result = controller.complete_habit(request.user, pk, timezone.localdate())
+            result = controller.complete_habit(request.user, pk)
             return Response(result, status=status.HTTP_200_OK)
         except Habit.DoesNotExist:
             return Response(
@@ -55,12 +173,22 @@ class HabitViewSet(viewsets.ModelViewSet):
             )
 
 
-class HabitLogViewSet(viewsets.ReadOnlyModelViewSet):
+class HabitLogViewSet(ReplicaReadMixin, SparseFieldsetViewMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = HabitLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    required_columns = ("id", "habit")
 
     def get_queryset(self):
-        return HabitLog.objects.filter(habit__user=self.request.user).order_by('-date')
+        """``?from=``/``?to=`` (YYYY-MM-DD) acotan por fecha: en Postgres solo se leen esas particiones."""
+        queryset = HabitLog.objects.filter(habit__user=self.request.user).order_by('-date')
+        for param, lookup in (("from", "date__gte"), ("to", "date__lte")):
+            value = self.request.query_params.get(param)
+            if value:
+                try:
+                    queryset = queryset.filter(**{lookup: date.fromisoformat(value)})
+                except ValueError:
+                    raise serializers.ValidationError({param: "Formato YYYY-MM-DD"})
+        return self.narrow_queryset(queryset)
 
 
 class UserProfileView(APIView):
@@ -73,8 +201,8 @@ class UserProfileView(APIView):
         try:
             profile = UserProfile.objects.get(user=request.user)
             controller = HabitController()
-            logs = controller._get_user_log_dicts(request.user)
-            streak = controller.get_dashboard_data(request.user).get('streak', 0)
+            with use_replica(request.user):
+                streak = controller.get_streaks(request.user)["current"]
             
             serializer = UserProfileSerializer(profile)
             data = serializer.data
@@ -94,27 +222,219 @@ class UserProfileView(APIView):
             return Response(data, status=status.HTTP_200_OK)
 
 
-class AchievementViewSet(viewsets.ReadOnlyModelViewSet):
+class AchievementViewSet(ReplicaReadMixin, SparseFieldsetViewMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = AchievementSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    required_columns = ("id", "user")
 
     def get_queryset(self):
-        return Achievement.objects.filter(user=self.request.user).order_by('-earned_on')
+        return self.narrow_queryset(Achievement.objects.filter(user=self.request.user).order_by('-earned_on'))
+
+
+# Mensajes fijos: el 400 no repite la entrada ni el texto de las excepciones de Python
+LEADERBOARD_PARAM_ERRORS = {
+    "period": f"period debe ser uno de {', '.join(Period.values)}",
+    "date": "date debe tener formato AAAA-MM-DD",
+    "limit": "limit debe ser un entero entre 1 y 500",
+}
+
+
+def _leaderboard_params(request):
+    """(period, día, límite) de la query; lanza ValueError con el mensaje del parámetro inválido."""
+    period = request.query_params.get("period", Period.ALL)
+    if period not in Period.values:
+        raise ValueError(LEADERBOARD_PARAM_ERRORS["period"])
+    day = request.query_params.get("date")
+    try:
+        day = date.fromisoformat(day) if day else None
+    except ValueError:
+        raise ValueError(LEADERBOARD_PARAM_ERRORS["date"]) from None
+    try:
+        limit = int(request.query_params.get("limit", 50))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= 500:
+        raise ValueError(LEADERBOARD_PARAM_ERRORS["limit"])
+    return period, day, limit
 
 
 class RankingView(APIView):
     """
     Vista para obtener el ranking global de usuarios.
+    Con ``?period=week|month|all`` (y opcionalmente ``?date=`` y ``?limit=``)
+    devuelve el top-N de esa ventana.
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
+        controller = HabitController()
+        if "period" in request.query_params:
+            try:
+                period, day, limit = _leaderboard_params(request)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(controller.get_leaderboard(request.user, period, day, limit), status=status.HTTP_200_OK)
         try:
-            controller = HabitController()
-            ranking_data = controller.build_ranking_context()
+            with use_replica(request.user):
+                ranking_data = controller.build_ranking_context()
             return Response(ranking_data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response(
                 {'error': str(e), 'ranking': []},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class RankHistoryView(APIView):
+    """
+    Posiciones del usuario en las ventanas ya fotografiadas (``?period=week|month|all``).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            period, _, limit = _leaderboard_params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        history = HabitController().get_rank_history(request.user, period, limit)
+        return Response({"period": period, "history": history}, status=status.HTTP_200_OK)
+
+
+class GroupViewSet(viewsets.ModelViewSet):
+    """
+    Grupos del usuario. Crear un grupo te une a él; otros se unen con su
+    ``invite_code``. Solo el dueño puede renombrarlo o borrarlo.
+    """
+    serializer_class = GroupSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return (
+            # Subconsulta: filtrar por el JOIN de memberships haría que Count contara solo 1
+            Group.objects.filter(pk__in=GroupMembership.objects.filter(user=self.request.user).values("group_id"))
+            .annotate(member_count=Count("memberships"))
+            .order_by("name")
+        )
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            group = serializer.save(owner=self.request.user)
+            GroupMembership.objects.create(group=group, user=self.request.user)
+
+    def perform_update(self, serializer):
+        if serializer.instance.owner_id != self.request.user.id:
+            raise PermissionDenied("Solo el dueño puede modificar el grupo")
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        if instance.owner_id != self.request.user.id:
+            raise PermissionDenied("Solo el dueño puede borrar el grupo")
+        instance.delete()
+
+    @action(detail=False, methods=["post"])
+    def join(self, request):
+        group = Group.objects.filter(invite_code=request.data.get("invite_code", "")).first()
+        if group is None:
+            return Response({'error': 'Código de invitación no válido'}, status=status.HTTP_404_NOT_FOUND)
+        GroupMembership.objects.get_or_create(group=group, user=request.user)
+        return Response(self.get_serializer(self.get_queryset().get(pk=group.pk)).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"])
+    def leave(self, request, pk=None):
+        group = self.get_object()
+        if group.owner_id == request.user.id:
+            return Response({'error': 'El dueño no puede abandonar su grupo'}, status=status.HTTP_400_BAD_REQUEST)
+        GroupMembership.objects.filter(group=group, user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["get"])
+    def ranking(self, request, pk=None):
+        """Top-N del grupo (``?period=week|month|all&limit=``) y la posición propia."""
+        group = self.get_object()
+        try:
+            period, _, limit = _leaderboard_params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = HabitController().get_group_leaderboard(request.user, group, period, limit)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """
+    Métricas internas (pool de conexiones) para administradores.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"database_pools": database_pool_metrics()}, status=status.HTTP_200_OK)
+
+
+class StreakAtRiskView(APIView):
+    """
+    Usuarios cuya racha se rompe si no completan algo hoy (NDJSON en streaming).
+    Pensado para el servicio de notificaciones.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        controller = HabitController()
+
+        def stream():
+            # El cursor se consume mientras se envía la respuesta
+            with use_replica(request.user):
+                yield from functional.to_ndjson_chunks(controller.iter_streak_at_risk())
+
+        return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
+
+class SyncView(APIView):
+    """
+    Sincronización incremental: cambios desde ``?cursor=`` (opaco) y un cursor nuevo.
+    Los logs devuelven ``habit`` como id; ``deleted`` lista los ids/códigos borrados.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    log_fieldset = Fieldset(fields={"id", "habit", "date", "completed", "points_awarded", "note"})
+
+    def get(self, request):
+        since = None
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            try:
+                since = decode_sync_cursor(cursor)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = HabitController().get_changes_since(request.user, since)
+        return Response({
+            "full": changes["full"],
+            "habits": HabitSerializer(changes["habits"], many=True).data,
+            "logs": HabitLogSerializer(changes["logs"], many=True, fieldset=self.log_fieldset).data,
+            "achievements": AchievementSerializer(changes["achievements"], many=True).data,
+            "deleted": changes["deleted"],
+            "cursor": changes["cursor"],
+        }, status=status.HTTP_200_OK)
+
+
+class BootstrapView(APIView):
+    """
+    Carga inicial del dashboard en una sola petición: perfil, racha, hábitos con
+    estado de hoy, logs de la semana, logros y posición en el ranking.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    log_fieldset = Fieldset(fields={"id", "habit", "date", "completed", "points_awarded", "note"})
+
+    def get(self, request):
+        data = HabitController().get_bootstrap_data(request.user)
+        profile = UserProfileSerializer(data["profile"]).data
+        profile.update(
+            streak=data["streak"],
+            username=request.user.username,
+            email=request.user.email,
+        )
+        return Response({
+            "profile": profile,
+            "habits": HabitStatusSerializer(data["habits"], many=True).data,
+            "week_logs": HabitLogSerializer(data["week_logs"], many=True, fieldset=self.log_fieldset).data,
+            "achievements": AchievementSerializer(data["achievements"], many=True).data,
+            "rank": data["rank"],
+        }, status=status.HTTP_200_OK)
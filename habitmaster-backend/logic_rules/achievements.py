@@ -0,0 +1,141 @@
+"""
+Motor de logros basado en datos.
+
+Las filas de ``AchievementRule`` se compilan en un plan agrupado por métrica
+(umbrales ordenados + bitmasks) que se cachea por proceso y solo se recompila
+cuando cambia la versión de reglas. La evaluación no consulta la base de datos:
+usa los valores del perfil y su ``achievement_mask``.
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+from django.core.cache import cache
+
+VERSION_KEY = "achievement-rules-version"
+# Aun sin caché compartida entre procesos, el plan se revalida cada PLAN_TTL segundos
+PLAN_TTL = 300
+# La versión compartida se consulta como mucho cada VERSION_CHECK_TTL segundos por
+# proceso: un cambio de reglas en otro worker tarda a lo sumo eso en verse aquí.
+VERSION_CHECK_TTL = 30
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    bit: int
+    code: str
+    name: str
+
+
+@dataclass
+class MetricPlan:
+    # Reglas "gte": umbrales ascendentes y máscara acumulada de bits hasta cada umbral
+    thresholds: List[int] = field(default_factory=list)
+    cumulative_masks: List[int] = field(default_factory=list)
+    # Reglas "eq": valor exacto -> máscara
+    exact: Dict[int, int] = field(default_factory=dict)
+
+    def mask_for(self, value: int) -> int:
+        mask = self.exact.get(value, 0)
+        index = bisect_right(self.thresholds, value)
+        if index:
+            mask |= self.cumulative_masks[index - 1]
+        return mask
+
+
+@dataclass
+class EvaluationPlan:
+    version: str
+    # (métrica, dificultad) -> plan; dificultad vacía salvo en difficulty_completions
+    metrics: Dict[Tuple[str, str], MetricPlan]
+    rules_by_bit: Dict[int, CompiledRule]
+
+    def codes(self, mask: int) -> List[str]:
+        return [rule.code for bit, rule in sorted(self.rules_by_bit.items()) if mask & (1 << bit)]
+
+
+def compile_plan(rules, version: str = "") -> EvaluationPlan:
+    """Compila reglas (objetos con code/name/metric/comparison/threshold/difficulty/bit)."""
+    grouped: Dict[Tuple[str, str], Tuple[List[Tuple[int, int]], Dict[int, int]]] = {}
+    rules_by_bit = {}
+    for rule in rules:
+        key = (rule.metric, rule.difficulty or "")
+        at_least, exact = grouped.setdefault(key, ([], {}))
+        if rule.comparison == "eq":
+            exact[rule.threshold] = exact.get(rule.threshold, 0) | (1 << rule.bit)
+        else:
+            at_least.append((rule.threshold, 1 << rule.bit))
+        rules_by_bit[rule.bit] = CompiledRule(rule.bit, rule.code, rule.name)
+
+    metrics = {}
+    for key, (at_least, exact) in grouped.items():
+        at_least.sort()
+        metrics[key] = MetricPlan(
+            thresholds=[threshold for threshold, _ in at_least],
+            cumulative_masks=list(accumulate((bit for _, bit in at_least), lambda a, b: a | b)),
+            exact=exact,
+        )
+    return EvaluationPlan(version=version, metrics=metrics, rules_by_bit=rules_by_bit)
+
+
+_plan: EvaluationPlan | None = None
+_plan_loaded_at = 0.0
+_version_checked_at = 0.0
+
+
+def invalidate_plan() -> None:
+    """Marca las reglas como modificadas para todos los procesos que compartan caché."""
+    global _plan
+    _plan = None
+    cache.set(VERSION_KEY, str(time.time_ns()), None)
+
+
+def get_plan() -> EvaluationPlan:
+    global _plan, _plan_loaded_at, _version_checked_at
+    now = time.monotonic()
+    if _plan is not None and now - _version_checked_at < VERSION_CHECK_TTL:
+        return _plan
+
+    version = cache.get(VERSION_KEY)
+    _version_checked_at = now
+    fresh = now - _plan_loaded_at < PLAN_TTL
+    if _plan is not None and version is not None and _plan.version == version and fresh:
+        return _plan
+
+    from habits.models import AchievementRule
+
+    if version is None:
+        version = str(time.time_ns())
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    _plan = compile_plan(AchievementRule.objects.filter(active=True), version)
+    _plan_loaded_at = now
+    return _plan
+
+
+def metric_values(profile, habit=None) -> Dict[Tuple[str, str], int]:
+    counts = profile.completion_counts or {}
+    values = {
+        ("streak", ""): profile.current_streak,
+        ("total_points", ""): profile.total_points,
+    }
+    for difficulty, count in counts.get("difficulty", {}).items():
+        values[("difficulty_completions", difficulty)] = count
+    if habit is not None:
+        values[("habit_completions", "")] = counts.get("habits", {}).get(str(habit.id), 0)
+    return values
+
+
+def evaluate(profile, habit=None, plan: EvaluationPlan | None = None) -> Tuple[int, int]:
+    """Devuelve (máscara satisfecha ahora, máscara de logros nuevos)."""
+    plan = plan or get_plan()
+    satisfied = 0
+    for key, value in metric_values(profile, habit).items():
+        metric_plan = plan.metrics.get(key)
+        if metric_plan is not None:
+            satisfied |= metric_plan.mask_for(value)
+    return satisfied, satisfied & ~profile.achievement_mask
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import json
 from datetime import date, timedelta
 from functools import reduce
-from typing import Iterable, List, Sequence
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence
 
 
 def calculate_points(habit, completed_date: date) -> int:
@@ -40,6 +42,49 @@ def calculate_streak(logs: Sequence[dict]) -> int:
     return best
 
 
+def calculate_current_streak(logs: Sequence[dict], today: date) -> int:
+    """Días seguidos completados que terminan hoy o ayer (0 si la racha está rota)."""
+    days = sorted({log["date"] for log in logs if log["completed"] and log["date"] <= today}, reverse=True)
+    if not days or days[0] < today - timedelta(days=1):
+        return 0
+
+    def reducer(state, day):
+        previous, length, open_run = state
+        if open_run and previous - day == timedelta(days=1):
+            return day, length + 1, True
+        return day, length, False
+
+    _, length, _ = reduce(reducer, days[1:], (days[0], 1, True))
+    return length
+
+
+def moving_average(logs: Iterable[dict], today: date, days: int) -> float:
+    """Completados por día en los últimos ``days`` días (incluido hoy)."""
+    start = today - timedelta(days=days - 1)
+    completed = sum(1 for log in logs if log["completed"] and start <= log["date"] <= today)
+    return round(completed / days, 3)
+
+
+def period_start(period: str, day: date) -> date:
+    """Inicio de la ventana que contiene ``day``: lunes (week), día 1 (month) o el propio día (all)."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    if period == "all":
+        return day
+    raise ValueError(f"Periodo desconocido: {period}")
+
+
+def period_end(period: str, start: date) -> date:
+    """Último día de la ventana semanal o mensual que empieza en ``start``."""
+    if period == "week":
+        return start + timedelta(days=6)
+    if period == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    raise ValueError(f"Periodo sin fin: {period}")
+
+
 def filter_logs_by_week(logs: Iterable[dict], reference: date | None = None) -> List[dict]:
     """Filtra logs para la semana actual usando filter."""
     reference = reference or date.today()
@@ -66,3 +111,12 @@ def generate_ranking(users: Iterable) -> List[tuple]:
         )
     )
 
+
+def to_ndjson_chunks(rows: Iterable[dict], chunk_size: int = 1000) -> Iterator[str]:
+    """Serializa filas como NDJSON agrupando ``chunk_size`` líneas por bloque."""
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, chunk_size))
+        if not batch:
+            return
+        yield "".join(json.dumps(row, default=str) + "\n" for row in batch)
@@ -0,0 +1,101 @@
+"""
+Motor de rachas por periodicidad.
+
+Cada hábito se evalúa en su propio periodo: un día (``daily``), una semana ISO de
+lunes a domingo (``weekly``) o una ventana de ``interval_days`` días contada desde
+1970-01-01 (``custom``). Los periodos se numeran con enteros consecutivos, así que
+una racha es un tramo de índices seguidos y se calcula en O(periodos).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import reduce
+from typing import Iterable, Optional, Sequence, Tuple
+
+EPOCH = date(1970, 1, 1)
+# 1970-01-01 fue jueves: desplazando 3 días las semanas empiezan en lunes
+WEEK_OFFSET = 3
+
+
+def period_index(periodicity: str, day: date, interval_days: int = 1) -> int:
+    days = (day - EPOCH).days
+    if periodicity == "weekly":
+        return (days + WEEK_OFFSET) // 7
+    if periodicity == "custom":
+        return days // max(1, interval_days)
+    return days
+
+
+def period_bounds(periodicity: str, index: int, interval_days: int = 1) -> Tuple[date, date]:
+    """Primer y último día del periodo ``index``."""
+    if periodicity == "weekly":
+        start = EPOCH + timedelta(days=index * 7 - WEEK_OFFSET)
+        return start, start + timedelta(days=6)
+    if periodicity == "custom":
+        length = max(1, interval_days)
+        start = EPOCH + timedelta(days=index * length)
+        return start, start + timedelta(days=length - 1)
+    day = EPOCH + timedelta(days=index)
+    return day, day
+
+
+@dataclass(frozen=True)
+class StreakState:
+    """Estado incremental de un hábito: racha actual y máxima en periodos."""
+
+    current: int = 0
+    longest: int = 0
+    last_period: Optional[int] = None
+
+    def advance(self, index: int) -> "StreakState":
+        """Registra un completado en el periodo ``index`` (no anterior al último)."""
+        if self.last_period is not None and index < self.last_period:
+            raise ValueError("Completado anterior al último periodo: recalcular con from_periods")
+        if index == self.last_period:
+            return self
+        current = self.current + 1 if self.last_period == index - 1 else 1
+        return StreakState(current, max(self.longest, current), index)
+
+    def active(self, today_index: int) -> int:
+        """Racha vigente: se mantiene si el último periodo es el actual o el anterior."""
+        if self.last_period is None or self.last_period < today_index - 1:
+            return 0
+        return self.current
+
+
+def from_periods(indices: Iterable[int]) -> StreakState:
+    return reduce(lambda state, index: state.advance(index), sorted(set(indices)), StreakState())
+
+
+def expires_on(periodicity: str, last_period: int, interval_days: int = 1) -> date:
+    """Último día en que la racha sigue viva sin un nuevo completado (fin del periodo siguiente)."""
+    return period_bounds(periodicity, last_period + 1, interval_days)[1]
+
+
+def user_streak(habits: Iterable[Tuple[str, int, Sequence[int]]], until: date) -> dict:
+    """Racha del usuario en días a partir de los periodos completados de sus hábitos.
+
+    Un día cuenta si algún hábito tiene completado el periodo que lo contiene (una
+    semana hecha cubre sus siete días). Los días posteriores a ``until`` no cuentan.
+    ``current`` es el último tramo cubierto y ``last_day`` su último día.
+    """
+    spans = sorted(
+        (start, min(end, until))
+        for periodicity, interval_days, indices in habits
+        for start, end in (period_bounds(periodicity, index, interval_days) for index in indices)
+        if start <= until
+    )
+
+    def merge(state, span):
+        run_start, run_end, longest = state
+        start, end = span
+        if run_end is not None and start <= run_end + timedelta(days=1):
+            run_end = max(run_end, end)
+        else:
+            run_start, run_end = start, end
+        return run_start, run_end, max(longest, (run_end - run_start).days + 1)
+
+    run_start, run_end, longest = reduce(merge, spans, (None, None, 0))
+    current = (run_end - run_start).days + 1 if run_end is not None else 0
+    return {"current": current, "longest": longest, "last_day": run_end}
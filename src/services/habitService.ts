@@ -8,11 +8,21 @@ export interface Habit {
   name: string;
   description: string;
   periodicity: 'daily' | 'weekly' | 'custom';
+  /** Días de cada periodo en los hábitos `custom` */
+  interval_days?: number;
   points_value: number;
   difficulty: 'easy' | 'medium' | 'hard';
   created_at: string;
 }
 
+/** Hábito con su estado de hoy y racha (`?expand=status`) */
+export interface HabitWithStatus extends Habit {
+  completed_today: boolean;
+  last_completed: string | null;
+  current_streak: number;
+  longest_streak: number;
+}
+
 export interface HabitCreate {
   name: string;
   description?: string;
@@ -30,6 +40,48 @@ export interface HabitLog {
   note?: string;
 }
 
+export interface SyncResponse {
+  full: boolean;
+  habits: Habit[];
+  logs: Array<Omit<HabitLog, 'habit'> & { habit: number }>;
+  achievements: Array<{ code: string; name: string; earned_on: string }>;
+  deleted: { habit: string[]; log: string[]; achievement: string[] };
+  cursor: string;
+}
+
+export interface HabitSearchResponse {
+  results: Array<Habit & { rank: number }>;
+  limit: number;
+  offset: number;
+  has_more: boolean;
+}
+
+export interface HabitStats {
+  habit_id: number;
+  name: string;
+  completions: number;
+  total_points: number;
+  completion_rate: number;
+  current_streak: number;
+  best_streak: number;
+  average_7d: number;
+  average_30d: number;
+  last_completed: string | null;
+}
+
+export interface StatsResponse {
+  user: {
+    habits: number;
+    completions: number;
+    total_points: number;
+    best_streak: number;
+    average_7d: number;
+    average_30d: number;
+    from_rollups: boolean;
+  };
+  habits: HabitStats[];
+}
+
 class HabitService {
   /**
    * Obtener todos los hábitos del usuario
@@ -63,6 +115,15 @@ class HabitService {
     return response.data;
   }
 
+  /**
+   * Hábitos con estado de hoy, último completado y racha en una sola petición
+   * (evita descargar /logs/ para cruzarlos en el cliente)
+   */
+  async getAllWithStatus(): Promise<HabitWithStatus[]> {
+    const response = await api.get<HabitWithStatus[]>('/habits/', { params: { expand: 'status' } });
+    return response.data;
+  }
+
   /**
    * Eliminar un hábito
    */
@@ -85,6 +146,35 @@ class HabitService {
     const response = await api.get<HabitLog[]>('/logs/');
     return response.data;
   }
+
+  /**
+   * Cambios desde el último cursor (sin cursor devuelve el estado completo).
+   * Al borrar un hábito, el cliente debe descartar también sus logs.
+   */
+  async sync(cursor?: string): Promise<SyncResponse> {
+    const response = await api.get<SyncResponse>('/sync/', {
+      params: cursor ? { cursor } : undefined,
+    });
+    return response.data;
+  }
+
+  /**
+   * Estadísticas por hábito calculadas en el servidor
+   */
+  async getStats(): Promise<StatsResponse> {
+    const response = await api.get<StatsResponse>('/habits/stats/');
+    return response.data;
+  }
+
+  /**
+   * Búsqueda por nombre y descripción (prefijos, ordenada por relevancia)
+   */
+  async search(q: string, offset = 0, limit = 20): Promise<HabitSearchResponse> {
+    const response = await api.get<HabitSearchResponse>('/habits/search/', {
+      params: { q, offset, limit },
+    });
+    return response.data;
+  }
 }
 
 export default new HabitService();
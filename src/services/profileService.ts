@@ -2,6 +2,7 @@
  * Servicio para gestionar perfil de usuario con el backend Django
  */
 import api from '../utils/api';
+import type { Habit, HabitLog } from './habitService';
 
 export interface UserProfile {
   username: string;
@@ -20,6 +21,14 @@ export interface Achievement {
   earned_on: string;
 }
 
+export interface BootstrapData {
+  profile: UserProfile;
+  habits: Array<Habit & { completed_today: boolean }>;
+  week_logs: Array<Omit<HabitLog, 'habit'> & { habit: number }>;
+  achievements: Achievement[];
+  rank: number;
+}
+
 class ProfileService {
   /**
    * Obtener perfil del usuario actual
@@ -36,6 +45,14 @@ class ProfileService {
     const response = await api.get<Achievement[]>('/achievements/');
     return response.data;
   }
+
+  /**
+   * Carga inicial en una sola petición (perfil, hábitos de hoy, semana, logros, ranking)
+   */
+  async getBootstrap(): Promise<BootstrapData> {
+    const response = await api.get<BootstrapData>('/bootstrap/');
+    return response.data;
+  }
 }
 
 export default new ProfileService();